@@ -0,0 +1,176 @@
+"""
+Admission control - shed low-priority traffic when requests start queueing
+
+Every request is put in a route class by blueprint (ADMISSION_ROUTE_CLASSES:
+catalog, cart, auth, checkout) and each class has a latency SLO. A request's
+delay is its time in the app plus, when a trusted proxy stamps arrivals
+(ADMISSION_REQUEST_START_HEADER, e.g. nginx
+``proxy_set_header X-Request-Start "t=${msec}";``), the time it queued before a
+worker picked it up.
+
+As in CoDel, each worker looks at the *smallest* delay/SLO ratio seen over an
+interval (ADMISSION_INTERVAL_MS), counting in-flight requests that are already
+past their SLO. A single slow request does not trip it; a standing queue does.
+After each overloaded interval one more class in ADMISSION_SHED_ORDER is shed,
+lowest priority first, and after each healthy interval one class is let back
+in. Shed requests get a fast 503 with Retry-After before any database work.
+Classes not in the shed order (checkout) and unclassified endpoints (/metrics,
+static files) are always admitted.
+"""
+
+import threading
+import time
+
+from flask import current_app, g, jsonify, request
+from prometheus_client import Counter, Gauge
+
+BUSY = 'The store is very busy right now, please try again in a moment'
+
+SHED = Counter(
+    'http_requests_shed_total', 'Requests rejected by admission control, by route class',
+    ['route_class'],
+)
+SHED_LEVEL = Gauge(
+    'admission_shed_level', 'Number of route classes currently being shed',
+    multiprocess_mode='max',
+)
+
+
+def parse_request_start(value):
+    """Epoch seconds from an X-Request-Start value in s, ms or us, with or without ``t=``"""
+    try:
+        stamp = float(value.strip().replace('t=', '', 1))
+    except (AttributeError, ValueError):
+        return None
+    if stamp > 1e14:
+        return stamp / 1e6
+    if stamp > 1e11:
+        return stamp / 1e3
+    return stamp
+
+
+class AdmissionController:
+    """Shedding state for one worker process (``app.extensions['admission_control']``)"""
+
+    def __init__(self, slo_seconds, shed_order, interval=0.5, min_samples=5):
+        self.slo = slo_seconds
+        self.shed_order = list(shed_order)
+        self.interval = interval
+        self.min_samples = min_samples
+        self.level = 0
+        self._in_flight = {}
+        self._window_start = None
+        self._window_min = float('inf')
+        self._window_samples = 0
+        self._next_token = 0
+        self._lock = threading.Lock()
+
+    def shed_classes(self):
+        return self.shed_order[:self.level]
+
+    def admit(self, route_class, queue_delay=0.0, now=None):
+        """A token for finish(), or None if the request should be shed"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._roll_window(now)
+            if route_class in self.shed_classes():
+                return None
+            # Already waited past its SLO while we are shedding: the client has
+            # most likely given up, so don't spend a worker on it
+            if self.level and route_class in self.shed_order and queue_delay > self.slo[route_class]:
+                return None
+            self._next_token += 1
+            self._in_flight[self._next_token] = (route_class, now - queue_delay)
+            return self._next_token
+
+    def finish(self, token, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            route_class, started = self._in_flight.pop(token)
+            self._observe((now - started) / self.slo[route_class])
+            self._roll_window(now)
+
+    def in_flight(self):
+        """Requests currently running in this worker, by route class"""
+        counts = dict.fromkeys(self.slo, 0)
+        with self._lock:
+            for route_class, _ in self._in_flight.values():
+                counts[route_class] += 1
+        return counts
+
+    def _observe(self, ratio):
+        self._window_min = min(self._window_min, ratio)
+        self._window_samples += 1
+
+    def _roll_window(self, now):
+        if self._window_start is None:
+            self._window_start = now
+        if now - self._window_start < self.interval:
+            return
+        # Requests still running past their SLO count as slow samples, so a
+        # stall with no completions is still detected
+        for route_class, started in self._in_flight.values():
+            ratio = (now - started) / self.slo[route_class]
+            if ratio > 1:
+                self._observe(ratio)
+        if self._window_samples >= self.min_samples and self._window_min > 1:
+            self.level = min(self.level + 1, len(self.shed_order))
+        elif self.level:
+            self.level -= 1
+        SHED_LEVEL.set(self.level)
+        self._window_start = now
+        self._window_min = float('inf')
+        self._window_samples = 0
+
+
+def init_app(app):
+    if not app.config.get('ADMISSION_CONTROL_ENABLED', True):
+        return
+
+    slo_ms = app.config.get('ADMISSION_SLO_MS', {})
+    controller = AdmissionController(
+        {route_class: ms / 1000 for route_class, ms in slo_ms.items()},
+        app.config.get('ADMISSION_SHED_ORDER', ()),
+        interval=app.config.get('ADMISSION_INTERVAL_MS', 500) / 1000,
+        min_samples=app.config.get('ADMISSION_MIN_SAMPLES', 5),
+    )
+    classes = app.config.get('ADMISSION_ROUTE_CLASSES', {})
+    unknown = set(classes.values()) - set(controller.slo)
+    if unknown:
+        raise ValueError(f'ADMISSION_SLO_MS has no target for route classes {sorted(unknown)}')
+    app.extensions['admission_control'] = controller
+    app.before_request(_admit)
+    app.teardown_request(_finish)
+
+
+def _queue_delay():
+    header = current_app.config.get('ADMISSION_REQUEST_START_HEADER')
+    if not header or header not in request.headers:
+        return 0.0
+    started = parse_request_start(request.headers[header])
+    if started is None:
+        return 0.0
+    # The proxy stamps wall-clock time; clamp clock skew between hosts
+    return min(max(time.time() - started, 0.0), 60.0)
+
+
+def _admit():
+    route_class = current_app.config.get('ADMISSION_ROUTE_CLASSES', {}).get(request.blueprint)
+    if route_class is None:
+        return None
+    controller = current_app.extensions['admission_control']
+    token = controller.admit(route_class, _queue_delay())
+    if token is not None:
+        g.admission_token = token
+        return None
+    SHED.labels(route_class).inc()
+    headers = {'Retry-After': str(current_app.config.get('ADMISSION_RETRY_AFTER', 2))}
+    if request.is_json:
+        return jsonify({'success': False, 'message': BUSY}), 503, headers
+    return BUSY, 503, headers
+
+
+def _finish(exc):
+    token = g.pop('admission_token', None)
+    if token is not None:
+        current_app.extensions['admission_control'].finish(token)
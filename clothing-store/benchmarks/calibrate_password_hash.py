@@ -0,0 +1,101 @@
+"""
+Password hash calibration - pick hash parameters for a target latency
+
+Times Werkzeug's password hashing on this machine for increasing work factors
+and recommends the strongest PASSWORD_HASH_METHOD whose median hash time stays
+within --target-ms. Run it on the production hardware; existing users are
+rehashed with the new parameters on their next login.
+
+For scrypt the CPU/memory cost n is doubled (r=8, p=1); memory per hash is
+about 128 * n * r bytes. For pbkdf2 the iteration count is scaled linearly from
+a measured probe and then verified.
+
+Usage:
+    python benchmarks/calibrate_password_hash.py
+    python benchmarks/calibrate_password_hash.py --algorithm pbkdf2 --target-ms 150 --json calibration.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.security import generate_password_hash
+
+SCRYPT_COSTS = [2 ** exponent for exponent in range(12, 19)]
+PBKDF2_PROBE_ITERATIONS = 100_000
+PBKDF2_STEP = 10_000
+
+
+def time_method(method, repeat):
+    """Median milliseconds to hash a typical password with ``method``"""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        generate_password_hash('correct horse battery staple', method)
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def calibrate_scrypt(target_ms, repeat):
+    measurements = []
+    for n in SCRYPT_COSTS:
+        method = f'scrypt:{n}:8:1'
+        measurements.append((method, time_method(method, repeat)))
+        if measurements[-1][1] > target_ms:
+            break
+    within = [method for method, ms in measurements if ms <= target_ms]
+    return (within[-1] if within else measurements[0][0]), measurements
+
+
+def calibrate_pbkdf2(target_ms, repeat):
+    probe = f'pbkdf2:sha256:{PBKDF2_PROBE_ITERATIONS}'
+    probe_ms = time_method(probe, repeat)
+    iterations = max(int(PBKDF2_PROBE_ITERATIONS * target_ms / probe_ms) // PBKDF2_STEP * PBKDF2_STEP, PBKDF2_STEP)
+    method = f'pbkdf2:sha256:{iterations}'
+    measurements = [(probe, probe_ms), (method, time_method(method, repeat))]
+    # Scaling is close to linear; step down if the check overshoots
+    while measurements[-1][1] > target_ms and iterations > PBKDF2_STEP:
+        iterations -= PBKDF2_STEP * max(1, iterations // (10 * PBKDF2_STEP))
+        method = f'pbkdf2:sha256:{iterations}'
+        measurements.append((method, time_method(method, repeat)))
+    return method, measurements
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Pick password hash parameters for a target latency')
+    parser.add_argument('--algorithm', choices=('scrypt', 'pbkdf2'), default='scrypt')
+    parser.add_argument('--target-ms', type=float, default=250.0, help='longest acceptable median hash time')
+    parser.add_argument('--repeat', type=int, default=5, help='hashes per measurement (median is used)')
+    parser.add_argument('--json', dest='json_path', help='write measurements and the recommendation to this file')
+    args = parser.parse_args(argv)
+
+    calibrate = calibrate_scrypt if args.algorithm == 'scrypt' else calibrate_pbkdf2
+    recommended, measurements = calibrate(args.target_ms, args.repeat)
+
+    print("=" * 70)
+    print(" " * 20 + "PASSWORD HASH CALIBRATION")
+    print("=" * 70)
+    for method, ms in measurements:
+        marker = '  <- recommended' if method == recommended else ''
+        print(f"{method:<40}{ms:>10.1f} ms{marker}")
+    print("=" * 70)
+    print(f"PASSWORD_HASH_METHOD={recommended}")
+
+    if args.json_path:
+        with open(args.json_path, 'w') as fh:
+            json.dump({
+                'algorithm': args.algorithm, 'target_ms': args.target_ms, 'recommended': recommended,
+                'cpu_count': os.cpu_count(), 'python': sys.version.split()[0],
+                'measurements': [{'method': method, 'median_ms': ms} for method, ms in measurements],
+            }, fh, indent=2)
+        print(f"Results written to {args.json_path}")
+    return recommended
+
+
+if __name__ == '__main__':
+    main()
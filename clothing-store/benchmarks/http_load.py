@@ -0,0 +1,359 @@
+"""
+End-to-end HTTP benchmark for every storefront route
+
+Starts the app under gunicorn on a private copy of a generated dataset (or
+targets an already running instance with --url) and drives each route at
+several concurrency levels. Every virtual user is a logged-in customer from the
+dataset with its own keep-alive connection and session cookie. Reports
+throughput and p50/p95/p99 latency per route and level, writes them as JSON and
+compares them against a saved baseline.
+
+Routes: home, category, product, search, my_orders, add_to_cart, checkout
+(each checkout first adds an item to the cart; only the checkout POST is timed).
+
+Usage:
+    python benchmarks/http_load.py --json http_load.json
+    python benchmarks/http_load.py --concurrency 1,8,32 --duration 10 --baseline http_load.json --threshold 15
+    python benchmarks/http_load.py --url http://127.0.0.1:5000 --scale 10
+
+With --url the server must be running on ensure_dataset(scale, seed) for the
+same scale and seed. A regression against the baseline exits with status 1.
+"""
+
+import argparse
+import bisect
+import http.client
+import itertools
+import json
+import os
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+import generate_dataset
+
+ROUTES = ('home', 'category', 'product', 'search', 'my_orders', 'add_to_cart', 'checkout')
+SEARCH_TERMS = ('Kurta', 'Saree', 'Cotton', 'Silk', 'Jeans', 'Chikankari', 'Frock', 'Hoodie', 'Linen', 'Bandhani')
+
+
+class Client:
+    """One keep-alive HTTP connection with its own cookie jar"""
+
+    def __init__(self, host, port, timeout=30):
+        self.host, self.port, self.timeout = host, port, timeout
+        self.cookies = {}
+        self.connection = None
+
+    def request(self, method, path, body=None, headers=None):
+        """Send a request; returns (status, seconds). Reconnects once if the server closed the connection"""
+        headers = dict(headers or {})
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{name}={value}' for name, value in self.cookies.items())
+        for attempt in (0, 1):
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            started = time.perf_counter()
+            try:
+                self.connection.request(method, path, body=body, headers=headers)
+                response = self.connection.getresponse()
+                response.read()
+            except (http.client.HTTPException, ConnectionError):
+                self.close()
+                if attempt:
+                    raise
+                continue
+            elapsed = time.perf_counter() - started
+            for header in response.headers.get_all('Set-Cookie') or ():
+                for name, morsel in SimpleCookie(header).items():
+                    self.cookies[name] = morsel.value
+            if response.getheader('Connection', '').lower() == 'close':
+                self.close()
+            return response.status, elapsed
+
+    def get(self, path):
+        return self.request('GET', path)
+
+    def post_form(self, path, data):
+        return self.request('POST', path, urlencode(data), {'Content-Type': 'application/x-www-form-urlencoded'})
+
+    def post_json(self, path, data):
+        return self.request('POST', path, json.dumps(data), {'Content-Type': 'application/json'})
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+class Workload:
+    """Ids and customers read from the dataset, used to build realistic requests"""
+
+    def __init__(self, dataset_path):
+        connection = sqlite3.connect(dataset_path)
+        try:
+            self.category_ids = [row[0] for row in connection.execute('SELECT id FROM category ORDER BY id')]
+            self.products = connection.execute('SELECT id, size FROM product ORDER BY id').fetchall()
+            self.emails = [row[0] for row in connection.execute('SELECT email FROM user ORDER BY id')]
+        finally:
+            connection.close()
+        # Browsing follows the same skew as purchases: a few products get most views
+        self.cum_weights = list(itertools.accumulate(
+            1.0 / (rank ** generate_dataset.PRODUCT_ZIPF_EXPONENT) for rank in range(1, len(self.products) + 1)
+        ))
+
+    def product(self, rng):
+        index = bisect.bisect(self.cum_weights, rng.random() * self.cum_weights[-1])
+        product_id, sizes = self.products[min(index, len(self.products) - 1)]
+        return product_id, rng.choice(sizes.split(', ')) if sizes else None
+
+    def step(self, route, client, rng):
+        """Issue one request for ``route``; returns (status, seconds) of the timed request"""
+        if route == 'home':
+            return client.get('/')
+        if route == 'category':
+            return client.get(f'/category/{rng.choice(self.category_ids)}')
+        if route == 'product':
+            return client.get(f'/product/{self.product(rng)[0]}')
+        if route == 'search':
+            return client.get('/search?' + urlencode({'q': rng.choice(SEARCH_TERMS)}))
+        if route == 'my_orders':
+            return client.get('/my_orders')
+        product_id, size = self.product(rng)
+        added = client.post_json('/add_to_cart', {'product_id': product_id, 'quantity': 1, 'size': size})
+        if route == 'add_to_cart':
+            return added
+        return client.post_form('/checkout', {'payment_method': 'UPI', 'shipping_address': 'Benchmark Street, Pune'})
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(int(len(sorted_values) * pct / 100 + 0.999999) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def run_level(workload, host, port, route, clients, duration, warmup, seed):
+    """Run ``route`` with one thread per client for ``duration`` seconds"""
+    latencies = [[] for _ in clients]
+    errors = [0] * len(clients)
+    deadline = {}
+    start_barrier = threading.Barrier(len(clients) + 1)
+
+    def worker(slot):
+        rng = random.Random(f'{seed}:{route}:{slot}')
+        client = clients[slot]
+        start_barrier.wait()
+        while time.perf_counter() < deadline['end']:
+            try:
+                status, elapsed = workload.step(route, client, rng)
+            except (OSError, http.client.HTTPException):
+                errors[slot] += 1
+                continue
+            if time.perf_counter() < deadline['measure_from']:
+                continue
+            if status >= 400:
+                errors[slot] += 1
+            else:
+                latencies[slot].append(elapsed)
+
+    threads = [threading.Thread(target=worker, args=(slot,)) for slot in range(len(clients))]
+    for thread in threads:
+        thread.start()
+    now = time.perf_counter()
+    deadline['measure_from'] = now + warmup
+    deadline['end'] = now + warmup + duration
+    start_barrier.wait()
+    for thread in threads:
+        thread.join()
+
+    values = sorted(value for slot in latencies for value in slot)
+    return {
+        'requests': len(values),
+        'errors': sum(errors),
+        'throughput_rps': len(values) / duration,
+        'p50_ms': percentile(values, 50) * 1000,
+        'p95_ms': percentile(values, 95) * 1000,
+        'p99_ms': percentile(values, 99) * 1000,
+        'max_ms': values[-1] * 1000 if values else 0.0,
+    }
+
+
+def login_clients(workload, host, port, count, first_user):
+    clients = []
+    for offset in range(count):
+        client = Client(host, port)
+        email = workload.emails[(first_user + offset) % len(workload.emails)]
+        status, _ = client.post_form('/login', {'email': email, 'password': generate_dataset.DEFAULT_PASSWORD})
+        if status != 302:
+            raise RuntimeError(f'login failed for {email} (HTTP {status}); is the server using the same dataset?')
+        clients.append(client)
+    return clients
+
+
+def start_server(dataset_path, workdir, port, workers, threads):
+    """Serve a private copy of the dataset with gunicorn; returns the process"""
+    database = os.path.join(workdir, 'bench.db')
+    shutil.copyfile(dataset_path, database)
+    metrics_dir = os.path.join(workdir, 'metrics')
+    os.makedirs(metrics_dir, exist_ok=True)
+    env = dict(
+        os.environ,
+        DATABASE_URL=f'sqlite:///{database}',
+        GUNICORN_BIND=f'127.0.0.1:{port}',
+        WEB_CONCURRENCY=str(workers),
+        GUNICORN_THREADS=str(threads),
+        GUNICORN_MAX_REQUESTS='0',
+        PROMETHEUS_MULTIPROC_DIR=metrics_dir,
+        SESSION_STORE_PATH=os.path.join(workdir, 'sessions.db'),
+        SECRET_KEY='http-load-benchmark',
+        RATE_LIMIT_ENABLED='0',  # every client shares 127.0.0.1
+        CART_SWEEP_INTERVAL='0',  # the dataset's carts predate the retention window
+    )
+    log = open(os.path.join(workdir, 'server.log'), 'w')
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py'],
+        cwd=PROJECT_DIR, env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+    log.close()
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with status {process.returncode}; see {os.path.join(workdir, 'server.log')}")
+        try:
+            if Client('127.0.0.1', port, timeout=2).get('/')[0] == 200:
+                return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError('gunicorn did not start within 30s')
+
+
+def compare(results, baseline, threshold):
+    """Rows of (route, level, metric, baseline, current, change %) and whether any regressed"""
+    rows = []
+    regressed = False
+    for route, levels in results.items():
+        for level, current in levels.items():
+            previous = baseline.get(route, {}).get(level)
+            if not previous:
+                continue
+            for metric, higher_is_worse in (('throughput_rps', False), ('p95_ms', True), ('p99_ms', True)):
+                before, after = previous[metric], current[metric]
+                change = (after - before) / before * 100 if before else 0.0
+                worse = change > threshold if higher_is_worse else -change > threshold
+                regressed = regressed or worse
+                rows.append((route, level, metric, before, after, change, worse))
+    return rows, regressed
+
+
+def _free_port():
+    import socket
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark every storefront route over HTTP')
+    parser.add_argument('--url', help='benchmark a running instance instead of starting gunicorn')
+    parser.add_argument('--scale', type=float, default=1, help='dataset scale (see generate_dataset.py)')
+    parser.add_argument('--seed', type=int, default=generate_dataset.DEFAULT_SEED)
+    parser.add_argument('--concurrency', default='1,4,16', help='comma-separated concurrent clients per level')
+    parser.add_argument('--duration', type=float, default=5.0, help='measured seconds per route and level')
+    parser.add_argument('--warmup', type=float, default=1.0, help='unmeasured seconds before each measurement')
+    parser.add_argument('--routes', default=','.join(ROUTES), help='comma-separated subset of routes')
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn worker processes')
+    parser.add_argument('--threads', type=int, default=2, help='gunicorn threads per worker')
+    parser.add_argument('--json', dest='json_path', help='write results to this JSON file')
+    parser.add_argument('--baseline', help='compare against results saved earlier with --json')
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help='percent change in throughput, p95 or p99 counted as a regression')
+    args = parser.parse_args(argv)
+
+    levels = [int(value) for value in args.concurrency.split(',')]
+    routes = [route for route in args.routes.split(',') if route]
+    unknown = set(routes) - set(ROUTES)
+    if unknown:
+        parser.error(f"unknown routes: {', '.join(sorted(unknown))}")
+
+    dataset_path = generate_dataset.ensure_dataset(args.scale, args.seed)
+    workload = Workload(dataset_path)
+    if sum(levels) > len(workload.emails):
+        parser.error(f'dataset has {len(workload.emails)} users; lower --concurrency or raise --scale')
+
+    workdir = tempfile.mkdtemp(prefix='http-load-')
+    server = None
+    results = {route: {} for route in routes}
+    try:
+        if args.url:
+            target = urlsplit(args.url)
+            host, port = target.hostname, target.port or 80
+        else:
+            host, port = '127.0.0.1', _free_port()
+            server = start_server(dataset_path, workdir, port, args.workers, args.threads)
+
+        first_user = 0
+        for level in levels:
+            # Fresh customers per level, so carts and order history don't carry over
+            clients = login_clients(workload, host, port, level, first_user)
+            first_user += level
+            for route in routes:
+                results[route][str(level)] = run_level(
+                    workload, host, port, route, clients, args.duration, args.warmup, args.seed,
+                )
+                print(f"  {route:<12} c={level:<4} {results[route][str(level)]['throughput_rps']:8.1f} req/s",
+                      file=sys.stderr)
+            for client in clients:
+                client.close()
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print("=" * 78)
+    print(" " * 26 + "HTTP LOAD BENCHMARK")
+    print("=" * 78)
+    print(f"{'route':<14}{'clients':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>10}")
+    for route, by_level in results.items():
+        for level, result in by_level.items():
+            print(f"{route:<14}{level:>8}{result['throughput_rps']:>10.1f}{result['p50_ms']:>10.2f}"
+                  f"{result['p95_ms']:>10.2f}{result['p99_ms']:>10.2f}{result['errors']:>10}")
+    print("=" * 78)
+
+    regressed = False
+    if args.baseline:
+        with open(args.baseline) as fh:
+            baseline = json.load(fh)['results']
+        rows, regressed = compare(results, baseline, args.threshold)
+        print(f"\nCompared with {args.baseline} (threshold {args.threshold:.0f}%)")
+        for route, level, metric, before, after, change, worse in rows:
+            if worse:
+                print(f"  REGRESSION {route} c={level} {metric}: {before:.2f} -> {after:.2f} ({change:+.1f}%)")
+        if not regressed:
+            print("  No regressions")
+
+    if args.json_path:
+        with open(args.json_path, 'w') as fh:
+            json.dump({
+                'scale': args.scale, 'seed': args.seed, 'duration': args.duration,
+                'workers': None if args.url else args.workers, 'threads': None if args.url else args.threads,
+                'python': sys.version.split()[0], 'results': results,
+            }, fh, indent=2)
+        print(f"Results written to {args.json_path}")
+    return results, regressed
+
+
+if __name__ == '__main__':
+    sys.exit(1 if main()[1] else 0)
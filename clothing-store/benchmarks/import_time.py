@@ -0,0 +1,110 @@
+"""
+Import-time benchmark for the Indian Clothing Store application
+
+Runs each scenario in a fresh interpreter with ``-X importtime`` and reports
+the median wall time plus the most expensive imports (up to --depth levels of nesting), so worker
+spawn and test start-up cost can be tracked between changes.
+
+Usage:
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --repeat 10 --top 15 --json import_time.json
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCENARIOS = {
+    'import app': 'import app',
+    'create_app()': 'from app import create_app; create_app()',
+    'from app import app': 'from app import app',
+}
+
+IMPORTTIME_LINE = re.compile(
+    r'^import time:\s+(?P<self>\d+) \|\s+(?P<cumulative>\d+) \| (?P<indent> *)(?P<name>\S+)$'
+)
+
+TIMER = (
+    'import time; _t = time.perf_counter()\n'
+    '{stmt}\n'
+    'print("WALL_US", int((time.perf_counter() - _t) * 1e6))\n'
+)
+
+
+def run_once(stmt, depth):
+    """Run one scenario in a clean interpreter, return (wall_us, {module: cumulative_us})"""
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', TIMER.format(stmt=stmt)],
+        cwd=PROJECT_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    wall_us = int(proc.stdout.split('WALL_US')[-1].strip())
+
+    modules = {}
+    for line in proc.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        # Nested imports are indented two spaces per level below their parent
+        level = len(match.group('indent')) // 2
+        if level <= depth:
+            modules[match.group('name')] = int(match.group('cumulative'))
+    return wall_us, modules
+
+
+def measure(stmt, repeat, depth):
+    walls = []
+    per_module = {}
+    for _ in range(repeat):
+        wall_us, modules = run_once(stmt, depth)
+        walls.append(wall_us)
+        for name, cumulative_us in modules.items():
+            per_module.setdefault(name, []).append(cumulative_us)
+    return {
+        'wall_ms': statistics.median(walls) / 1000,
+        'modules_ms': {
+            name: statistics.median(values) / 1000
+            for name, values in per_module.items()
+        },
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure import and app start-up time')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per scenario (median is reported)')
+    parser.add_argument('--top', type=int, default=10, help='number of top-level imports to list')
+    parser.add_argument('--depth', type=int, default=2, help='deepest import nesting level to report')
+    parser.add_argument('--json', dest='json_path', help='write results to this JSON file')
+    args = parser.parse_args(argv)
+
+    results = {}
+    for label, stmt in SCENARIOS.items():
+        results[label] = measure(stmt, args.repeat, args.depth)
+
+    print("=" * 70)
+    print(" " * 22 + "IMPORT TIME REPORT")
+    print("=" * 70)
+    for label, result in results.items():
+        print(f"\n{label:<25} {result['wall_ms']:>8.1f} ms (median of {args.repeat})")
+        slowest = sorted(result['modules_ms'].items(), key=lambda item: item[1], reverse=True)
+        for name, cumulative_ms in slowest[:args.top]:
+            print(f"    {name:<45} {cumulative_ms:>8.1f} ms")
+    print("=" * 70)
+
+    if args.json_path:
+        with open(args.json_path, 'w') as fh:
+            json.dump({'repeat': args.repeat, 'python': sys.version.split()[0], 'results': results}, fh, indent=2)
+        print(f"Results written to {args.json_path}")
+    return results
+
+
+if __name__ == '__main__':
+    main()
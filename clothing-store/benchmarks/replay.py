@@ -0,0 +1,250 @@
+"""
+Replay captured production traffic against a local instance
+
+Reads request logs written by traffic_capture.py and replays them with the
+original timing (--speed 1), compressed (--speed 10 = ten times faster) or as
+fast as possible (--speed 0). Each captured session runs in its own thread with
+its own cookies, so the requests of one session keep their order while sessions
+overlap as they did in production. Reports latency per route next to the
+latency that was captured.
+
+Redacted credentials are replaced so sessions can log in: the n-th session that
+logs in becomes the n-th customer of the generated dataset, registrations get
+unique throw-away emails. Product and category ids outside the dataset are
+wrapped into it.
+
+Usage:
+    python benchmarks/replay.py instance/capture/
+    python benchmarks/replay.py capture.1234.jsonl --speed 5 --json replay.json
+    python benchmarks/replay.py instance/capture/ --url http://127.0.0.1:5000 --scale 10
+"""
+
+import argparse
+import glob
+import http.client
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlencode, urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import generate_dataset
+from traffic_capture import REDACTED
+from http_load import Client, Workload, _free_port, percentile, start_server
+
+ID_SEGMENT = re.compile(r'/\d+(?=/|$)')
+WRAPPED_PATHS = re.compile(r'^/(product|category)/(\d+)$')
+
+
+def load_capture(paths):
+    """All captured entries from files or capture directories, in arrival order"""
+    files = []
+    for path in paths:
+        files.extend(sorted(glob.glob(os.path.join(path, 'capture.*.jsonl'))) if os.path.isdir(path) else [path])
+    entries = []
+    for path in files:
+        with open(path, encoding='utf-8') as fh:
+            entries.extend(json.loads(line) for line in fh if line.strip())
+    entries.sort(key=lambda entry: entry['ts'])
+    return entries
+
+
+def route_key(entry):
+    return f"{entry['method']} {ID_SEGMENT.sub('/<id>', entry['path'])}"
+
+
+def sessions_of(entries):
+    """Group entries by session, ordered by each session's first request"""
+    sessions = OrderedDict()
+    for entry in entries:
+        sessions.setdefault(entry['session'], []).append(entry)
+    return list(sessions.values())
+
+
+class Rewriter:
+    """Turns sanitized entries back into requests the dataset can serve"""
+
+    def __init__(self, workload):
+        self.workload = workload
+        self._logins = {}
+        self._lock = threading.Lock()
+
+    def _wrap(self, value, count):
+        return (int(value) - 1) % count + 1
+
+    def _customer(self, session):
+        with self._lock:
+            index = self._logins.setdefault(session, len(self._logins))
+        return self.workload.emails[index % len(self.workload.emails)]
+
+    def _fill(self, entry, key, value, serial):
+        if value != REDACTED:
+            return value
+        if key == 'password':
+            return generate_dataset.DEFAULT_PASSWORD
+        if key == 'email':
+            if entry['path'] == '/register':
+                return f"replay-{entry['session']}-{serial}@example.in"
+            return self._customer(entry['session'])
+        return f'Replay {key}'
+
+    def request(self, entry, serial):
+        """(method, target, body, headers) for one captured entry"""
+        path = entry['path']
+        match = WRAPPED_PATHS.match(path)
+        if match:
+            count = len(self.workload.products) if match.group(1) == 'product' else len(self.workload.category_ids)
+            path = f'/{match.group(1)}/{self._wrap(match.group(2), count)}'
+        target = path + (f"?{entry['query']}" if entry.get('query') else '')
+
+        if 'form' in entry:
+            body = urlencode([(key, self._fill(entry, key, value, serial)) for key, value in entry['form']])
+            return entry['method'], target, body, {'Content-Type': 'application/x-www-form-urlencoded'}
+        if 'json' in entry:
+            data = entry['json']
+            if isinstance(data, dict):
+                data = {key: self._fill(entry, key, value, serial) for key, value in data.items()}
+                if str(data.get('product_id', '')).isdigit():
+                    data['product_id'] = self._wrap(data['product_id'], len(self.workload.products))
+            return entry['method'], target, json.dumps(data), {'Content-Type': 'application/json'}
+        return entry['method'], target, None, {}
+
+
+def replay(sessions, rewriter, host, port, speed):
+    """Replay every session; returns (samples, lags, seconds), samples being (route, status, seconds, captured_ms)"""
+    samples, lags = [], []
+    record = threading.Lock()
+    t0 = sessions[0][0]['ts'] if sessions else 0.0
+    started = time.perf_counter()
+
+    def due(entry):
+        return started + (entry['ts'] - t0) / speed if speed else started
+
+    def run(session):
+        client = Client(host, port)
+        try:
+            for serial, entry in enumerate(session):
+                wait = due(entry) - time.perf_counter()
+                if wait > 0:
+                    time.sleep(wait)
+                lag = max(time.perf_counter() - due(entry), 0.0) if speed else 0.0
+                method, target, body, headers = rewriter.request(entry, serial)
+                try:
+                    status, elapsed = client.request(method, target, body, headers)
+                except (OSError, http.client.HTTPException):
+                    status, elapsed = None, 0.0
+                with record:
+                    samples.append((route_key(entry), status, elapsed, entry.get('duration_ms')))
+                    lags.append(lag)
+        finally:
+            client.close()
+
+    threads = []
+    for session in sessions:
+        wait = due(session[0]) - time.perf_counter()
+        if wait > 0:
+            time.sleep(wait)
+        thread = threading.Thread(target=run, args=(session,), daemon=True)
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+    return samples, lags, time.perf_counter() - started
+
+
+def summarize(samples):
+    by_route = {}
+    for route, status, seconds, captured_ms in samples:
+        stats = by_route.setdefault(route, {'latencies': [], 'captured': [], 'errors': 0})
+        if status is None or status >= 400:
+            stats['errors'] += 1
+        else:
+            stats['latencies'].append(seconds * 1000)
+        if captured_ms is not None:
+            stats['captured'].append(captured_ms)
+
+    report = {}
+    for route, stats in sorted(by_route.items()):
+        latencies, captured = sorted(stats['latencies']), sorted(stats['captured'])
+        report[route] = {
+            'requests': len(latencies) + stats['errors'],
+            'errors': stats['errors'],
+            'p50_ms': percentile(latencies, 50),
+            'p95_ms': percentile(latencies, 95),
+            'p99_ms': percentile(latencies, 99),
+            'max_ms': latencies[-1] if latencies else 0.0,
+            'captured_p50_ms': percentile(captured, 50),
+            'captured_p95_ms': percentile(captured, 95),
+        }
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay captured traffic against a local instance')
+    parser.add_argument('paths', nargs='+', help='capture files or directories of capture.*.jsonl files')
+    parser.add_argument('--speed', type=float, default=1.0, help='time compression (1 = real time, 0 = no waiting)')
+    parser.add_argument('--url', help='replay against a running instance instead of starting gunicorn')
+    parser.add_argument('--scale', type=float, default=1, help='dataset scale (see generate_dataset.py)')
+    parser.add_argument('--seed', type=int, default=generate_dataset.DEFAULT_SEED)
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn worker processes')
+    parser.add_argument('--threads', type=int, default=2, help='gunicorn threads per worker')
+    parser.add_argument('--json', dest='json_path', help='write the per-route report to this JSON file')
+    args = parser.parse_args(argv)
+
+    entries = load_capture(args.paths)
+    if not entries:
+        parser.error('no captured requests found')
+    sessions = sessions_of(entries)
+    dataset_path = generate_dataset.ensure_dataset(args.scale, args.seed)
+    rewriter = Rewriter(Workload(dataset_path))
+
+    workdir = tempfile.mkdtemp(prefix='replay-')
+    server = None
+    try:
+        if args.url:
+            target = urlsplit(args.url)
+            host, port = target.hostname, target.port or 80
+        else:
+            host, port = '127.0.0.1', _free_port()
+            server = start_server(dataset_path, workdir, port, args.workers, args.threads)
+        samples, lags, seconds = replay(sessions, rewriter, host, port, args.speed)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = summarize(samples)
+    captured_span = entries[-1]['ts'] - entries[0]['ts']
+    lags.sort()
+
+    print("=" * 88)
+    print(" " * 34 + "TRAFFIC REPLAY")
+    print("=" * 88)
+    print(f"{len(entries)} requests in {len(sessions)} sessions; captured over {captured_span:.1f}s, "
+          f"replayed in {seconds:.1f}s (speed {args.speed:g}); schedule lag p99 {percentile(lags, 99) * 1000:.1f} ms")
+    print(f"\n{'route':<32}{'count':>7}{'errors':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'captured p95':>14}")
+    for route, result in report.items():
+        print(f"{route:<32}{result['requests']:>7}{result['errors']:>7}{result['p50_ms']:>9.2f}"
+              f"{result['p95_ms']:>9.2f}{result['p99_ms']:>9.2f}{result['captured_p95_ms']:>14.2f}")
+    print("=" * 88)
+
+    if args.json_path:
+        with open(args.json_path, 'w') as fh:
+            json.dump({
+                'speed': args.speed, 'requests': len(entries), 'sessions': len(sessions),
+                'seconds': seconds, 'lag_p99_ms': percentile(lags, 99) * 1000, 'routes': report,
+            }, fh, indent=2)
+        print(f"Results written to {args.json_path}")
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+Shard write benchmark - add-to-cart commits/s with carts split over N files
+
+For each shard count, writer processes add items to the carts of many users
+(one transaction per add, as /add_to_cart does) for a fixed time against a
+fresh database, and the total commits per second are reported. With one
+shard (SHARD_COUNT=0) every writer queues on the same SQLite write lock;
+with N shards writers for users on different shards commit in parallel.
+
+Usage:
+    python benchmarks/shard_writes.py
+    python benchmarks/shard_writes.py --shards 0 2 4 8 --writers 8 --seconds 5 --json shard_writes.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from models import db, User, Category, Product
+
+USERS = 1000
+
+
+def config_for(directory, shard_count):
+    return {
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(directory, 'store.db')}",
+        'SESSION_STORE_PATH': ':memory:',
+        'SQL_STATS_ENABLED': False,
+        'CART_SWEEP_INTERVAL': 0,
+        'SHARD_COUNT': shard_count,
+        'SHARD_DIR': os.path.join(directory, 'shards'),
+    }
+
+
+def seed(config):
+    app = create_app(config)
+    with app.app_context():
+        db.create_all()
+        db.session.add(Category(id=1, name='Bench', age_group='All'))
+        db.session.add_all([Product(id=i, name=f'Product {i}', price=100 + i, category_id=1) for i in range(1, 51)])
+        db.session.add_all([User(id=i, name=f'User {i}', email=f'user{i}@example.com', password='x')
+                            for i in range(1, USERS + 1)])
+        db.session.commit()
+        db.engine.dispose()
+
+
+def writer(config, worker, seconds, results):
+    import cart_store
+    import shards
+
+    app = create_app(config)
+    commits, user_id = 0, worker
+    deadline = time.perf_counter() + seconds
+    with app.app_context():
+        while time.perf_counter() < deadline:
+            user_id = user_id % USERS + 1
+            db_session = shards.user_session(user_id)
+            cart_store.add_item(db_session, user_id, commits % 50 + 1, 1, 'M')
+            db_session.commit()
+            commits += 1
+    results.put(commits)
+
+
+def run(shard_count, writers, seconds):
+    directory = tempfile.mkdtemp()
+    try:
+        config = config_for(directory, shard_count)
+        seed(config)
+        context = multiprocessing.get_context('spawn')
+        results = context.Queue()
+        processes = [context.Process(target=writer, args=(config, worker, seconds, results))
+                     for worker in range(writers)]
+        for process in processes:
+            process.start()
+        commits = sum(results.get() for _ in processes)
+        for process in processes:
+            process.join()
+        return {'shards': shard_count or 1, 'writers': writers, 'commits': commits,
+                'commits_per_second': round(commits / seconds, 1)}
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare add-to-cart commit rates across shard counts')
+    parser.add_argument('--shards', type=int, nargs='+', default=[0, 2, 4], help='SHARD_COUNT values (0: unsharded)')
+    parser.add_argument('--writers', type=int, default=4, help='writer processes')
+    parser.add_argument('--seconds', type=float, default=3.0, help='duration of each run')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    results = [run(count, args.writers, args.seconds) for count in args.shards]
+    print(f"{'shards':>6}  {'writers':>7}  {'commits/s':>10}")
+    for result in results:
+        print(f"{result['shards']:>6}  {result['writers']:>7}  {result['commits_per_second']:>10.1f}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+"""
+SQLite profile benchmark - default PRAGMAs vs the tuned profile in config.py
+
+Two workloads are run against a fresh database file for each profile:
+
+* write throughput: single-row cart upserts, one commit each (add-to-cart)
+* read concurrency: reader threads run catalog queries while a writer
+  commits checkouts in a loop; reports reads/s and the worst read latency
+
+Usage:
+    python benchmarks/sqlite_profile.py
+    python benchmarks/sqlite_profile.py --writes 2000 --readers 8 --seconds 5 --json sqlite_profile.json
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+
+import cart_store
+from app import create_app
+from models import db, User, Category, Product
+
+PROFILES = {
+    'default': {},
+    'tuned': None,  # None keeps Config.SQLITE_PRAGMAS
+}
+
+CATALOG_QUERY = text(
+    "SELECT id, name, price FROM product WHERE category_id = :category_id ORDER BY id LIMIT 40"
+)
+
+
+def build_app(path, pragmas):
+    config = {'SQLALCHEMY_DATABASE_URI': f"sqlite:///{path}"}
+    if pragmas is not None:
+        config['SQLITE_PRAGMAS'] = pragmas
+    return create_app(config)
+
+
+def seed(app, products):
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(name='Bench', email='bench@example.com', password='x'))
+        categories = [Category(name=f'Category {i}', age_group='All') for i in range(8)]
+        db.session.add_all(categories)
+        db.session.flush()
+        db.session.add_all([
+            Product(name=f'Product {i}', price=100 + i, category_id=categories[i % 8].id, stock=100)
+            for i in range(products)
+        ])
+        db.session.commit()
+
+
+def bench_writes(app, writes):
+    with app.app_context():
+        engine = db.engine
+        # The same upsert as /add_to_cart; lines repeat after 100 products
+        # and add to their quantity instead of hitting the unique index
+        add = cart_store.add_statement(engine.dialect.name, returning=False)
+        start = time.perf_counter()
+        for i in range(writes):
+            with engine.begin() as conn:
+                conn.execute(add, {'user_id': 1, 'product_id': i % 100 + 1, 'quantity': 1, 'size': 'M'})
+        elapsed = time.perf_counter() - start
+    return {'writes': writes, 'seconds': elapsed, 'writes_per_sec': writes / elapsed}
+
+
+def bench_read_concurrency(app, readers, seconds):
+    with app.app_context():
+        engine = db.engine
+    stop = threading.Event()
+    latencies = [[] for _ in range(readers)]
+    write_count = [0]
+
+    def reader(slot):
+        with engine.connect() as conn:
+            i = 0
+            while not stop.is_set():
+                started = time.perf_counter()
+                conn.execute(CATALOG_QUERY, {'category_id': i % 8 + 1}).fetchall()
+                conn.rollback()
+                latencies[slot].append(time.perf_counter() - started)
+                i += 1
+
+    def writer():
+        while not stop.is_set():
+            with engine.begin() as conn:
+                conn.execute(text("UPDATE product SET stock = stock - 1 WHERE id = :id"), {'id': write_count[0] % 100 + 1})
+                conn.execute(text("INSERT INTO \"order\" (user_id, total_amount) VALUES (1, 100)"))
+            write_count[0] += 1
+
+    threads = [threading.Thread(target=reader, args=(slot,)) for slot in range(readers)]
+    threads.append(threading.Thread(target=writer))
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    all_latencies = sorted(value for slot in latencies for value in slot)
+    return {
+        'readers': readers,
+        'reads_per_sec': len(all_latencies) / seconds,
+        'writes_per_sec': write_count[0] / seconds,
+        'read_p50_ms': statistics.median(all_latencies) * 1000,
+        'read_p99_ms': all_latencies[int(len(all_latencies) * 0.99) - 1] * 1000,
+        'read_max_ms': all_latencies[-1] * 1000,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare default and tuned SQLite PRAGMAs')
+    parser.add_argument('--products', type=int, default=2000)
+    parser.add_argument('--writes', type=int, default=1000, help='single-row commits for the write test')
+    parser.add_argument('--readers', type=int, default=4, help='reader threads for the concurrency test')
+    parser.add_argument('--seconds', type=float, default=3.0, help='duration of the concurrency test')
+    parser.add_argument('--json', dest='json_path', help='write results to this JSON file')
+    args = parser.parse_args(argv)
+
+    results = {}
+    workdir = tempfile.mkdtemp(prefix='sqlite-bench-')
+    try:
+        for name, pragmas in PROFILES.items():
+            app = build_app(os.path.join(workdir, f'{name}.db'), pragmas)
+            seed(app, args.products)
+            results[name] = {
+                'write': bench_writes(app, args.writes),
+                'read_concurrency': bench_read_concurrency(app, args.readers, args.seconds),
+            }
+            with app.app_context():
+                db.engine.dispose()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print("=" * 70)
+    print(" " * 20 + "SQLITE PROFILE BENCHMARK")
+    print("=" * 70)
+    print(f"{'':<28}{'default':>18}{'tuned':>18}")
+    rows = [
+        ('commits/s (write test)', 'write', 'writes_per_sec', '{:.0f}'),
+        ('reads/s (concurrent)', 'read_concurrency', 'reads_per_sec', '{:.0f}'),
+        ('writes/s (concurrent)', 'read_concurrency', 'writes_per_sec', '{:.0f}'),
+        ('read p50 ms', 'read_concurrency', 'read_p50_ms', '{:.2f}'),
+        ('read p99 ms', 'read_concurrency', 'read_p99_ms', '{:.2f}'),
+        ('read max ms', 'read_concurrency', 'read_max_ms', '{:.2f}'),
+    ]
+    for label, group, key, fmt in rows:
+        values = [fmt.format(results[name][group][key]) for name in PROFILES]
+        print(f"{label:<28}{values[0]:>18}{values[1]:>18}")
+    print("=" * 70)
+
+    if args.json_path:
+        with open(args.json_path, 'w') as fh:
+            json.dump(results, fh, indent=2)
+        print(f"Results written to {args.json_path}")
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,12 @@
+"""
+Route blueprints for the Indian Clothing Store
+Modules are listed by dotted path and only imported when create_app() registers them
+"""
+
+BLUEPRINTS = (
+    'blueprints.catalog',
+    'blueprints.cart',
+    'blueprints.checkout',
+    'blueprints.auth',
+    'blueprints.orders',
+)
@@ -0,0 +1,80 @@
+"""
+Authentication routes - register, login and logout
+"""
+
+from flask import Blueprint, render_template, request, session, redirect, url_for
+from models import db, User
+from password_hashing import HashingBusy, hash_password, needs_rehash, verify_password
+
+bp = Blueprint('auth', __name__)
+
+BUSY_MESSAGE = 'Too many sign-ins right now, please try again in a moment'
+
+
+def _busy(template):
+    return render_template(template, error=BUSY_MESSAGE), 503, {'Retry-After': '1'}
+
+
+@bp.route('/register', methods=['GET', 'POST'])
+def register():
+    if request.method == 'POST':
+        data = request.form
+        
+        # Check if user already exists
+        if User.query.filter_by(email=data['email']).first():
+            return render_template('register.html', error='Email already registered')
+        
+        try:
+            hashed_password = hash_password(data['password'])
+        except HashingBusy:
+            return _busy('register.html')
+        user = User(
+            name=data['name'],
+            email=data['email'],
+            password=hashed_password,
+            phone=data.get('phone'),
+            address=data.get('address')
+        )
+        
+        db.session.add(user)
+        db.session.commit()
+        
+        session['user_id'] = user.id
+        session['user_name'] = user.name
+        return redirect(url_for('catalog.index'))
+    
+    return render_template('register.html')
+
+@bp.route('/login', methods=['GET', 'POST'])
+def login():
+    if request.method == 'POST':
+        email = request.form['email']
+        password = request.form['password']
+        
+        user = User.query.filter_by(email=email).first()
+        
+        try:
+            valid = user is not None and verify_password(user.password, password)
+        except HashingBusy:
+            return _busy('login.html')
+        
+        if valid:
+            if needs_rehash(user.password):
+                # Hash parameters changed since this password was stored
+                try:
+                    user.password = hash_password(password)
+                    db.session.commit()
+                except HashingBusy:
+                    pass
+            session['user_id'] = user.id
+            session['user_name'] = user.name
+            return redirect(url_for('catalog.index'))
+        else:
+            return render_template('login.html', error='Invalid credentials')
+    
+    return render_template('login.html')
+
+@bp.route('/logout')
+def logout():
+    session.clear()
+    return redirect(url_for('catalog.index'))
@@ -0,0 +1,107 @@
+"""
+Shopping cart routes
+"""
+
+from flask import Blueprint, abort, current_app, render_template, request, jsonify, session, redirect, url_for
+from sqlalchemy import select
+import cart_store
+import cart_summary
+import shards
+from models import Cart
+
+bp = Blueprint('cart', __name__)
+
+
+@bp.route('/cart')
+def cart():
+    if 'user_id' not in session:
+        return redirect(url_for('auth.login'))
+    
+    user_id = session['user_id']
+    cart_items = [item for item, _ in cart_store.cart_lines(shards.user_session(user_id), user_id)]
+    return render_template('cart.html', cart_items=cart_items, total=cart_summary.current()['subtotal'])
+
+@bp.route('/add_to_cart', methods=['POST'])
+def add_to_cart():
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'message': 'Please login first'}), 401
+    
+    data = request.get_json(silent=True) or {}
+    operation = {'op': 'add', 'product_id': data.get('product_id'), 'quantity': data.get('quantity', 1),
+                 'size': data.get('size')}
+    db_session = shards.user_session(session['user_id'])
+    try:
+        parsed = cart_store.parse_operations([operation])
+        cart_store.check_products(db_session, parsed)
+    except cart_store.BatchError as exc:
+        return jsonify({'success': False, 'message': exc.reason}), 400
+    _, product_id, size, quantity = parsed[0]
+    
+    # One upsert adds to an existing line or creates it
+    new_quantity, summary = cart_store.add_item(db_session, session['user_id'], product_id, quantity, size)
+    db_session.commit()
+    cart_summary.remember(summary)
+    return jsonify({'success': True, 'message': 'Item added to cart', 'quantity': new_quantity, 'cart': summary})
+
+
+@bp.route('/cart/batch', methods=['POST'])
+def batch():
+    """Apply a list of add / set / remove operations in one transaction
+
+    Body: {"operations": [{"op": "add", "product_id": 3, "size": "M", "quantity": 2},
+    {"op": "set", "product_id": 3, "size": "M", "quantity": 5}, {"op": "remove", "product_id": 4, "size": "L"}]}.
+    "set" with quantity 0 removes the line. Returns the updated cart.
+    """
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'message': 'Please login first'}), 401
+    
+    data = request.get_json(silent=True) or {}
+    db_session = shards.user_session(session['user_id'])
+    try:
+        operations = cart_store.parse_operations(
+            data.get('operations'), current_app.config.get('CART_BATCH_MAX_OPERATIONS', 100)
+        )
+        summary = cart_store.apply_batch(db_session, session['user_id'], operations)
+    except cart_store.BatchError as exc:
+        db_session.rollback()
+        return jsonify({'success': False, 'message': str(exc), 'index': exc.index}), 400
+    db_session.commit()
+    cart_summary.remember(summary)
+    return jsonify({'success': True, 'items': _cart_items(session['user_id']), 'count': summary['count'],
+                    'total': summary['subtotal'], 'version': summary['version']})
+
+@bp.route('/update_cart/<int:item_id>', methods=['POST'])
+def update_cart(item_id):
+    """Form fallback for the cart page: set one line's quantity (0 removes it)"""
+    return _change_line(item_id, request.form.get('quantity', type=int))
+
+@bp.route('/remove_from_cart/<int:item_id>', methods=['POST'])
+def remove_from_cart(item_id):
+    return _change_line(item_id, 0)
+
+
+def _change_line(item_id, quantity):
+    if 'user_id' not in session:
+        return redirect(url_for('auth.login'))
+    db_session = shards.user_session(session['user_id'])
+    item = db_session.execute(
+        select(Cart).where(Cart.id == item_id, Cart.user_id == session['user_id'])
+    ).scalar_one_or_none()
+    if item is None:
+        abort(404)
+    if quantity is not None and quantity >= 0:
+        operation = {'op': 'set', 'product_id': item.product_id, 'size': item.size, 'quantity': quantity}
+        summary = cart_store.apply_batch(db_session, session['user_id'], cart_store.parse_operations([operation]))
+        db_session.commit()
+        cart_summary.remember(summary)
+    return redirect(url_for('cart.cart'))
+
+
+def _cart_items(user_id):
+    return [
+        {
+            'id': item.id, 'product_id': product.id, 'name': product.name, 'size': item.size,
+            'quantity': item.quantity, 'price': product.price, 'subtotal': round(product.price * item.quantity, 2),
+        }
+        for item, product in cart_store.cart_lines(shards.user_session(user_id), user_id)
+    ]
@@ -0,0 +1,38 @@
+"""
+Catalog routes - homepage, category listing, product detail and search
+"""
+
+from flask import Blueprint, render_template, request
+from db_routing import read_only
+from models import Category, Product
+
+bp = Blueprint('catalog', __name__)
+
+
+@bp.route('/')
+@read_only
+def index():
+    featured_products = Product.query.filter_by(is_featured=True).limit(8).all()
+    categories = Category.query.all()
+    return render_template('index.html', featured_products=featured_products, categories=categories)
+
+@bp.route('/category/<int:category_id>')
+@read_only
+def category_products(category_id):
+    category = Category.query.get_or_404(category_id)
+    products = Product.query.filter_by(category_id=category_id).all()
+    return render_template('category.html', category=category, products=products)
+
+@bp.route('/product/<int:product_id>')
+@read_only
+def product_detail(product_id):
+    product = Product.query.get_or_404(product_id)
+    related_products = Product.query.filter_by(category_id=product.category_id).filter(Product.id != product_id).limit(4).all()
+    return render_template('product_detail.html', product=product, related_products=related_products)
+
+@bp.route('/search')
+@read_only
+def search():
+    query = request.args.get('q', '')
+    products = Product.query.filter(Product.name.contains(query) | Product.description.contains(query)).all()
+    return render_template('search_results.html', products=products, query=query)
@@ -0,0 +1,101 @@
+"""
+Checkout and order confirmation routes
+"""
+
+from flask import Blueprint, abort, render_template, request, session, redirect, url_for
+from sqlalchemy import bindparam
+import cart_store
+import cart_summary
+import shards
+from models import db, Order, OrderItem, Product
+from server_session import session_user
+
+bp = Blueprint('checkout', __name__)
+
+
+@bp.route('/checkout', methods=['GET', 'POST'])
+def checkout():
+    if 'user_id' not in session:
+        return redirect(url_for('auth.login'))
+    
+    # The user's cart and orders, on their shard when sharding is on
+    db_session = shards.user_session(session['user_id'])
+    
+    if request.method == 'POST':
+        lines = cart_store.cart_lines(db_session, session['user_id'])
+        
+        if not lines:
+            return redirect(url_for('cart.cart'))
+        
+        # Charged at current prices, from the lines just read
+        total = sum(product.price * item.quantity for item, product in lines)
+        taken = [{'product_id': item.product_id, 'quantity': item.quantity} for item, _ in lines]
+        
+        # On a shard the order and the stock are in different files, which one
+        # transaction cannot change atomically: stock is taken first in the
+        # main database and given back if the order cannot be written
+        sharded = db_session is not db.session
+        if sharded:
+            _adjust_stock(db.session, taken, -1)
+            db.session.commit()
+        else:
+            _adjust_stock(db_session, taken, -1)
+        
+        try:
+            order = Order(
+                user_id=session['user_id'],
+                total_amount=total,
+                payment_method=request.form.get('payment_method'),
+                shipping_address=request.form.get('shipping_address')
+            )
+            db_session.add(order)
+            db_session.flush()
+            
+            for item, product in lines:
+                order_item = OrderItem(
+                    order_id=order.id,
+                    product_id=item.product_id,
+                    quantity=item.quantity,
+                    price=product.price,
+                    size=item.size
+                )
+                db_session.add(order_item)
+            
+            # Clear cart
+            summary = cart_store.clear_cart(db_session, session['user_id'])
+            db_session.commit()
+        except Exception:
+            db_session.rollback()
+            if sharded:
+                _adjust_stock(db.session, taken, 1)
+                db.session.commit()
+            raise
+        cart_summary.remember(summary)
+        
+        return redirect(url_for('checkout.order_success', order_id=order.id))
+    
+    cart_items = [item for item, _ in cart_store.cart_lines(db_session, session['user_id'])]
+    total = cart_summary.current()['subtotal']
+    user = session_user()
+    
+    return render_template('checkout.html', cart_items=cart_items, total=total, user=user)
+
+def _adjust_stock(db_session, lines, sign):
+    """Add ``sign`` * quantity to each line's product stock, in one executemany"""
+    table = Product.__table__
+    db_session.execute(
+        table.update().where(table.c.id == bindparam('product_id'))
+        .values(stock=table.c.stock + sign * bindparam('quantity')),
+        lines,
+    )
+
+@bp.route('/order_success/<int:order_id>')
+def order_success(order_id):
+    if 'user_id' not in session:
+        return redirect(url_for('auth.login'))
+    
+    # Orders are looked up on the owner's shard
+    order = shards.user_session(session['user_id']).get(Order, order_id)
+    if order is None or order.user_id != session['user_id']:
+        abort(404)
+    return render_template('order_success.html', order=order)
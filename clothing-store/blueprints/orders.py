@@ -0,0 +1,54 @@
+"""
+Order history routes
+"""
+
+from flask import Blueprint, abort, current_app, render_template, request, jsonify, session, redirect, url_for
+import order_history
+import shards
+
+bp = Blueprint('orders', __name__)
+
+
+@bp.route('/my_orders')
+def my_orders():
+    if 'user_id' not in session:
+        return redirect(url_for('auth.login'))
+    
+    cursor = request.args.get('before')
+    try:
+        page = order_history.order_page(
+            shards.user_session(session['user_id']), session['user_id'], cursor, current_app.config.get('ORDERS_PAGE_SIZE', 10),
+            archive=current_app.extensions.get('order_archive'),
+        )
+    except ValueError:
+        abort(400)
+    return render_template('my_orders.html', orders=page.orders, next_cursor=page.next_cursor,
+                           first_page=cursor is None)
+
+@bp.route('/my_orders/<int:order_id>')
+def order_detail(order_id):
+    if 'user_id' not in session:
+        return redirect(url_for('auth.login'))
+    
+    detail = order_history.order_detail(shards.user_session(session['user_id']), session['user_id'], order_id,
+                                        archive=current_app.extensions.get('order_archive'))
+    if detail is None:
+        abort(404)
+    order, items = detail
+    return render_template('order_detail.html', order=order, items=items)
+
+@bp.route('/my_orders/<int:order_id>/items')
+def order_items(order_id):
+    """Items of one order, loaded when it is expanded in the list"""
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'message': 'Please login first'}), 401
+    
+    detail = order_history.order_detail(shards.user_session(session['user_id']), session['user_id'], order_id,
+                                        archive=current_app.extensions.get('order_archive'))
+    if detail is None:
+        return jsonify({'success': False, 'message': 'Order not found'}), 404
+    _, items = detail
+    return jsonify({'success': True, 'items': [
+        {'name': name, 'size': item.size, 'quantity': item.quantity, 'price': item.price}
+        for item, name in items
+    ]})
@@ -0,0 +1,213 @@
+"""
+Expiry of abandoned cart lines
+
+Cart lines whose ``added_at`` (set when a line is created and again whenever
+it is added to or changed) is older than CART_RETENTION_DAYS are deleted by a
+sweeper. It walks the ix_cart_added_at index in batches of CART_SWEEP_BATCH
+lines, each deleted in its own short transaction together with the affected
+users' cart summaries, so the write lock is never held for long and shoppers'
+writes get in between batches.
+
+With CART_SWEEP_INTERVAL set, every worker process runs the sweeper in a
+background thread, started on its first request, first after a random share of
+the interval so workers do not sweep together. Sweeps are idempotent; a
+worker that comes second finds nothing left to delete. With sharding on
+(shards.py) every shard is swept in turn. It can also be run from cron:
+
+    python cart_retention.py                 # sweep with the app's settings
+    python cart_retention.py --dry-run       # only report what would be removed
+    python cart_retention.py --days 14 --batch-size 200
+"""
+
+import argparse
+import logging
+import os
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app, has_app_context
+from prometheus_client import Counter
+from sqlalchemy import func, select
+
+import cart_store
+import shards
+from models import Cart
+
+logger = logging.getLogger('clothing_store.cart_retention')
+
+_expired = None
+_expired_lock = threading.Lock()
+
+
+def expired_counter():
+    """cart_lines_expired_total, created on first use
+
+    An unlabelled metric opens its file in PROMETHEUS_MULTIPROC_DIR as soon as
+    it is created, so creating it on import would fail whenever the module is
+    imported before that directory exists.
+    """
+    global _expired
+    with _expired_lock:
+        if _expired is None:
+            _expired = Counter('cart_lines_expired_total', 'Abandoned cart lines deleted by the retention sweeper')
+        return _expired
+
+
+class SweepReport:
+    def __init__(self, cutoff, dry_run=False):
+        self.cutoff = cutoff
+        self.dry_run = dry_run
+        self.rows = 0
+        self.users = 0
+        self.batches = 0
+        self.started = time.perf_counter()
+
+    @property
+    def seconds(self):
+        return time.perf_counter() - self.started
+
+    def summary(self):
+        action = 'would remove' if self.dry_run else 'removed'
+        return (f"{action} {self.rows} cart lines of {self.users} users added before "
+                f"{self.cutoff:%Y-%m-%d %H:%M} in {self.batches} batches ({self.seconds:.2f}s)")
+
+
+def sweep(engine, retention_days, batch_size=500, dry_run=False, pause=0.0, now=None, report=None):
+    """Delete cart lines older than ``retention_days``; returns a SweepReport
+
+    Pass the ``report`` of a previous call to add this engine's counts to it.
+    """
+    cutoff = (now or datetime.utcnow()) - timedelta(days=retention_days)
+    report = report or SweepReport(cutoff, dry_run)
+    table = Cart.__table__
+    expired = table.c.added_at < cutoff
+
+    if dry_run:
+        with engine.connect() as connection:
+            rows, users = connection.execute(
+                select(func.count(), func.count(table.c.user_id.distinct())).where(expired)
+            ).one()
+        report.rows += rows
+        report.users += users
+        return report
+
+    users, removed_before = set(), report.rows
+    while True:
+        with engine.begin() as connection:
+            rows = connection.execute(
+                select(table.c.id, table.c.user_id).where(expired).order_by(table.c.added_at).limit(batch_size)
+            ).all()
+            if rows:
+                # Still expired: a line added to since it was selected keeps its new added_at
+                deleted = connection.execute(
+                    table.delete().where(table.c.id.in_([row.id for row in rows]), expired)
+                ).rowcount
+                batch_users = cart_store.refresh_summaries(connection, [row.user_id for row in rows])
+        if not rows:
+            break
+        report.rows += deleted
+        report.batches += 1
+        users.update(batch_users)
+        _forget_cached_summaries(batch_users)
+        if len(rows) < batch_size:
+            break
+        if pause:
+            time.sleep(pause)
+    report.users += len(users)
+    expired_counter().inc(report.rows - removed_before)
+    return report
+
+
+def sweep_all(retention_days, **kwargs):
+    """sweep() every database holding carts (each shard, or db.engine); needs an app context"""
+    report = None
+    for engine in shards.user_engines():
+        report = sweep(engine, retention_days, report=report, **kwargs)
+    return report
+
+
+def _forget_cached_summaries(user_ids):
+    if has_app_context():
+        store = current_app.extensions.get('server_session')
+        if store is not None:
+            store.forget_profiles(user_ids)
+
+
+class Sweeper:
+    """Background sweeper thread for one worker process (``app.extensions['cart_retention']``)"""
+
+    def __init__(self, app, interval):
+        self.app = app
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._pid = None
+        self._stop = threading.Event()
+
+    def start(self):
+        """Start this process's thread unless it is already running (once per fork)"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            thread = threading.Thread(target=self._run, name='cart-retention', daemon=True)
+            thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def run_once(self):
+        config = self.app.config
+        with self.app.app_context():
+            report = sweep_all(
+                config['CART_RETENTION_DAYS'], batch_size=config.get('CART_SWEEP_BATCH', 500),
+                pause=config.get('CART_SWEEP_PAUSE', 0.05),
+            )
+        logger.info('cart retention sweep %s', report.summary())
+        return report
+
+    def _run(self):
+        delay = random.uniform(0, self.interval)
+        while not self._stop.wait(delay):
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception('cart retention sweep failed')
+            delay = self.interval
+
+
+def init_app(app):
+    interval = app.config.get('CART_SWEEP_INTERVAL', 0)
+    if not interval or not app.config.get('CART_RETENTION_DAYS'):
+        return
+
+    sweeper = Sweeper(app, interval)
+    app.extensions['cart_retention'] = sweeper
+    app.before_request(sweeper.start)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Delete abandoned cart lines past the retention age')
+    parser.add_argument('--days', type=float, help='retention age (default: CART_RETENTION_DAYS)')
+    parser.add_argument('--batch-size', type=int, help='lines per delete transaction (default: CART_SWEEP_BATCH)')
+    parser.add_argument('--dry-run', action='store_true', help='count expired lines without deleting them')
+    args = parser.parse_args(argv)
+
+    from app import create_app
+
+    app = create_app()
+    days = args.days if args.days is not None else app.config['CART_RETENTION_DAYS']
+    if not days:
+        parser.error('no retention age: set CART_RETENTION_DAYS or pass --days')
+    with app.app_context():
+        report = sweep_all(days, batch_size=args.batch_size or app.config.get('CART_SWEEP_BATCH', 500),
+                           dry_run=args.dry_run, pause=app.config.get('CART_SWEEP_PAUSE', 0.05))
+    print(report.summary())
+    return report
+
+
+if __name__ == '__main__':
+    main()
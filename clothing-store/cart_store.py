@@ -0,0 +1,297 @@
+"""
+Cart writes
+
+A cart holds one row per (user_id, product_id, size), enforced by a unique
+index, and adding an item is a single INSERT ... ON CONFLICT DO UPDATE that
+returns the new quantity: one round trip per click, and concurrent clicks
+add up instead of creating duplicate rows. Items without a size are stored
+with size '' so they take part in the uniqueness check (NULLs never conflict).
+
+apply_batch() takes a list of add / set / remove operations, folds them into
+one final change per line and writes them with at most three executemany
+statements in the caller's transaction.
+
+Every write also recomputes the user's row in cart_summary (item count,
+subtotal and a version bumped on each change) with one more statement, from
+the user's lines only, so pages read the totals instead of summing the cart.
+"""
+
+from datetime import datetime
+
+from sqlalchemy import bindparam, func, inspect, select, text
+
+import server_session
+from models import Cart, CartSummary, Product
+
+UNIQUE_INDEX = 'uq_cart_user_product_size'
+ADDED_AT_INDEX = 'ix_cart_added_at'
+LINE_KEY = ['user_id', 'product_id', 'size']
+OPERATIONS = ('add', 'set', 'remove')
+
+
+class BatchError(ValueError):
+    """An operation in a cart batch is invalid; nothing was applied"""
+
+    def __init__(self, index, message):
+        super().__init__(f'operation {index}: {message}')
+        self.index = index
+        self.reason = message
+
+
+def _insert(dialect_name, table=Cart.__table__):
+    if dialect_name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    elif dialect_name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        raise ValueError(f'cart upsert is not supported on {dialect_name}')
+    return insert(table)
+
+
+def add_statement(dialect_name, returning=True):
+    """INSERT ... ON CONFLICT (user_id, product_id, size) DO UPDATE adding to the quantity"""
+    stmt = _insert(dialect_name)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=LINE_KEY,
+        set_={'quantity': Cart.__table__.c.quantity + stmt.excluded.quantity, 'added_at': stmt.excluded.added_at},
+    )
+    return stmt.returning(Cart.__table__.c.quantity) if returning else stmt
+
+
+def set_statement(dialect_name):
+    """INSERT ... ON CONFLICT (user_id, product_id, size) DO UPDATE replacing the quantity"""
+    stmt = _insert(dialect_name)
+    return stmt.on_conflict_do_update(
+        index_elements=LINE_KEY, set_={'quantity': stmt.excluded.quantity, 'added_at': stmt.excluded.added_at},
+    )
+
+
+def remove_statement():
+    table = Cart.__table__
+    return table.delete().where(
+        table.c.user_id == bindparam('user_id'),
+        table.c.product_id == bindparam('product_id'),
+        table.c.size == bindparam('size'),
+    )
+
+
+def _summary_totals(owner):
+    cart, product = Cart.__table__, Product.__table__
+    lines = cart.c.user_id == owner
+    count = select(func.coalesce(func.sum(cart.c.quantity), 0)).where(lines)
+    subtotal = (
+        select(func.coalesce(func.sum(cart.c.quantity * product.c.price), 0.0))
+        .select_from(cart.join(product, cart.c.product_id == product.c.id)).where(lines)
+    )
+    return count, subtotal
+
+
+def summary_statement(dialect_name, returning=True):
+    """Upsert a user's cart_summary row from their cart lines (parameters: owner, now)"""
+    table = CartSummary.__table__
+    count, subtotal = _summary_totals(bindparam('owner'))
+    stmt = _insert(dialect_name, table).values(
+        user_id=bindparam('owner'), item_count=count.scalar_subquery(),
+        subtotal=subtotal.scalar_subquery(), version=1, updated_at=bindparam('now'),
+    )
+    stmt = stmt.on_conflict_do_update(index_elements=['user_id'], set_={
+        'item_count': stmt.excluded.item_count, 'subtotal': stmt.excluded.subtotal,
+        'version': table.c.version + 1, 'updated_at': stmt.excluded.updated_at,
+    })
+    return stmt.returning(table.c.item_count, table.c.subtotal, table.c.version) if returning else stmt
+
+
+def summary_dict(item_count=0, subtotal=0.0, version=0):
+    return {'count': item_count, 'subtotal': round(subtotal, 2), 'version': version}
+
+
+def load_summary(session, user_id):
+    """The user's cart summary as a dict (count, subtotal, version); empty if they never had a cart"""
+    row = session.execute(
+        select(CartSummary.item_count, CartSummary.subtotal, CartSummary.version)
+        .where(CartSummary.user_id == user_id)
+    ).first()
+    return summary_dict(*row) if row else summary_dict()
+
+
+def refresh_summary(session, user_id):
+    """Recompute the user's cart summary after a cart write; returns it as a dict"""
+    dialect_name = session.get_bind(mapper=Cart.__mapper__).dialect.name
+    row = session.execute(summary_statement(dialect_name), {'owner': user_id, 'now': datetime.utcnow()}).one()
+    server_session.invalidate_profiles(session, [user_id])
+    return summary_dict(*row)
+
+
+def refresh_summaries(connection, user_ids):
+    """Recompute several users' cart summaries with one executemany"""
+    user_ids = sorted(set(user_ids))
+    if user_ids:
+        now = datetime.utcnow()
+        connection.execute(summary_statement(connection.dialect.name, returning=False),
+                           [{'owner': user_id, 'now': now} for user_id in user_ids])
+    return user_ids
+
+
+def stale_summaries(connection):
+    """Users whose stored summary no longer matches their cart, e.g. after a bulk price change"""
+    cart, product = Cart.__table__, Product.__table__
+    actual = {
+        user_id: (count, subtotal) for user_id, count, subtotal in connection.execute(
+            select(cart.c.user_id, func.sum(cart.c.quantity), func.sum(cart.c.quantity * product.c.price))
+            .select_from(cart.join(product, cart.c.product_id == product.c.id)).group_by(cart.c.user_id)
+        )
+    }
+    stale = []
+    for user_id, count, subtotal in connection.execute(
+            select(CartSummary.user_id, CartSummary.item_count, CartSummary.subtotal)):
+        actual_count, actual_subtotal = actual.pop(user_id, (0, 0.0))
+        if count != actual_count or abs(subtotal - actual_subtotal) > 0.005:
+            stale.append(user_id)
+    return stale + list(actual)
+
+
+def add_item(session, user_id, product_id, quantity=1, size=None):
+    """Add ``quantity`` of a product to the user's cart
+
+    Returns (the line's new quantity, the cart summary). Runs in the caller's
+    transaction; the caller commits.
+    """
+    dialect_name = session.get_bind(mapper=Cart.__mapper__).dialect.name
+    quantity = session.execute(add_statement(dialect_name), {
+        'user_id': user_id, 'product_id': product_id, 'quantity': quantity, 'size': size or '',
+    }).scalar_one()
+    return quantity, refresh_summary(session, user_id)
+
+
+def _quantity(operation, index, minimum):
+    quantity = operation.get('quantity', 1 if operation['op'] == 'add' else None)
+    if isinstance(quantity, bool) or not isinstance(quantity, int) or quantity < minimum:
+        raise BatchError(index, f'quantity must be an integer of at least {minimum}')
+    return quantity
+
+
+def parse_operations(operations, max_operations=100):
+    """Validate a JSON list of operations into (op, product_id, size, quantity) tuples"""
+    if not isinstance(operations, list) or not operations:
+        raise BatchError(0, 'operations must be a non-empty list')
+    if len(operations) > max_operations:
+        raise BatchError(max_operations, f'at most {max_operations} operations per batch')
+    parsed = []
+    for index, operation in enumerate(operations):
+        if not isinstance(operation, dict) or operation.get('op') not in OPERATIONS:
+            raise BatchError(index, f"op must be one of {', '.join(OPERATIONS)}")
+        product_id = operation.get('product_id')
+        if isinstance(product_id, bool) or not isinstance(product_id, int):
+            raise BatchError(index, 'product_id must be an integer')
+        size = operation.get('size') or ''
+        if not isinstance(size, str) or len(size) > 50:
+            raise BatchError(index, 'size must be a string of at most 50 characters')
+        if operation['op'] == 'add':
+            quantity = _quantity(operation, index, 1)
+        elif operation['op'] == 'set':
+            quantity = _quantity(operation, index, 0)
+        else:
+            quantity = 0
+        parsed.append((operation['op'], product_id, size, quantity))
+    return parsed
+
+
+def fold_operations(parsed):
+    """Net effect per line, in order: {(product_id, size): ('add' | 'set', quantity)}, 'set' 0 removing"""
+    lines = {}
+    for op, product_id, size, quantity in parsed:
+        key = (product_id, size)
+        if op == 'add' and key in lines:
+            kind, current = lines[key]
+            lines[key] = (kind, current + quantity)
+        elif op == 'add':
+            lines[key] = ('add', quantity)
+        else:
+            lines[key] = ('set', quantity)
+    return lines
+
+
+def check_products(session, parsed):
+    """Raise BatchError for the first parsed operation whose product does not exist"""
+    product_ids = {product_id for _, product_id, _, _ in parsed}
+    known = set(session.execute(select(Product.id).where(Product.id.in_(product_ids))).scalars())
+    for index, (_, product_id, _, _) in enumerate(parsed):
+        if product_id not in known:
+            raise BatchError(index, f'product {product_id} does not exist')
+
+
+def apply_batch(session, user_id, parsed):
+    """Apply parsed operations to the user's cart in the caller's transaction
+
+    Returns the new cart summary. Raises BatchError, before writing anything,
+    if a product does not exist.
+    """
+    check_products(session, parsed)
+
+    adds, sets, removes = [], [], []
+    for (product_id, size), (kind, quantity) in fold_operations(parsed).items():
+        params = {'user_id': user_id, 'product_id': product_id, 'size': size, 'quantity': quantity}
+        if kind == 'add':
+            adds.append(params)
+        elif quantity:
+            sets.append(params)
+        else:
+            removes.append(params)
+
+    dialect_name = session.get_bind(mapper=Cart.__mapper__).dialect.name
+    for statement, rows in ((add_statement(dialect_name, returning=False), adds),
+                            (set_statement(dialect_name), sets), (remove_statement(), removes)):
+        if rows:
+            session.execute(statement, rows)
+    return refresh_summary(session, user_id)
+
+
+def clear_cart(session, user_id):
+    """Delete every line of the user's cart (after checkout); returns the empty summary"""
+    session.execute(Cart.__table__.delete().where(Cart.__table__.c.user_id == user_id))
+    return refresh_summary(session, user_id)
+
+
+def cart_lines(session, user_id):
+    """The user's cart as (Cart, Product) pairs in the order they were added, in one query"""
+    return session.execute(
+        select(Cart, Product).join(Product, Cart.product_id == Product.id)
+        .where(Cart.user_id == user_id).order_by(Cart.id)
+    ).all()
+
+
+def backfill_summaries(connection):
+    """Create the summary of every user with cart lines but no summary row, in one statement"""
+    cart, product, summary = Cart.__table__, Product.__table__, CartSummary.__table__
+    rows = (
+        select(cart.c.user_id, func.sum(cart.c.quantity), func.sum(cart.c.quantity * product.c.price),
+               bindparam('version', 1), bindparam('now', datetime.utcnow()))
+        .select_from(cart.join(product, cart.c.product_id == product.c.id))
+        .where(cart.c.user_id.not_in(select(summary.c.user_id)))
+        .group_by(cart.c.user_id)
+    )
+    return connection.execute(summary.insert().from_select(
+        ['user_id', 'item_count', 'subtotal', 'version', 'updated_at'], rows
+    )).rowcount
+
+
+def ensure_schema(connection):
+    """Merge duplicate cart lines and add the cart indexes to databases created before them"""
+    indexes = {index['name'] for index in inspect(connection).get_indexes('cart')}
+    if UNIQUE_INDEX not in indexes:
+        _merge_duplicate_lines(connection)
+    if ADDED_AT_INDEX not in indexes:
+        connection.execute(text(f'CREATE INDEX {ADDED_AT_INDEX} ON cart (added_at)'))
+
+
+def _merge_duplicate_lines(connection):
+    same_line = "user_id, product_id, COALESCE(size, '')"
+    connection.execute(text(
+        f"UPDATE cart SET quantity = (SELECT SUM(other.quantity) FROM cart AS other "
+        f"WHERE other.user_id = cart.user_id AND other.product_id = cart.product_id "
+        f"AND COALESCE(other.size, '') = COALESCE(cart.size, '')) "
+        f"WHERE id IN (SELECT MIN(id) FROM cart GROUP BY {same_line} HAVING COUNT(*) > 1)"
+    ))
+    connection.execute(text(f"DELETE FROM cart WHERE id NOT IN (SELECT MIN(id) FROM cart GROUP BY {same_line})"))
+    connection.execute(text("UPDATE cart SET size = '' WHERE size IS NULL"))
+    connection.execute(text(f'CREATE UNIQUE INDEX {UNIQUE_INDEX} ON cart (user_id, product_id, size)'))
@@ -0,0 +1,111 @@
+"""
+Cart summary for the header badge and the cart and checkout pages
+
+Each user's item count, subtotal and version live in the cart_summary table,
+which cart_store updates in the same transaction as every cart write. This
+module keeps it current for the remaining writers:
+
+- ORM changes to Cart rows and to Product.price (mapper events);
+- catalog imports, which re-price products in bulk (POST_IMPORT_HOOKS): only
+  users whose stored subtotal no longer matches are recomputed.
+
+With sharding on (shards.py), carts and their summaries live on the shards, so
+price changes are applied to every shard's stale summaries once the new
+prices are committed.
+
+Pages read the summary through current(), which caches it in the user's
+server-side session profile, so the header badge costs no query once the
+profile is cached. A summary write clears the cached copy from all of the
+user's sessions; views that made the change put the fresh one back with
+remember().
+"""
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import object_session
+
+import cart_store
+import server_session
+import shards
+from db_routing import RoutingSession
+from models import Cart, Product
+
+PROFILE_KEY = 'cart'
+
+
+def current():
+    """Summary of the logged-in user's cart ({count, subtotal, version}), or None"""
+    return server_session.profile_value(PROFILE_KEY, lambda user_id: cart_store.load_summary(shards.user_session(user_id), user_id))
+
+
+def remember(summary):
+    """Cache a summary the current request just wrote"""
+    server_session.update_profile_value(PROFILE_KEY, summary)
+
+
+def init_app(app):
+    import catalog_import
+
+    if _refresh_after_import not in catalog_import.POST_IMPORT_HOOKS:
+        catalog_import.POST_IMPORT_HOOKS.append(_refresh_after_import)
+    if not event.contains(Product, 'after_update', _price_changed):
+        event.listen(Product, 'after_update', _price_changed)
+        for identifier in ('after_insert', 'after_update', 'after_delete'):
+            event.listen(Cart, identifier, _line_changed)
+        event.listen(RoutingSession, 'after_commit', _refresh_repriced_shards)
+    app.context_processor(lambda: {'cart_summary': current})
+
+
+def _line_changed(mapper, connection, target):
+    cart_store.refresh_summaries(connection, [target.user_id])
+    db_session = object_session(target)
+    if db_session is not None:
+        server_session.invalidate_profiles(db_session, [target.user_id])
+
+
+def _price_changed(mapper, connection, target):
+    if not inspect(target).attrs.price.history.has_changes():
+        return
+    db_session = object_session(target)
+    if _sharded():
+        # The carts are in other files; recompute them after this commits
+        if db_session is not None:
+            db_session.info['repriced'] = True
+        return
+    user_ids = cart_store.refresh_summaries(connection, connection.execute(
+        select(Cart.user_id).where(Cart.product_id == target.id).distinct()
+    ).scalars())
+    if user_ids and db_session is not None:
+        server_session.invalidate_profiles(db_session, user_ids)
+
+
+def _refresh_after_import(connection, report):
+    if _sharded():
+        # The import's prices are committed chunk by chunk before its hooks run
+        _refresh_shards()
+        return
+    user_ids = cart_store.refresh_summaries(connection, cart_store.stale_summaries(connection))
+    if not user_ids or not has_app_context():
+        return
+    store = current_app.extensions.get('server_session')
+    if store is not None:
+        # Once the import's last transaction commits, as for ORM sessions
+        event.listen(connection, 'commit', lambda conn: store.forget_profiles(user_ids), once=True)
+
+
+def _sharded():
+    return has_app_context() and 'shards' in current_app.extensions
+
+
+def _refresh_repriced_shards(db_session):
+    if db_session.info.pop('repriced', False) and _sharded():
+        _refresh_shards()
+
+
+def _refresh_shards():
+    store = current_app.extensions.get('server_session')
+    for engine in shards.user_engines():
+        with engine.begin() as connection:
+            user_ids = cart_store.refresh_summaries(connection, cart_store.stale_summaries(connection))
+        if user_ids and store is not None:
+            store.forget_profiles(user_ids)
@@ -0,0 +1,283 @@
+"""
+Streaming bulk catalog importer
+Reads a supplier feed (CSV or JSONL) in fixed-size chunks, validates each row
+and upserts products by their SKU with one batched INSERT ... ON CONFLICT per
+chunk, so memory use stays flat regardless of feed size.
+
+Feed columns: sku, name, price, category (category name) and optionally
+description, original_price, stock, size, color, material, brand, image_url,
+is_featured, rating, age_group (used with --create-categories).
+
+Secondary product indexes are dropped before the load and rebuilt, together
+with planner statistics and registered caches, once at the end.
+
+Usage:
+    python catalog_import.py feed.csv
+    python catalog_import.py feed.jsonl --chunk-size 5000 --rejects rejects.jsonl --create-categories
+"""
+
+import argparse
+import csv
+import itertools
+import json
+import sys
+import time
+
+from sqlalchemy import inspect, text
+
+import cart_store
+from models import db, Category, Order, OrderItem, Product
+
+PRODUCT_FIELDS = (
+    'sku', 'name', 'description', 'price', 'original_price', 'category_id', 'stock',
+    'size', 'color', 'material', 'brand', 'image_url', 'is_featured', 'rating',
+)
+TEXT_FIELDS = ('description', 'size', 'color', 'material', 'brand', 'image_url')
+TRUE_VALUES = ('1', 'true', 'yes', 'y')
+
+# Callables run once after an import with (connection, report); features that
+# derive data from the product table register here to rebuild it in bulk.
+POST_IMPORT_HOOKS = []
+
+
+class RowError(ValueError):
+    pass
+
+
+class ImportReport:
+    def __init__(self):
+        self.processed = 0
+        self.upserted = 0
+        self.rejected = 0
+        self.categories_created = 0
+        self.started = time.perf_counter()
+
+    @property
+    def seconds(self):
+        return time.perf_counter() - self.started
+
+    def summary(self):
+        rate = self.processed / self.seconds if self.seconds else 0
+        return (f"{self.processed} rows, {self.upserted} upserted, {self.rejected} rejected "
+                f"in {self.seconds:.1f}s ({rate:.0f} rows/s)")
+
+
+def read_rows(path, fmt=None):
+    """Yield (line_number, raw_row) pairs from a CSV or JSONL file without loading it"""
+    fmt = fmt or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+    with open(path, newline='', encoding='utf-8') as fh:
+        if fmt == 'csv':
+            reader = csv.DictReader(fh)
+            for row in reader:
+                yield reader.line_num, row
+        else:
+            for line_number, line in enumerate(fh, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError as exc:
+                    yield line_number, {'_error': f'invalid JSON: {exc}'}
+                    continue
+                yield line_number, row if isinstance(row, dict) else {'_error': 'row is not an object'}
+
+
+def _text(value):
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def _number(raw, field, cast, required=False, minimum=None, maximum=None):
+    value = _text(raw.get(field))
+    if value is None:
+        if required:
+            raise RowError(f'{field} is required')
+        return None
+    try:
+        number = cast(value)
+    except ValueError:
+        raise RowError(f'{field} is not a valid number: {value!r}')
+    if minimum is not None and number < minimum or maximum is not None and number > maximum:
+        raise RowError(f'{field} out of range: {value!r}')
+    return number
+
+
+def validate(raw, category_ids, new_categories=False):
+    """Turn a raw feed row into a product row dict, or raise RowError
+
+    With ``new_categories`` an unknown category is accepted and the row's
+    category_id left as None, for the caller to create once the row is valid.
+    """
+    if '_error' in raw:
+        raise RowError(raw['_error'])
+    sku = _text(raw.get('sku'))
+    name = _text(raw.get('name'))
+    category = _text(raw.get('category'))
+    if not sku:
+        raise RowError('sku is required')
+    if len(sku) > 64:
+        raise RowError('sku longer than 64 characters')
+    if not name:
+        raise RowError('name is required')
+    if not category:
+        raise RowError('category is required')
+    if category not in category_ids and not new_categories:
+        raise RowError(f'unknown category: {category!r}')
+
+    row = {
+        'sku': sku,
+        'name': name[:200],
+        'price': _number(raw, 'price', float, required=True, minimum=0.01),
+        'original_price': _number(raw, 'original_price', float, minimum=0),
+        'category_id': category_ids.get(category),
+        'stock': _number(raw, 'stock', int, minimum=0) or 0,
+        'is_featured': str(raw.get('is_featured') or '').strip().lower() in TRUE_VALUES,
+        'rating': _number(raw, 'rating', float, minimum=0, maximum=5) or 0.0,
+    }
+    for field in TEXT_FIELDS:
+        row[field] = _text(raw.get(field))
+    return row
+
+
+def upsert_statement(dialect_name):
+    """INSERT ... ON CONFLICT (sku) DO UPDATE for the product table"""
+    if dialect_name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    elif dialect_name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        raise ValueError(f'bulk upsert is not supported on {dialect_name}')
+    stmt = insert(Product.__table__)
+    return stmt.on_conflict_do_update(
+        index_elements=['sku'],
+        set_={field: stmt.excluded[field] for field in PRODUCT_FIELDS if field != 'sku'},
+    )
+
+
+def ensure_schema(connection):
+    """Create missing tables and upgrade databases created before the sku column, the cart
+    unique index, the cart summary table or the order history indexes"""
+    db.metadata.create_all(connection)
+    columns = {column['name'] for column in inspect(connection).get_columns('product')}
+    if 'sku' not in columns:
+        connection.execute(text('ALTER TABLE product ADD COLUMN sku VARCHAR(64)'))
+        connection.execute(text('CREATE UNIQUE INDEX ix_product_sku ON product (sku)'))
+    cart_store.ensure_schema(connection)
+    cart_store.backfill_summaries(connection)
+    for index in sorted(Order.__table__.indexes | OrderItem.__table__.indexes, key=lambda index: index.name):
+        index.create(connection, checkfirst=True)
+
+
+def _secondary_indexes():
+    return [index for index in Product.__table__.indexes if not index.unique]
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def import_catalog(app, path, fmt=None, chunk_size=1000, rejects_path=None,
+                   create_categories=False, defer_indexes=True, progress=None):
+    """Stream ``path`` into the product table; returns an ImportReport"""
+    report = ImportReport()
+    rejects = open(rejects_path, 'w', encoding='utf-8') if rejects_path else None
+    try:
+        with app.app_context():
+            engine = db.engine
+            with engine.begin() as connection:
+                ensure_schema(connection)
+                category_ids = dict(connection.execute(
+                    text('SELECT name, id FROM category')
+                ).all())
+                if defer_indexes:
+                    for index in _secondary_indexes():
+                        index.drop(connection, checkfirst=True)
+            statement = upsert_statement(engine.dialect.name)
+
+            try:
+                for chunk in _chunks(read_rows(path, fmt), chunk_size):
+                    # Last row per SKU: one statement cannot upsert a row twice
+                    # (PostgreSQL rejects it), and a repeat is not a second product
+                    rows = {}
+                    with engine.begin() as connection:
+                        for line_number, raw in chunk:
+                            report.processed += 1
+                            try:
+                                row = validate(raw, category_ids, new_categories=create_categories)
+                            except RowError as exc:
+                                report.rejected += 1
+                                if rejects:
+                                    rejects.write(json.dumps({'line': line_number, 'reason': str(exc), 'row': raw}) + '\n')
+                                continue
+                            # Only rows that will be loaded create categories
+                            if row['category_id'] is None:
+                                row['category_id'] = _create_category(connection, raw, category_ids, report)
+                            rows[row['sku']] = row
+                        if rows:
+                            connection.execute(statement, list(rows.values()))
+                            report.upserted += len(rows)
+                    if progress:
+                        progress(report)
+            finally:
+                with engine.begin() as connection:
+                    if defer_indexes:
+                        for index in _secondary_indexes():
+                            index.create(connection, checkfirst=True)
+                    if engine.dialect.name == 'sqlite':
+                        connection.execute(text('ANALYZE product'))
+                    for hook in POST_IMPORT_HOOKS:
+                        hook(connection, report)
+    finally:
+        if rejects:
+            rejects.close()
+    return report
+
+
+def _create_category(connection, raw, category_ids, report):
+    name = _text(raw.get('category'))
+    result = connection.execute(
+        Category.__table__.insert().values(name=name[:50], age_group=_text(raw.get('age_group')) or 'All Ages')
+    )
+    category_ids[name] = result.inserted_primary_key[0]
+    report.categories_created += 1
+    return category_ids[name]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Stream a CSV/JSONL supplier feed into the product catalog')
+    parser.add_argument('path', help='feed file (.csv or .jsonl)')
+    parser.add_argument('--format', choices=('csv', 'jsonl'), help='override format detection by extension')
+    parser.add_argument('--chunk-size', type=int, default=1000, help='rows per batched upsert and transaction')
+    parser.add_argument('--rejects', help='write rejected rows with reasons to this JSONL file')
+    parser.add_argument('--create-categories', action='store_true', help='create unknown categories instead of rejecting')
+    parser.add_argument('--keep-indexes', action='store_true', help='maintain secondary indexes during the load')
+    args = parser.parse_args(argv)
+
+    from app import create_app
+
+    def progress(report):
+        print(f"\r  {report.summary()}", end='', file=sys.stderr, flush=True)
+
+    report = import_catalog(
+        create_app(), args.path, fmt=args.format, chunk_size=args.chunk_size,
+        rejects_path=args.rejects, create_categories=args.create_categories,
+        defer_indexes=not args.keep_indexes, progress=progress,
+    )
+    print(file=sys.stderr)
+    print(f"✅ Import finished: {report.summary()}")
+    if report.categories_created:
+        print(f"✅ Created {report.categories_created} categories")
+    if report.rejected:
+        print(f"⚠️  {report.rejected} rows rejected" + (f" (see {args.rejects})" if args.rejects else ''))
+    return report
+
+
+if __name__ == '__main__':
+    main()
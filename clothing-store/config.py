@@ -0,0 +1,147 @@
+"""
+Configuration for the Indian Clothing Store application
+Deployment-specific values are read from the environment
+"""
+
+import os
+
+
+def _env_flag(name, default):
+    return os.environ.get(name, '1' if default else '0').lower() in ('1', 'true', 'yes', 'on')
+
+
+class Config:
+    SECRET_KEY = os.environ.get('SECRET_KEY', 'your-secret-key-here-change-in-production')
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'sqlite:///clothing_store.db')
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Read routing (see db_routing.py): catalog views read from READ_DATABASE_URI
+    # when set, otherwise from a query-only pool on the primary SQLite file when
+    # SQLITE_READ_POOL is on. Writers stick to the primary for a few seconds.
+    READ_DATABASE_URI = os.environ.get('READ_DATABASE_URL')
+    SQLITE_READ_POOL = _env_flag('SQLITE_READ_POOL', False)
+    READ_YOUR_WRITES_SECONDS = float(os.environ.get('READ_YOUR_WRITES_SECONDS', 5))
+
+    # SQL instrumentation (see query_stats.py). Statements slower than the
+    # threshold go to the slow-query log; plans are captured for a sample.
+    SQL_STATS_ENABLED = _env_flag('SQL_STATS_ENABLED', True)
+    SLOW_QUERY_THRESHOLD_MS = float(os.environ.get('SLOW_QUERY_THRESHOLD_MS', 100))
+    SLOW_QUERY_PLAN_SAMPLE_RATE = float(os.environ.get('SLOW_QUERY_PLAN_SAMPLE_RATE', 0.1))
+    SLOW_QUERY_LOG = os.environ.get('SLOW_QUERY_LOG')
+
+    # Prometheus metrics at /metrics (see metrics.py)
+    METRICS_ENABLED = _env_flag('METRICS_ENABLED', True)
+
+    # Sampling CPU profiler (see profiler.py). Off unless enabled; when on, a
+    # PROFILER_SAMPLE_RATE fraction of requests plus any request with a valid
+    # X-Profiler-Token header are profiled.
+    PROFILER_ENABLED = _env_flag('PROFILER_ENABLED', False)
+    PROFILER_SAMPLE_RATE = float(os.environ.get('PROFILER_SAMPLE_RATE', 0.0))
+    PROFILER_INTERVAL_MS = float(os.environ.get('PROFILER_INTERVAL_MS', 5))
+    PROFILER_OUTPUT_DIR = os.environ.get('PROFILER_OUTPUT_DIR')
+    PROFILER_TOKEN_MAX_AGE = int(os.environ.get('PROFILER_TOKEN_MAX_AGE', 3600))
+
+    # Per-request memory tracking with tracemalloc (see memory_tracking.py)
+    MEMORY_TRACKING_ENABLED = _env_flag('MEMORY_TRACKING_ENABLED', False)
+    MEMORY_SAMPLE_RATE = float(os.environ.get('MEMORY_SAMPLE_RATE', 0.01))
+    MEMORY_BUDGET_BYTES = int(os.environ.get('MEMORY_BUDGET_BYTES', 32 * 1024 * 1024))
+    MEMORY_TOP_N = int(os.environ.get('MEMORY_TOP_N', 10))
+    MEMORY_TRACEBACK_FRAMES = int(os.environ.get('MEMORY_TRACEBACK_FRAMES', 1))
+
+    # Password hashing (see password_hashing.py). Hashes run in a process pool
+    # per web worker; requests that wait longer than the timeout get a 503.
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt')
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 1))
+    PASSWORD_HASH_MAX_PENDING = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', 4))
+    PASSWORD_HASH_TIMEOUT = float(os.environ.get('PASSWORD_HASH_TIMEOUT', 5))
+
+    # Server-side sessions (see server_session.py): the cookie holds only an id,
+    # session data and the user's cached profile live in a SQLite file shared by
+    # the workers (default instance/sessions.db). Set to 0 for cookie sessions.
+    SERVER_SESSIONS_ENABLED = _env_flag('SERVER_SESSIONS_ENABLED', True)
+    SESSION_STORE_PATH = os.environ.get('SESSION_STORE_PATH')
+    SESSION_LIFETIME = int(os.environ.get('SESSION_LIFETIME', 30 * 86400))
+    SESSION_CACHE_SIZE = int(os.environ.get('SESSION_CACHE_SIZE', 10000))
+    SESSION_CLEANUP_EVERY = int(os.environ.get('SESSION_CLEANUP_EVERY', 1000))
+
+    # Admission control (see admission_control.py). Requests are classed by
+    # blueprint; when even the fastest requests of an interval miss their
+    # class's latency SLO, classes are shed in ADMISSION_SHED_ORDER with a 503.
+    # Checkout is never shed. Set ADMISSION_REQUEST_START_HEADER only when a
+    # proxy you control stamps it (nginx: X-Request-Start "t=${msec}").
+    ADMISSION_CONTROL_ENABLED = _env_flag('ADMISSION_CONTROL_ENABLED', True)
+    ADMISSION_ROUTE_CLASSES = {
+        'catalog': 'catalog', 'orders': 'catalog', 'cart': 'cart', 'auth': 'auth', 'checkout': 'checkout',
+    }
+    ADMISSION_SLO_MS = {
+        'catalog': float(os.environ.get('ADMISSION_SLO_CATALOG_MS', 250)),
+        'cart': float(os.environ.get('ADMISSION_SLO_CART_MS', 500)),
+        'auth': float(os.environ.get('ADMISSION_SLO_AUTH_MS', 1000)),
+        'checkout': float(os.environ.get('ADMISSION_SLO_CHECKOUT_MS', 2000)),
+    }
+    ADMISSION_SHED_ORDER = ['catalog', 'cart', 'auth']
+    ADMISSION_INTERVAL_MS = float(os.environ.get('ADMISSION_INTERVAL_MS', 500))
+    ADMISSION_MIN_SAMPLES = int(os.environ.get('ADMISSION_MIN_SAMPLES', 5))
+    ADMISSION_RETRY_AFTER = int(os.environ.get('ADMISSION_RETRY_AFTER', 2))
+    ADMISSION_REQUEST_START_HEADER = os.environ.get('ADMISSION_REQUEST_START_HEADER')
+
+    # Token-bucket rate limits per endpoint (see rate_limit.py): '<count>/<period>'
+    # is a burst of count requests refilled over the period, keyed by client IP
+    # and/or logged-in user. Buckets are per-process unless RATE_LIMIT_STORAGE
+    # names a SQLite file shared by the workers (gunicorn.conf.py sets one).
+    RATE_LIMIT_ENABLED = _env_flag('RATE_LIMIT_ENABLED', True)
+    RATE_LIMIT_STORAGE = os.environ.get('RATE_LIMIT_STORAGE')
+    RATE_LIMITS = {
+        'auth.login': {'limit': os.environ.get('RATE_LIMIT_LOGIN', '10/minute'), 'key': 'ip', 'methods': ['POST']},
+        'auth.register': {'limit': os.environ.get('RATE_LIMIT_REGISTER', '5/minute'), 'key': 'ip', 'methods': ['POST']},
+        'catalog.search': {'limit': os.environ.get('RATE_LIMIT_SEARCH', '60/minute'), 'key': 'user'},
+        'cart.add_to_cart': {'limit': os.environ.get('RATE_LIMIT_ADD_TO_CART', '120/minute'), 'key': 'user'},
+        'cart.batch': {'limit': os.environ.get('RATE_LIMIT_CART_BATCH', '60/minute'), 'key': 'user'},
+    }
+
+    # Largest list of operations accepted by /cart/batch
+    CART_BATCH_MAX_OPERATIONS = int(os.environ.get('CART_BATCH_MAX_OPERATIONS', 100))
+
+    # Orders per page of /my_orders (see order_history.py)
+    ORDERS_PAGE_SIZE = int(os.environ.get('ORDERS_PAGE_SIZE', 10))
+
+    # Cold order archive (see order_archive.py): whole months of orders older
+    # than ORDER_ARCHIVE_AFTER_DAYS move to one SQLite file per month in
+    # ORDER_ARCHIVE_DIR (default: instance/archive) when
+    # `python order_archive.py archive` runs.
+    ORDER_ARCHIVE_DIR = os.environ.get('ORDER_ARCHIVE_DIR')
+    ORDER_ARCHIVE_AFTER_DAYS = int(os.environ.get('ORDER_ARCHIVE_AFTER_DAYS', 365))
+
+    # Cart and order sharding (see shards.py): with SHARD_COUNT > 0, carts and
+    # orders are split by user across SHARD_COUNT SQLite files in SHARD_DIR
+    # (default: instance/shards), each with its own write lock. 0 keeps them
+    # in the main database.
+    SHARD_COUNT = int(os.environ.get('SHARD_COUNT', 0))
+    SHARD_DIR = os.environ.get('SHARD_DIR')
+
+    # Abandoned cart expiry (see cart_retention.py): lines not added to or
+    # changed for CART_RETENTION_DAYS are deleted CART_SWEEP_BATCH at a time,
+    # every CART_SWEEP_INTERVAL seconds by each worker (0 disables the thread;
+    # run `python cart_retention.py` from cron instead).
+    CART_RETENTION_DAYS = float(os.environ.get('CART_RETENTION_DAYS', 30))
+    CART_SWEEP_INTERVAL = float(os.environ.get('CART_SWEEP_INTERVAL', 3600))
+    CART_SWEEP_BATCH = int(os.environ.get('CART_SWEEP_BATCH', 500))
+    CART_SWEEP_PAUSE = float(os.environ.get('CART_SWEEP_PAUSE', 0.05))
+
+    # Sanitized request log for load-test replay (see traffic_capture.py)
+    TRAFFIC_CAPTURE_ENABLED = _env_flag('TRAFFIC_CAPTURE_ENABLED', False)
+    TRAFFIC_CAPTURE_DIR = os.environ.get('TRAFFIC_CAPTURE_DIR')
+    TRAFFIC_CAPTURE_SAMPLE_RATE = float(os.environ.get('TRAFFIC_CAPTURE_SAMPLE_RATE', 1.0))
+    TRAFFIC_CAPTURE_MAX_BODY = int(os.environ.get('TRAFFIC_CAPTURE_MAX_BODY', 4096))
+
+    # PRAGMAs applied to every new SQLite connection (see sqlite_profile.py).
+    # WAL lets readers run alongside a writer, synchronous=NORMAL only fsyncs
+    # at checkpoints, cache_size is in KiB when negative. Set to {} to disable.
+    SQLITE_PRAGMAS = {
+        'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+        'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+        'cache_size': int(os.environ.get('SQLITE_CACHE_SIZE', -64000)),
+        'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', 268435456)),
+        'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000)),
+        'temp_store': os.environ.get('SQLITE_TEMP_STORE', 'MEMORY'),
+    }
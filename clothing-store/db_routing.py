@@ -0,0 +1,91 @@
+"""
+Read/write engine routing
+Catalog views decorated with @read_only run their SELECTs on a separate read
+engine (a replica, or a query-only SQLite pool on the primary file); flushes,
+bulk UPDATE/DELETE and every other view stay on the primary engine.
+
+After a request writes anything, the user's session is pinned to the primary
+for READ_YOUR_WRITES_SECONDS so they never read their own change from a
+lagging replica.
+"""
+
+import time
+from functools import wraps
+
+from flask import current_app, g, has_request_context, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine
+
+import sqlite_profile
+
+STICKY_SESSION_KEY = '_primary_until'
+
+
+class ReadRouting:
+    """Holds the read engine for an app (``app.extensions['db_routing']``)"""
+
+    def __init__(self, read_engine):
+        self.read_engine = read_engine
+
+
+class RoutingSession(Session):
+    """Flask-SQLAlchemy session that sends read-only request queries to the read engine"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_request_context():
+            if self._flushing or getattr(clause, 'is_dml', False):
+                g.db_wrote = True
+            elif g.get('db_read_only') and not g.get('db_wrote') and self.bind is None:
+                routing = current_app.extensions.get('db_routing')
+                if routing is not None:
+                    return routing.read_engine
+        if bind is None and self.bind is not None:
+            # Joined to an external connection, e.g. a test's outer transaction
+            return self.bind
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def read_only(view):
+    """Mark a view as safe to serve from the read engine"""
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.db_read_only = session.get(STICKY_SESSION_KEY, 0) < time.time()
+        return view(*args, **kwargs)
+
+    return wrapper
+
+
+def init_app(app, db):
+    """Create the read engine (if configured) and install read-your-writes stickiness"""
+    app.after_request(_pin_writers_to_primary)
+
+    read_uri = app.config.get('READ_DATABASE_URI')
+    with app.app_context():
+        primary = db.engine
+    engine_options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+
+    if read_uri:
+        read_engine = create_engine(read_uri, **engine_options)
+    elif app.config.get('SQLITE_READ_POOL') and primary.dialect.name == 'sqlite' \
+            and primary.url.database not in (None, '', ':memory:'):
+        read_engine = create_engine(primary.url, **engine_options)
+    else:
+        return
+
+    if read_engine.dialect.name == 'sqlite':
+        # journal_mode is a property of the database file, set by the primary
+        pragmas = {
+            name: value for name, value in (app.config.get('SQLITE_PRAGMAS') or {}).items()
+            if name != 'journal_mode'
+        }
+        pragmas['query_only'] = 'ON'
+        sqlite_profile.apply_to_engine(read_engine, pragmas)
+
+    app.extensions['db_routing'] = ReadRouting(read_engine)
+
+
+def _pin_writers_to_primary(response):
+    if g.get('db_wrote'):
+        session[STICKY_SESSION_KEY] = time.time() + current_app.config.get('READ_YOUR_WRITES_SECONDS', 5)
+    return response
@@ -0,0 +1,413 @@
+"""
+Deterministic synthetic dataset generator for benchmarks and plan-regression tests
+
+Builds a store with realistic Indian apparel at a chosen scale factor: age/style
+categories, products, users, open carts and a multi-year order history.
+Product popularity and orders per user follow Zipf-like skews, so a few
+bestsellers and repeat customers dominate, as in production.
+
+The same (scale, seed, end date) always produces the same rows and ids,
+regardless of how many processes generate them: every user's carts and
+orders come from a RNG seeded by (seed, user id), and order/item ids are
+computed, not assigned by the database. Rows are written with batched
+executemany inserts; order history is split across processes by user range.
+
+Per scale unit: 1,000 products, 500 users, ~1,600 orders. Every user's
+password is DEFAULT_PASSWORD.
+
+Usage:
+    python generate_dataset.py --scale 10 --seed 42 --processes 4 --fresh
+    DATABASE_URL=sqlite:////tmp/bench.db python generate_dataset.py --scale 50 --fresh
+
+Benchmarks share one cached dataset file via ensure_dataset(scale, seed).
+"""
+
+import argparse
+import bisect
+import hashlib
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, func, insert, select
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+import cart_store
+from models import db, User, Category, Product, Cart, Order, OrderItem
+
+DEFAULT_SEED = 42
+DEFAULT_END_DATE = datetime(2025, 12, 31, 23, 59, 59)
+DEFAULT_PASSWORD = 'password123'
+
+PRODUCTS_PER_SCALE = 1000
+USERS_PER_SCALE = 500
+PRODUCT_ZIPF_EXPONENT = 1.1
+ORDERS_PARETO_ALPHA = 1.3
+MAX_ORDERS_PER_USER = 400
+MAX_ITEMS_PER_ORDER = 5
+CART_PROBABILITY = 0.2
+ID_STRIDE = 8  # child rows get ids parent_id * ID_STRIDE + n, so they never depend on insert order
+CHUNK_SIZE = 5000
+
+AGE_GROUPS = [
+    ('Infant & Toddler', '0-3 years', ['0-6M', '6-12M', '1-2Y', '2-3Y'],
+     ['Romper', 'Jhabla', 'Onesie', 'Frock', 'Dhoti Kurta Set', 'Bodysuit']),
+    ('Kids', '4-12 years', ['4-5Y', '6-7Y', '8-9Y', '10-11Y', '12Y'],
+     ['Kurta Pajama', 'Lehenga Choli', 'T-Shirt', 'Shorts', 'Frock', 'Sherwani', 'Jeans']),
+    ('Teens', '13-19 years', ['XS', 'S', 'M', 'L'],
+     ['Kurti', 'Hoodie', 'Crop Top', 'Jeans', 'Track Pants', 'Indo-Western Jacket']),
+    ('Young Adults', '20-35 years', ['S', 'M', 'L', 'XL', 'XXL'],
+     ['Kurta', 'Saree', 'Anarkali Suit', 'Palazzo Set', 'Formal Shirt', 'Chinos', 'Nehru Jacket']),
+    ('Adults', '36-55 years', ['M', 'L', 'XL', 'XXL', '3XL'],
+     ['Kurta Pajama', 'Salwar Kameez', 'Saree', 'Formal Trousers', 'Bandhgala', 'Dhoti']),
+    ('Seniors', '56+ years', ['M', 'L', 'XL', 'XXL'],
+     ['Comfort Kurta', 'Cotton Nightie', 'Elastic Waist Pants', 'Shawl', 'Cardigan']),
+]
+SEGMENTS = ['Ethnic Wear', 'Western Wear', 'Festive Collection', 'Casual Wear',
+            'Formal Wear', 'Winter Wear', 'Sleepwear', 'Activewear']
+GARMENT_BASE_PRICE = {
+    'Romper': 449, 'Jhabla': 299, 'Onesie': 349, 'Frock': 599, 'Dhoti Kurta Set': 799, 'Bodysuit': 399,
+    'Kurta Pajama': 1199, 'Lehenga Choli': 1899, 'T-Shirt': 399, 'Shorts': 349, 'Sherwani': 2999,
+    'Jeans': 1099, 'Kurti': 699, 'Hoodie': 1299, 'Crop Top': 549, 'Track Pants': 799,
+    'Indo-Western Jacket': 1999, 'Kurta': 899, 'Saree': 1999, 'Anarkali Suit': 2499, 'Palazzo Set': 1399,
+    'Formal Shirt': 1199, 'Chinos': 1299, 'Nehru Jacket': 1799, 'Salwar Kameez': 1599,
+    'Formal Trousers': 1199, 'Bandhgala': 3999, 'Dhoti': 599, 'Comfort Kurta': 799,
+    'Cotton Nightie': 549, 'Elastic Waist Pants': 649, 'Shawl': 1499, 'Cardigan': 1199,
+}
+FABRICS = [
+    ('Cotton', 1.0), ('Khadi', 1.1), ('Linen', 1.3), ('Rayon', 0.9), ('Chanderi', 1.6),
+    ('Georgette', 1.4), ('Chiffon', 1.3), ('Banarasi Silk', 3.0), ('Kanjeevaram Silk', 3.5),
+    ('Art Silk', 1.5), ('Denim', 1.2), ('Polyester Blend', 0.8), ('Wool Blend', 1.8), ('Modal', 1.1),
+]
+COLORS = ['Maroon', 'Mustard Yellow', 'Peacock Blue', 'Rani Pink', 'Emerald Green', 'Off White',
+          'Indigo', 'Saffron', 'Black', 'Navy Blue', 'Beige', 'Wine', 'Teal', 'Rust Orange', 'Pastel Mint']
+PATTERNS = ['Block Print', 'Bandhani', 'Ikat', 'Chikankari', 'Zari Work', 'Solid', 'Floral Print',
+            'Kalamkari', 'Mirror Work', 'Striped', 'Phulkari', 'Leheriya']
+BRANDS = ['Rangrez', 'Desi Threads', 'Kalakari', 'Sutra', 'Taana Baana', 'Rivaaz', 'Kapas Co',
+          'Chhota Nawab', 'Nanhe Kadam', 'Urban Tanka', 'Mulmul House', 'Jharokha', 'Pehnava', 'Vastra']
+FIRST_NAMES = ['Aarav', 'Vivaan', 'Aditya', 'Arjun', 'Sai', 'Reyansh', 'Krishna', 'Ishaan', 'Rohan',
+               'Kabir', 'Ananya', 'Diya', 'Saanvi', 'Aadhya', 'Priya', 'Kavya', 'Meera', 'Ishita',
+               'Lakshmi', 'Fatima', 'Harpreet', 'Gurpreet', 'Suresh', 'Ramesh', 'Lalitha', 'Deepa',
+               'Imran', 'Joseph', 'Nandini', 'Pooja', 'Rahul', 'Sneha', 'Tanvi', 'Vikram', 'Zoya']
+LAST_NAMES = ['Sharma', 'Verma', 'Iyer', 'Nair', 'Reddy', 'Patel', 'Shah', 'Gupta', 'Singh', 'Khan',
+              'Das', 'Banerjee', 'Mukherjee', 'Chatterjee', 'Kulkarni', 'Deshmukh', 'Menon', 'Pillai',
+              'Rao', 'Joshi', 'Mehta', 'Agarwal', 'Fernandes', 'Gill', 'Bhat', 'Chauhan', 'Yadav']
+CITIES = [('Mumbai', 'Maharashtra', '400'), ('Delhi', 'Delhi', '110'), ('Bengaluru', 'Karnataka', '560'),
+          ('Hyderabad', 'Telangana', '500'), ('Chennai', 'Tamil Nadu', '600'), ('Kolkata', 'West Bengal', '700'),
+          ('Pune', 'Maharashtra', '411'), ('Ahmedabad', 'Gujarat', '380'), ('Jaipur', 'Rajasthan', '302'),
+          ('Lucknow', 'Uttar Pradesh', '226'), ('Kochi', 'Kerala', '682'), ('Chandigarh', 'Punjab', '160'),
+          ('Indore', 'Madhya Pradesh', '452'), ('Bhubaneswar', 'Odisha', '751'), ('Guwahati', 'Assam', '781')]
+STREETS = ['MG Road', 'Station Road', 'Gandhi Nagar', 'Nehru Street', 'Park Street', 'Lake View Road',
+           'Temple Road', 'Market Lane', 'Civil Lines', 'Church Street']
+PAYMENT_METHODS = [('COD', 35), ('UPI', 40), ('Card', 12), ('NetBanking', 5), ('Wallet', 8)]
+
+
+def dataset_counts(scale, categories=None):
+    return {
+        'categories': categories or min(len(AGE_GROUPS) * len(SEGMENTS), 8 * max(1, math.ceil(math.sqrt(scale)))),
+        'products': int(PRODUCTS_PER_SCALE * scale),
+        'users': int(USERS_PER_SCALE * scale),
+    }
+
+
+def password_hash(password, seed):
+    """A Werkzeug-compatible scrypt hash with a seed-derived salt, so reruns are byte-identical"""
+    n, r, p = 2 ** 15, 8, 1
+    salt = hashlib.sha256(f'dataset-salt:{seed}'.encode()).hexdigest()[:16]
+    digest = hashlib.scrypt(password.encode(), salt=salt.encode(), n=n, r=r, p=p, maxmem=132 * n * r * p)
+    return f'scrypt:{n}:{r}:{p}${salt}${digest.hex()}'
+
+
+def generate_categories(rng, count):
+    combos = [(age, segment) for segment in SEGMENTS for age in AGE_GROUPS]
+    rows = []
+    for category_id, ((label, age_range, _, _), segment) in enumerate(combos[:count], start=1):
+        rows.append({
+            'id': category_id,
+            'name': f'{label} {segment}',
+            'age_group': age_range,
+            'description': f'{segment} for {label.lower()} ({age_range})',
+        })
+    return rows
+
+
+def generate_products(rng, count, categories, end_date):
+    age_by_range = {age[1]: age for age in AGE_GROUPS}
+    rows = []
+    for product_id in range(1, count + 1):
+        category = categories[(product_id - 1) % len(categories)]
+        _, _, sizes, garments = age_by_range[category['age_group']]
+        garment = rng.choice(garments)
+        fabric, multiplier = rng.choice(FABRICS)
+        pattern = rng.choice(PATTERNS)
+        price = round(GARMENT_BASE_PRICE[garment] * multiplier * rng.uniform(0.8, 1.3) / 10) * 10 - 1
+        discounted = rng.random() < 0.6
+        size_count = rng.randint(2, len(sizes))
+        rows.append({
+            'id': product_id,
+            'sku': f'GEN-{product_id:08d}',
+            'name': f'{pattern} {fabric} {garment}',
+            'description': f'{pattern} {garment.lower()} in {fabric.lower()}. Made in India.',
+            'price': float(price),
+            'original_price': float(round(price * rng.uniform(1.2, 1.8) / 10) * 10 - 1) if discounted else None,
+            'category_id': category['id'],
+            'stock': rng.randint(0, 300),
+            'size': ', '.join(sizes[:size_count]),
+            'color': ', '.join(rng.sample(COLORS, rng.randint(1, 3))),
+            'material': fabric,
+            'brand': rng.choice(BRANDS),
+            'image_url': f'/static/images/products/{product_id}.jpg',
+            'is_featured': rng.random() < 0.02,
+            'rating': round(rng.triangular(2.5, 5.0, 4.3), 1),
+            'created_at': end_date - timedelta(days=rng.randint(0, 1500)),
+        })
+    return rows
+
+
+def generate_users(rng, count, password, end_date, years):
+    rows = []
+    for user_id in range(1, count + 1):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        city, state, pin_prefix = rng.choice(CITIES)
+        rows.append({
+            'id': user_id,
+            'name': f'{first} {last}',
+            'email': f'{first.lower()}.{last.lower()}.{user_id}@example.in',
+            'password': password,
+            'phone': f'{rng.choice("6789")}{rng.randint(0, 999999999):09d}',
+            'address': f'{rng.randint(1, 999)}, {rng.choice(STREETS)}, {city}, {state} {pin_prefix}{rng.randint(0, 999):03d}',
+            'created_at': end_date - timedelta(days=years * 365 + rng.randint(0, 365)),
+        })
+    return rows
+
+
+def orders_for_user(seed, user_id):
+    """Number of orders a user has placed (Pareto-skewed, at least 0)"""
+    rng = random.Random(f'{seed}:orders:{user_id}')
+    return min(int(rng.paretovariate(ORDERS_PARETO_ALPHA)) - 1 + (rng.random() < 0.7), MAX_ORDERS_PER_USER)
+
+
+def popularity(seed, product_count):
+    """Cumulative Zipf weights over a seed-shuffled product ranking"""
+    ranking = list(range(1, product_count + 1))
+    random.Random(f'{seed}:ranking').shuffle(ranking)
+    cum_weights = list(itertools.accumulate(1.0 / (rank ** PRODUCT_ZIPF_EXPONENT) for rank in range(1, product_count + 1)))
+    return ranking, cum_weights
+
+
+def generate_user_activity(task):
+    """Worker: generate and insert orders, order items and carts for a user id range"""
+    (url, seed, first_user, last_user, first_order_id, order_counts,
+     products, end_date, years) = task
+    ranking, cum_weights = popularity(seed, len(products))
+    total = cum_weights[-1]
+    span_seconds = years * 365 * 86400
+
+    def pick(rng):
+        return ranking[bisect.bisect(cum_weights, rng.random() * total)]
+
+    engine = _engine(url)
+    orders, items, carts = [], [], []
+    order_id = first_order_id
+    written = {'orders': 0, 'order_items': 0, 'carts': 0}
+
+    def flush(force=False):
+        if not force and len(items) < CHUNK_SIZE:
+            return
+        with engine.begin() as connection:
+            for table, rows, key in ((Order, orders, 'orders'), (OrderItem, items, 'order_items'), (Cart, carts, 'carts')):
+                if rows:
+                    connection.execute(insert(table), rows)
+                    written[key] += len(rows)
+                    rows.clear()
+
+    for user_id, order_count in zip(range(first_user, last_user + 1), order_counts):
+        rng = random.Random(f'{seed}:user:{user_id}')
+        city, state, pin_prefix = rng.choice(CITIES)
+        shipping_address = f'{rng.randint(1, 999)}, {rng.choice(STREETS)}, {city}, {state} {pin_prefix}{rng.randint(0, 999):03d}'
+        timestamps = sorted(end_date - timedelta(seconds=rng.randint(0, span_seconds)) for _ in range(order_count))
+        for created_at in timestamps:
+            lines = {}
+            for _ in range(rng.randint(1, MAX_ITEMS_PER_ORDER)):
+                product_id = pick(rng)
+                sizes = products[product_id]['size'].split(', ')
+                key = (product_id, rng.choice(sizes))
+                lines[key] = lines.get(key, 0) + rng.choice((1, 1, 1, 2, 3))
+            total_amount = 0.0
+            for n, ((product_id, size), quantity) in enumerate(lines.items()):
+                price = products[product_id]['price']
+                total_amount += price * quantity
+                items.append({
+                    'id': order_id * ID_STRIDE + n, 'order_id': order_id, 'product_id': product_id,
+                    'quantity': quantity, 'price': price, 'size': size,
+                })
+            age_days = (end_date - created_at).days
+            orders.append({
+                'id': order_id, 'user_id': user_id, 'total_amount': round(total_amount, 2),
+                'status': 'Delivered' if age_days > 14 else rng.choice(('Pending', 'Confirmed', 'Shipped')),
+                'payment_method': rng.choices([m for m, _ in PAYMENT_METHODS], [w for _, w in PAYMENT_METHODS])[0],
+                'shipping_address': shipping_address, 'created_at': created_at,
+            })
+            order_id += 1
+
+        if rng.random() < CART_PROBABILITY:
+            seen = set()
+            for n in range(rng.randint(1, 4)):
+                product_id = pick(rng)
+                size = rng.choice(products[product_id]['size'].split(', '))
+                if (product_id, size) in seen:
+                    continue
+                seen.add((product_id, size))
+                carts.append({
+                    'id': user_id * ID_STRIDE + n, 'user_id': user_id, 'product_id': product_id,
+                    'quantity': rng.randint(1, 3), 'size': size,
+                    'added_at': end_date - timedelta(seconds=rng.randint(0, 30 * 86400)),
+                })
+        flush()
+    flush(force=True)
+    engine.dispose()
+    return written
+
+
+def _engine(url):
+    connect_args = {'timeout': 120} if url.startswith('sqlite') else {}
+    return create_engine(url, connect_args=connect_args)
+
+
+def _insert_chunks(connection, model, rows):
+    for start in range(0, len(rows), CHUNK_SIZE):
+        connection.execute(insert(model), rows[start:start + CHUNK_SIZE])
+
+
+def generate(app, scale=1, seed=DEFAULT_SEED, years=3, end_date=DEFAULT_END_DATE,
+             processes=None, categories=None, password=DEFAULT_PASSWORD, fresh=False, progress=None):
+    """Write a synthetic dataset into the app's database; returns row counts"""
+    progress = progress or (lambda message: None)
+    counts = dataset_counts(scale, categories)
+    rng = random.Random(f'{seed}:catalog')
+    started = time.perf_counter()
+
+    with app.app_context():
+        if fresh:
+            db.drop_all()
+        db.create_all()
+        if db.session.scalar(select(func.count()).select_from(Product)) or \
+                db.session.scalar(select(func.count()).select_from(User)):
+            raise RuntimeError('database already has data; pass fresh=True (--fresh) to replace it')
+        engine = db.engine
+        url = engine.url.render_as_string(hide_password=False)
+        db.session.remove()
+
+    category_rows = generate_categories(rng, counts['categories'])
+    product_rows = generate_products(rng, counts['products'], category_rows, end_date)
+    user_rows = generate_users(rng, counts['users'], password_hash(password, seed), end_date, years)
+    with engine.begin() as connection:
+        _insert_chunks(connection, Category, category_rows)
+        _insert_chunks(connection, Product, product_rows)
+        _insert_chunks(connection, User, user_rows)
+    progress(f"catalog and users written in {time.perf_counter() - started:.1f}s")
+
+    order_counts = [orders_for_user(seed, user_id) for user_id in range(1, counts['users'] + 1)]
+    products = {row['id']: {'price': row['price'], 'size': row['size']} for row in product_rows}
+    del product_rows, user_rows
+
+    processes = processes or min(os.cpu_count() or 1, max(1, counts['users'] // 2000))
+    shard_size = math.ceil(counts['users'] / processes)
+    tasks = []
+    next_order_id = 1
+    for first_user in range(1, counts['users'] + 1, shard_size):
+        last_user = min(first_user + shard_size - 1, counts['users'])
+        shard_counts = order_counts[first_user - 1:last_user]
+        tasks.append((url, seed, first_user, last_user, next_order_id, shard_counts, products, end_date, years))
+        next_order_id += sum(shard_counts)
+
+    totals = {'orders': 0, 'order_items': 0, 'carts': 0}
+    if len(tasks) == 1:
+        results = [generate_user_activity(tasks[0])]
+    else:
+        with multiprocessing.get_context('spawn').Pool(len(tasks)) as pool:
+            results = pool.map(generate_user_activity, tasks)
+    for written in results:
+        for key, value in written.items():
+            totals[key] += value
+
+    with engine.begin() as connection:
+        cart_store.backfill_summaries(connection)
+        if engine.dialect.name == 'sqlite':
+            connection.exec_driver_sql('ANALYZE')
+    engine.dispose()
+
+    counts.update(totals)
+    counts['seconds'] = round(time.perf_counter() - started, 2)
+    progress(f"order history written by {len(tasks)} process(es) in {counts['seconds']:.1f}s")
+    return counts
+
+
+def schema_key():
+    """Short hash of the DDL for db.metadata, so cached datasets follow model changes"""
+    key = hashlib.sha256()
+    dialect = sqlite.dialect()
+    for table in db.metadata.sorted_tables:
+        key.update(str(CreateTable(table).compile(dialect=dialect)).encode())
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            key.update(str(CreateIndex(index).compile(dialect=dialect)).encode())
+    return key.hexdigest()[:12]
+
+
+def ensure_dataset(scale=1, seed=DEFAULT_SEED, directory=None):
+    """Path of a cached SQLite dataset for (scale, seed) and the current schema, generating it on first use"""
+    from app import create_app
+
+    directory = directory or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'datasets')
+    os.makedirs(directory, exist_ok=True)
+    schema = schema_key()
+    prefix = f'dataset-s{scale}-seed{seed}-'
+    path = os.path.join(directory, f'{prefix}{schema}.db')
+    manifest = path + '.json'
+    if os.path.exists(path) and os.path.exists(manifest):
+        return path
+    # A half-written file for this schema, and datasets built for older ones
+    for name in os.listdir(directory):
+        if name.startswith(prefix):
+            os.remove(os.path.join(directory, name))
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}', 'SQL_STATS_ENABLED': False})
+    counts = generate(app, scale=scale, seed=seed)
+    with open(manifest, 'w') as fh:
+        json.dump({'scale': scale, 'seed': seed, 'schema': schema, 'counts': counts}, fh, indent=2)
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate a reproducible synthetic store dataset')
+    parser.add_argument('--scale', type=float, default=1, help='scale factor (1 = 1,000 products, 500 users)')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--years', type=int, default=3, help='years of order history')
+    parser.add_argument('--end-date', default=DEFAULT_END_DATE.date().isoformat(), help='last day of order history')
+    parser.add_argument('--categories', type=int, help='number of categories (default grows with scale)')
+    parser.add_argument('--processes', type=int, help='worker processes for order history')
+    parser.add_argument('--fresh', action='store_true', help='drop and recreate all tables first')
+    args = parser.parse_args(argv)
+
+    from app import create_app
+
+    end_date = datetime.fromisoformat(args.end_date).replace(hour=23, minute=59, second=59)
+    counts = generate(
+        create_app({'SQL_STATS_ENABLED': False}), scale=args.scale, seed=args.seed, years=args.years,
+        end_date=end_date, processes=args.processes, categories=args.categories, fresh=args.fresh,
+        progress=lambda message: print(f"  {message}", file=sys.stderr),
+    )
+    print("✅ Dataset generated successfully!")
+    for key in ('categories', 'products', 'users', 'orders', 'order_items', 'carts'):
+        print(f"✅ {counts[key]:>10,} {key.replace('_', ' ')}")
+    return counts
+
+
+if __name__ == '__main__':
+    main()
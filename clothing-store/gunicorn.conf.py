@@ -0,0 +1,104 @@
+"""
+Gunicorn settings for the Indian Clothing Store
+
+Every setting can be overridden from the environment; defaults are sized from
+the CPU count of the host.
+
+    WEB_CONCURRENCY            worker processes        (2 x CPUs + 1)
+    GUNICORN_THREADS           threads per worker      (2; >1 selects the gthread worker)
+    GUNICORN_PRELOAD           load the app before forking, sharing its memory
+                               copy-on-write between workers (1)
+    GUNICORN_MAX_REQUESTS      recycle a worker after this many requests (1000)
+    GUNICORN_MAX_REQUESTS_JITTER  random spread so workers don't all recycle together (100)
+    GUNICORN_TIMEOUT           seconds before a silent worker is killed (30)
+    GUNICORN_GRACEFUL_TIMEOUT  seconds a worker gets to finish in-flight requests
+                               on reload/shutdown (30)
+    GUNICORN_KEEPALIVE         seconds to hold idle keep-alive connections (5)
+    GUNICORN_BIND              listen address (0.0.0.0:$PORT, PORT defaults to 5000)
+    PROMETHEUS_MULTIPROC_DIR   where workers share /metrics samples
+                               ($TMPDIR/clothing-store-metrics, emptied at start-up)
+    RATE_LIMIT_STORAGE         SQLite file where workers share rate-limit buckets
+                               ($TMPDIR/clothing-store-rate-limit.db, emptied at start-up)
+
+Graceful reload: `kill -HUP <master pid>` starts new workers and lets the old
+ones drain for GUNICORN_GRACEFUL_TIMEOUT. With preload enabled the master holds
+the loaded code, so deploy new code with `kill -USR2 <master pid>` (start a new
+master) followed by `kill -QUIT <old master pid>`, or set GUNICORN_PRELOAD=0 to
+have HUP pick up new code.
+"""
+
+import glob
+import multiprocessing
+import os
+import tempfile
+
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def _env_bool(name, default):
+    return os.environ.get(name, '1' if default else '0').lower() in ('1', 'true', 'yes', 'on')
+
+
+cpu_count = multiprocessing.cpu_count()
+
+bind = os.environ.get('GUNICORN_BIND', f"0.0.0.0:{os.environ.get('PORT', '5000')}")
+workers = _env_int('WEB_CONCURRENCY', cpu_count * 2 + 1)
+threads = _env_int('GUNICORN_THREADS', 2)
+worker_class = 'gthread' if threads > 1 else 'sync'
+preload_app = _env_bool('GUNICORN_PRELOAD', True)
+max_requests = _env_int('GUNICORN_MAX_REQUESTS', 1000)
+max_requests_jitter = _env_int('GUNICORN_MAX_REQUESTS_JITTER', 100)
+timeout = _env_int('GUNICORN_TIMEOUT', 30)
+graceful_timeout = _env_int('GUNICORN_GRACEFUL_TIMEOUT', 30)
+keepalive = _env_int('GUNICORN_KEEPALIVE', 5)
+
+wsgi_app = 'wsgi:application'
+
+# Must be set before prometheus_client is imported by the app
+prometheus_dir = os.environ.setdefault(
+    'PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'clothing-store-metrics')
+)
+# With preload_app the app (and its unlabelled metrics, which open their
+# files on import) is loaded before on_starting runs
+os.makedirs(prometheus_dir, exist_ok=True)
+# Read by config.py, so also before the app is imported
+rate_limit_storage = os.environ.setdefault(
+    'RATE_LIMIT_STORAGE', os.path.join(tempfile.gettempdir(), 'clothing-store-rate-limit.db')
+)
+accesslog = '-'
+errorlog = '-'
+
+
+def on_starting(server):
+    """Start every deployment with empty metric files and rate-limit buckets"""
+    os.makedirs(prometheus_dir, exist_ok=True)
+    for path in glob.glob(os.path.join(prometheus_dir, '*.db')):
+        os.remove(path)
+    for path in glob.glob(rate_limit_storage + '*'):
+        os.remove(path)
+
+
+def child_exit(server, worker):
+    """Drop the in-flight gauge samples of a worker that has exited"""
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid, prometheus_dir)
+
+
+def post_fork(server, worker):
+    """Drop any database connections inherited from the preloaded master"""
+    from wsgi import application
+    from models import db
+
+    with application.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+    routing = application.extensions.get('db_routing')
+    if routing is not None:
+        routing.read_engine.dispose(close=False)
+    shard_set = application.extensions.get('shards')
+    if shard_set is not None:
+        for engine in shard_set.engines:
+            engine.dispose(close=False)
@@ -0,0 +1,157 @@
+"""
+Per-request memory allocation tracking with tracemalloc
+
+When MEMORY_TRACKING_ENABLED is on, a MEMORY_SAMPLE_RATE fraction of requests
+runs with tracemalloc tracing. For each tracked request we record the peak
+traced memory in a per-endpoint histogram (http_request_peak_memory_bytes,
+served by /metrics) and, if it exceeds MEMORY_BUDGET_BYTES, log the endpoint,
+peak and top MEMORY_TOP_N allocation sites to the ``clothing_store.memory``
+logger. tracemalloc is process-wide, so only one request per process is
+traced at a time; concurrent picks are skipped. Under the gthread worker the
+other threads keep allocating while a request is traced and their memory lands
+in its peak too: such observations carry ``shared="true"`` (and ``"shared":
+true`` in the log line) and overstate the endpoint; read the
+``shared="false"`` series for per-endpoint numbers.
+
+measure_peak() is the building block for memory ceiling assertions in tests.
+"""
+
+import json
+import logging
+import random
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+from flask import current_app, g, request
+from prometheus_client import Histogram
+
+logger = logging.getLogger('clothing_store.memory')
+
+PEAK_MEMORY = Histogram(
+    'http_request_peak_memory_bytes', 'Peak traced memory of sampled requests by endpoint',
+    ['endpoint', 'shared'],
+    buckets=(256e3, 1e6, 4e6, 16e6, 64e6, 256e6, 1e9),
+)
+
+_trace_lock = threading.Lock()
+# requests in flight in this process, and whether any overlapped the trace
+_state_lock = threading.Lock()
+_state = {'in_flight': 0, 'tracing': False, 'shared': False}
+
+
+def init_app(app):
+    if not app.config.get('MEMORY_TRACKING_ENABLED', False):
+        return
+
+    app.before_request(_enter)
+    app.before_request(_maybe_start)
+    app.after_request(_record)
+    app.teardown_request(_stop)
+    app.teardown_request(_leave)
+
+
+@contextmanager
+def measure_peak(frames=1, snapshot_over=0):
+    """Trace allocations inside the block
+
+    Yields a dict that is filled on exit with 'peak' (bytes above the starting
+    level) and 'snapshot' (a tracemalloc snapshot, only when peak exceeds
+    ``snapshot_over``; otherwise None).
+    """
+    result = {}
+    owner = not tracemalloc.is_tracing()
+    if owner:
+        tracemalloc.start(frames)
+    tracemalloc.reset_peak()
+    baseline = tracemalloc.get_traced_memory()[0]
+    try:
+        yield result
+        result['peak'] = tracemalloc.get_traced_memory()[1] - baseline
+        result['snapshot'] = tracemalloc.take_snapshot() if result['peak'] > snapshot_over else None
+    finally:
+        if owner:
+            tracemalloc.stop()
+
+
+def top_sites(snapshot, limit):
+    """The ``limit`` source lines holding the most traced memory"""
+    snapshot = snapshot.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    ))
+    return [
+        {'site': f'{stat.traceback[0].filename}:{stat.traceback[0].lineno}', 'bytes': stat.size, 'count': stat.count}
+        for stat in snapshot.statistics('lineno')[:limit]
+    ]
+
+
+def _enter():
+    g.memory_counted = True
+    with _state_lock:
+        _state['in_flight'] += 1
+        if _state['tracing']:
+            _state['shared'] = True
+
+
+def _leave(exc):
+    if g.pop('memory_counted', False):
+        with _state_lock:
+            _state['in_flight'] -= 1
+
+
+def _end_trace(trace):
+    try:
+        trace.__exit__(None, None, None)
+    finally:
+        with _state_lock:
+            _state['tracing'] = False
+            shared = _state['shared']
+        _trace_lock.release()
+    return shared
+
+
+def _maybe_start():
+    if request.endpoint in (None, 'static', 'metrics'):
+        return
+    if random.random() >= current_app.config.get('MEMORY_SAMPLE_RATE', 0.01):
+        return
+    if tracemalloc.is_tracing() or not _trace_lock.acquire(blocking=False):
+        return
+    with _state_lock:
+        _state['tracing'] = True
+        _state['shared'] = _state['in_flight'] > 1
+    g.memory_trace = measure_peak(
+        current_app.config.get('MEMORY_TRACEBACK_FRAMES', 1),
+        snapshot_over=current_app.config.get('MEMORY_BUDGET_BYTES', 32 * 1024 * 1024),
+    )
+    g.memory_result = g.memory_trace.__enter__()
+
+
+def _record(response):
+    trace = g.pop('memory_trace', None)
+    if trace is None:
+        return response
+    result = g.pop('memory_result')
+    shared = _end_trace(trace)
+
+    endpoint = request.endpoint
+    PEAK_MEMORY.labels(endpoint, 'true' if shared else 'false').observe(result['peak'])
+    budget = current_app.config.get('MEMORY_BUDGET_BYTES', 32 * 1024 * 1024)
+    if result['snapshot'] is not None:
+        logger.warning(json.dumps({
+            'route': endpoint,
+            'peak_bytes': result['peak'],
+            'budget_bytes': budget,
+            'shared': shared,
+            'top_sites': top_sites(result['snapshot'], current_app.config.get('MEMORY_TOP_N', 10)),
+        }))
+    return response
+
+
+def _stop(exc):
+    # after_request did not run (e.g. an error escaped); stop tracing anyway
+    trace = g.pop('memory_trace', None)
+    if trace is not None:
+        g.pop('memory_result', None)
+        _end_trace(trace)
@@ -0,0 +1,117 @@
+"""
+Prometheus metrics for every Flask endpoint, served at /metrics
+
+For each endpoint we record a request counter by method and status code, a
+total latency histogram, a latency histogram split into db / template / other
+time, and an in-flight gauge.
+
+Under gunicorn each worker writes its samples to memory-mapped files in
+PROMETHEUS_MULTIPROC_DIR (set up by gunicorn.conf.py) and /metrics sums them
+across all workers. Without that variable the metrics are per-process.
+"""
+
+import os
+import time
+
+from flask import Response, g, request
+from flask import before_render_template, template_rendered
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+    generate_latest, multiprocess,
+)
+
+import query_stats
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REQUESTS = Counter(
+    'http_requests_total', 'HTTP requests by endpoint, method and status code',
+    ['endpoint', 'method', 'status'],
+)
+LATENCY = Histogram(
+    'http_request_duration_seconds', 'Total request latency by endpoint',
+    ['endpoint'], buckets=LATENCY_BUCKETS,
+)
+PHASE_LATENCY = Histogram(
+    'http_request_phase_duration_seconds', 'Request latency split into db, template and other time',
+    ['endpoint', 'phase'], buckets=LATENCY_BUCKETS,
+)
+IN_FLIGHT = Gauge(
+    'http_requests_in_flight', 'Requests currently being handled by endpoint',
+    ['endpoint'], multiprocess_mode='livesum',
+)
+
+UNMATCHED = 'unmatched'
+
+
+def init_app(app):
+    if not app.config.get('METRICS_ENABLED', True):
+        return
+
+    app.before_request(_start_timer)
+    app.after_request(_record_request)
+    app.teardown_request(_finish_in_flight)
+    before_render_template.connect(_template_started, app)
+    template_rendered.connect(_template_finished, app)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
+
+
+def metrics_view():
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
+
+
+def _endpoint():
+    return request.endpoint or UNMATCHED
+
+
+def _start_timer():
+    if request.endpoint == 'metrics':
+        return
+    g.metrics_start = time.perf_counter()
+    g.metrics_template_seconds = 0.0
+    IN_FLIGHT.labels(_endpoint()).inc()
+
+
+def _record_request(response):
+    start = g.get('metrics_start')
+    if start is None:
+        return response
+
+    endpoint = _endpoint()
+    total = time.perf_counter() - start
+    stats = query_stats.current()
+    db_seconds = stats.seconds if stats is not None else 0.0
+    template_seconds = g.metrics_template_seconds
+
+    REQUESTS.labels(endpoint, request.method, str(response.status_code)).inc()
+    LATENCY.labels(endpoint).observe(total)
+    PHASE_LATENCY.labels(endpoint, 'db').observe(db_seconds)
+    PHASE_LATENCY.labels(endpoint, 'template').observe(template_seconds)
+    PHASE_LATENCY.labels(endpoint, 'other').observe(max(total - db_seconds - template_seconds, 0.0))
+    return response
+
+
+def _finish_in_flight(exc):
+    if g.pop('metrics_start', None) is not None:
+        IN_FLIGHT.labels(_endpoint()).dec()
+
+
+def _template_started(sender, template, context, **extra):
+    # Lazy loads fired while rendering are DB time, not template time
+    stats = query_stats.current()
+    g.metrics_template_start = (time.perf_counter(), stats.seconds if stats is not None else 0.0)
+
+
+def _template_finished(sender, template, context, **extra):
+    started = g.pop('metrics_template_start', None)
+    if started is None or 'metrics_template_seconds' not in g:
+        return
+    start, db_seconds_at_start = started
+    stats = query_stats.current()
+    db_seconds = (stats.seconds if stats is not None else 0.0) - db_seconds_at_start
+    g.metrics_template_seconds += time.perf_counter() - start - db_seconds
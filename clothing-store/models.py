@@ -0,0 +1,108 @@
+"""
+Database models for the Indian Clothing Store
+The SQLAlchemy extension is created unbound and attached to an app by create_app()
+"""
+
+from flask_sqlalchemy import SQLAlchemy
+from datetime import datetime
+
+from db_routing import RoutingSession
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+# Database Models
+class User(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    email = db.Column(db.String(120), unique=True, nullable=False)
+    password = db.Column(db.String(200), nullable=False)
+    phone = db.Column(db.String(15))
+    address = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    orders = db.relationship('Order', backref='user', lazy=True)
+
+class Category(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), nullable=False)
+    age_group = db.Column(db.String(50), nullable=False)
+    description = db.Column(db.Text)
+    products = db.relationship('Product', backref='category', lazy=True)
+
+class Product(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    sku = db.Column(db.String(64), unique=True, index=True)  # Stable supplier key used by catalog_import
+    name = db.Column(db.String(200), nullable=False)
+    description = db.Column(db.Text)
+    price = db.Column(db.Float, nullable=False)
+    original_price = db.Column(db.Float)
+    category_id = db.Column(db.Integer, db.ForeignKey('category.id'), nullable=False, index=True)
+    stock = db.Column(db.Integer, default=0)
+    size = db.Column(db.String(50))  # S, M, L, XL, XXL, or age-based sizes
+    color = db.Column(db.String(50))
+    material = db.Column(db.String(100))
+    brand = db.Column(db.String(100))
+    image_url = db.Column(db.String(500))
+    is_featured = db.Column(db.Boolean, default=False)
+    rating = db.Column(db.Float, default=0.0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class Cart(db.Model):
+    __table_args__ = (
+        # One line per product and size; cart_store.add_item upserts against it
+        db.Index('uq_cart_user_product_size', 'user_id', 'product_id', 'size', unique=True),
+        # Walked oldest-first by the cart_retention sweeper
+        db.Index('ix_cart_added_at', 'added_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    quantity = db.Column(db.Integer, default=1)
+    size = db.Column(db.String(50), default='')  # '' when the product has no size
+    added_at = db.Column(db.DateTime, default=datetime.utcnow)  # reset whenever the line is added to or changed
+    product = db.relationship('Product', backref='cart_items')
+
+class CartSummary(db.Model):
+    """Item count and subtotal of a user's cart, kept current by cart_summary.py"""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    item_count = db.Column(db.Integer, nullable=False, default=0)
+    subtotal = db.Column(db.Float, nullable=False, default=0.0)
+    version = db.Column(db.Integer, nullable=False, default=0)  # bumped on every change
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class Order(db.Model):
+    __table_args__ = (
+        # Order history pages seek on it (order_history.py)
+        db.Index('ix_order_user_created', 'user_id', 'created_at', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    total_amount = db.Column(db.Float, nullable=False)
+    status = db.Column(db.String(50), default='Pending')  # Pending, Confirmed, Shipped, Delivered
+    payment_method = db.Column(db.String(50))
+    shipping_address = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    order_items = db.relationship('OrderItem', backref='order', lazy=True)
+
+class OrderItem(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False, index=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    price = db.Column(db.Float, nullable=False)
+    size = db.Column(db.String(50))
+    product = db.relationship('Product')
+
+class OrderArchiveMonth(db.Model):
+    """A month of orders moved out of the hot tables into its own file by order_archive.py"""
+    month = db.Column(db.String(7), primary_key=True)  # YYYY-MM
+    orders = db.Column(db.Integer, nullable=False, default=0)
+    items = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class OrderArchiveUser(db.Model):
+    """Archived months holding a user's orders, so history pages only open those files"""
+    user_id = db.Column(db.Integer, primary_key=True)
+    month = db.Column(db.String(7), primary_key=True)
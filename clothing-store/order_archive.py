@@ -0,0 +1,266 @@
+"""
+Cold archive of old orders, one SQLite file per month
+
+Orders placed before the month that contains ORDER_ARCHIVE_AFTER_DAYS ago
+are moved, whole months at a time, out of the hot order / order_item tables
+into ORDER_ARCHIVE_DIR/orders-YYYY-MM.db (same tables and indexes). The hot
+tables then only hold recent orders, which keeps them and their indexes in
+the page cache.
+
+A month is moved in two steps so no order is ever lost or shown twice: its
+rows are copied into the month's file and committed there, then deleted from
+the hot tables in the same transaction that records the month in
+order_archive_month (totals for reports) and order_archive_user (which users
+have orders in it). Readers only open files listed there. Re-running is
+safe: copies are INSERT OR REPLACE, and only rows that were copied are
+deleted.
+
+order_history reads through an OrderArchive (``app.extensions['order_archive']``),
+so My Orders pages continue from the hot tables into the user's archived
+months and monthly_sales() reports cover both. Orders split over shards
+(shards.py) are not archived; archive() refuses to run with SHARD_COUNT set.
+
+Run it from cron, e.g. monthly:
+
+    python order_archive.py archive --dry-run    # months and rows that would move
+    python order_archive.py archive              # move them
+    python order_archive.py report               # orders and revenue per month
+"""
+
+import argparse
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, func, literal, select
+from sqlalchemy.dialects.sqlite import insert
+
+import order_history
+from models import db, Order, OrderArchiveMonth, OrderArchiveUser, OrderItem
+
+MONTH_FORMAT = '%Y-%m'
+
+
+def month_bounds(month):
+    """First instants of ``month`` ('YYYY-MM') and of the month after it"""
+    start = datetime.strptime(month, MONTH_FORMAT)
+    return start, (start + timedelta(days=32)).replace(day=1)
+
+
+def _columns(table, prefix=''):
+    return ', '.join(f'{prefix}"{column.name}"' for column in table.columns)
+
+
+class ArchiveReport:
+    def __init__(self, boundary, dry_run=False):
+        self.boundary = boundary
+        self.dry_run = dry_run
+        self.months = []
+        self.held = []
+        self.orders = 0
+        self.started = time.perf_counter()
+
+    @property
+    def seconds(self):
+        return time.perf_counter() - self.started
+
+    def summary(self):
+        action = 'would archive' if self.dry_run else 'archived'
+        lines = [f"{action} {self.orders} orders placed before {self.boundary:%Y-%m-%d} "
+                 f"in {len(self.months)} months ({self.seconds:.2f}s)"]
+        lines += [f"  {month}: {orders} orders" for month, orders in self.months]
+        lines += [f"  {month}: kept hot, it holds the newest order or order item id" for month in self.held]
+        return '\n'.join(lines)
+
+
+class OrderArchive:
+    """Per-month archive files and read-only engines on them"""
+
+    def __init__(self, directory, sharded=False):
+        self.directory = directory
+        self.sharded = sharded
+        self._engines = {}
+        self._lock = threading.Lock()
+
+    def path(self, month):
+        return os.path.join(self.directory, f'orders-{month}.db')
+
+    def engine(self, month):
+        with self._lock:
+            engine = self._engines.get(month)
+            if engine is None:
+                engine = create_engine(f'sqlite:///file:{self.path(month)}?mode=ro&uri=true')
+                self._engines[month] = engine
+            return engine
+
+    def dispose(self):
+        with self._lock:
+            for engine in self._engines.values():
+                engine.dispose()
+            self._engines.clear()
+
+    # Reads
+
+    def user_months(self, session, user_id, before=None):
+        """Archived months with the user's orders, newest first, up to ``before``'s month"""
+        query = select(OrderArchiveUser.month).where(OrderArchiveUser.user_id == user_id)
+        if before is not None:
+            query = query.where(OrderArchiveUser.month <= before.strftime(MONTH_FORMAT))
+        return list(session.execute(query.order_by(OrderArchiveUser.month.desc())).scalars())
+
+    def execute(self, month, query):
+        with self.engine(month).connect() as connection:
+            return connection.execute(query).all()
+
+    def order_detail(self, session, user_id, order_id):
+        """(order row, [(item row, product name)]) for an archived order of the user, or None"""
+        for month in self.user_months(session, user_id):
+            orders = self.execute(month, select(Order.__table__).where(
+                Order.__table__.c.id == order_id, Order.__table__.c.user_id == user_id,
+            ))
+            if orders:
+                items = self.execute(month, select(OrderItem.__table__).where(
+                    OrderItem.__table__.c.order_id == order_id,
+                ).order_by(OrderItem.__table__.c.id))
+                names = order_history.product_names(session, {item.product_id for item in items})
+                return orders[0], [(item, names.get(item.product_id)) for item in items]
+        return None
+
+    # Archiving
+
+    def archive(self, engine, cutoff, dry_run=False):
+        """Move every whole month of orders placed before ``cutoff``'s month; returns an ArchiveReport"""
+        if engine.dialect.name != 'sqlite' or engine.url.database in (None, '', ':memory:'):
+            raise ValueError('order archiving needs the database in a SQLite file')
+        # Shards number their orders independently, so their months cannot share one file
+        if self.sharded:
+            raise ValueError('order archiving does not support sharded orders (SHARD_COUNT)')
+        boundary = cutoff.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        report = ArchiveReport(boundary, dry_run)
+        month_of = func.strftime('%Y-%m', Order.created_at)
+
+        with engine.connect() as connection:
+            months = connection.execute(
+                select(month_of, func.count()).where(Order.created_at < boundary)
+                .group_by(month_of).order_by(month_of)
+            ).all()
+            # SQLite hands out max(id) + 1; deleting the rows with the highest
+            # ids would let new orders reuse archived ids
+            newest = connection.execute(select(
+                select(month_of).where(Order.id == select(func.max(Order.id)).scalar_subquery())
+                .scalar_subquery(),
+                select(month_of).where(Order.id == select(OrderItem.order_id).order_by(OrderItem.id.desc())
+                                       .limit(1).scalar_subquery()).scalar_subquery(),
+            )).one()
+
+        for month, orders in months:
+            if month in newest:
+                report.held.append(month)
+                continue
+            report.months.append((month, orders))
+            report.orders += orders
+            if not dry_run:
+                totals = self._copy(engine.url.database, month)
+                with engine.begin() as connection:
+                    self._drop_hot(connection, month, totals)
+
+        if report.months and not dry_run:
+            with engine.begin() as connection:
+                connection.exec_driver_sql('ANALYZE "order"')
+                connection.exec_driver_sql('ANALYZE order_item')
+        return report
+
+    def _copy(self, hot_path, month):
+        """Copy the month's orders and items into its file; returns the file's totals"""
+        path = self.path(month)
+        os.makedirs(self.directory, exist_ok=True)
+        archive_engine = create_engine(f'sqlite:///{path}')
+        db.metadata.create_all(archive_engine, tables=[Order.__table__, OrderItem.__table__])
+        archive_engine.dispose()
+
+        start, end = (bound.strftime('%Y-%m-%d %H:%M:%S') for bound in month_bounds(month))
+        orders, items = _columns(Order.__table__), _columns(OrderItem.__table__)
+        connection = sqlite3.connect(path, isolation_level=None)
+        try:
+            connection.execute('ATTACH DATABASE ? AS hot', (hot_path,))
+            connection.execute('BEGIN')
+            connection.execute(
+                f'INSERT OR REPLACE INTO "order" ({orders}) SELECT {orders} FROM hot."order" '
+                f'WHERE created_at >= ? AND created_at < ?', (start, end),
+            )
+            connection.execute(
+                f'INSERT OR REPLACE INTO order_item ({items}) '
+                f'SELECT {_columns(OrderItem.__table__, "hot.order_item.")} FROM hot.order_item '
+                f'JOIN hot."order" ON hot."order".id = hot.order_item.order_id '
+                f'WHERE hot."order".created_at >= ? AND hot."order".created_at < ?', (start, end),
+            )
+            totals = connection.execute(
+                'SELECT COUNT(*), COALESCE(SUM(total_amount), 0), MAX(id), '
+                '(SELECT COUNT(*) FROM order_item) FROM "order"'
+            ).fetchone()
+            connection.execute('COMMIT')
+            connection.execute('DETACH DATABASE hot')
+        finally:
+            connection.close()
+        return dict(zip(('orders', 'revenue', 'max_id', 'items'), totals))
+
+    def _drop_hot(self, connection, month, totals):
+        """Delete the copied rows from the hot tables and record the month, in one transaction"""
+        start, end = month_bounds(month)
+        copied = select(Order.id).where(
+            Order.created_at >= start, Order.created_at < end, Order.id <= totals['max_id'],
+        )
+        connection.execute(
+            OrderArchiveUser.__table__.insert().prefix_with('OR IGNORE').from_select(
+                ['user_id', 'month'],
+                select(Order.user_id, literal(month)).where(Order.id.in_(copied)).distinct(),
+            )
+        )
+        connection.execute(OrderItem.__table__.delete().where(OrderItem.order_id.in_(copied)))
+        connection.execute(Order.__table__.delete().where(Order.id.in_(copied)))
+
+        stmt = insert(OrderArchiveMonth.__table__).values(
+            month=month, orders=totals['orders'], items=totals['items'], revenue=totals['revenue'],
+            archived_at=datetime.utcnow(),
+        )
+        connection.execute(stmt.on_conflict_do_update(index_elements=['month'], set_={
+            'orders': stmt.excluded.orders, 'items': stmt.excluded['items'],
+            'revenue': stmt.excluded.revenue, 'archived_at': stmt.excluded.archived_at,
+        }))
+
+
+def init_app(app):
+    directory = app.config.get('ORDER_ARCHIVE_DIR') or os.path.join(app.instance_path, 'archive')
+    app.extensions['order_archive'] = OrderArchive(directory, sharded='shards' in app.extensions)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Archive old orders into monthly SQLite files')
+    commands = parser.add_subparsers(dest='command', required=True)
+    archive = commands.add_parser('archive', help='move whole months of old orders out of the hot tables')
+    archive.add_argument('--days', type=int, help='archive horizon (default: ORDER_ARCHIVE_AFTER_DAYS)')
+    archive.add_argument('--dry-run', action='store_true', help='list the months that would be moved')
+    commands.add_parser('report', help='orders and revenue per month, hot and archived')
+    args = parser.parse_args(argv)
+
+    from app import create_app
+
+    app = create_app()
+    if args.command == 'archive' and app.extensions['order_archive'].sharded:
+        parser.error('orders are sharded (SHARD_COUNT): archiving is not supported')
+    with app.app_context():
+        if args.command == 'archive':
+            days = args.days if args.days is not None else app.config.get('ORDER_ARCHIVE_AFTER_DAYS', 365)
+            report = app.extensions['order_archive'].archive(
+                db.engine, datetime.utcnow() - timedelta(days=days), dry_run=args.dry_run,
+            )
+            print(report.summary())
+        else:
+            for month, orders, revenue in order_history.monthly_sales(db.session):
+                print(f'{month}  {orders:8d} orders  ₹{revenue:14,.2f}')
+
+
+if __name__ == '__main__':
+    main()
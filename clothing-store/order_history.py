@@ -0,0 +1,156 @@
+"""
+Order history reads
+
+A user's orders are listed newest first a page at a time with keyset
+pagination on (user_id, created_at, id): each page seeks into the
+ix_order_user_created index just past the last order of the previous page, so
+page 50 costs the same as page 1. A page is one query returning order
+summaries (item count and first item's name from correlated subqueries); the
+items of an order are only loaded when it is opened.
+
+Cursors are opaque URL-safe tokens of the last order's (created_at, id).
+
+Orders moved to monthly archive files by order_archive.py are read through the
+OrderArchive passed in as ``archive``: a page that the hot tables cannot fill
+continues into the user's archived months, newest first, opening only months
+the user has orders in.
+"""
+
+import base64
+import binascii
+from datetime import datetime
+
+from sqlalchemy import func, select, tuple_
+
+from models import Order, OrderArchiveMonth, OrderItem, Product
+
+
+class OrderSummary:
+    def __init__(self, id, created_at, status, total_amount, payment_method, item_count, first_item):
+        self.id = id
+        self.created_at = created_at
+        self.status = status
+        self.total_amount = total_amount
+        self.payment_method = payment_method
+        self.item_count = item_count or 0
+        self.first_item = first_item
+
+
+class Page:
+    def __init__(self, orders, next_cursor):
+        self.orders = orders
+        self.next_cursor = next_cursor
+
+
+def encode_cursor(created_at, order_id):
+    return base64.urlsafe_b64encode(f'{created_at.isoformat()}|{order_id}'.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(created_at, id) from a cursor; raises ValueError if it was not made by encode_cursor"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, order_id = raw.split('|')
+        return datetime.fromisoformat(created_at), int(order_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError(f'invalid order history cursor {cursor!r}')
+
+
+def summary_query(user_id, with_names=True):
+    """Summaries of the user's orders, newest first, for paging with .where() and .limit()
+
+    Without names, first_item is the first item's product id, for archive
+    files, which have no product table.
+    """
+    item_count = (
+        select(func.sum(OrderItem.quantity)).where(OrderItem.order_id == Order.id).scalar_subquery()
+    )
+    if with_names:
+        first_item = select(Product.name).join(OrderItem, OrderItem.product_id == Product.id)
+    else:
+        first_item = select(OrderItem.product_id)
+    first_item = first_item.where(OrderItem.order_id == Order.id).order_by(OrderItem.id).limit(1).scalar_subquery()
+    return (
+        select(Order.id, Order.created_at, Order.status, Order.total_amount, Order.payment_method,
+               item_count.label('item_count'), first_item.label('first_item'))
+        .where(Order.user_id == user_id)
+        .order_by(Order.created_at.desc(), Order.id.desc())
+    )
+
+
+def product_names(session, product_ids):
+    """{product id: name} for products referenced by archived orders"""
+    if not product_ids:
+        return {}
+    return dict(session.execute(select(Product.id, Product.name).where(Product.id.in_(product_ids))).all())
+
+
+def order_page(session, user_id, cursor=None, page_size=10, archive=None):
+    """One page of the user's order summaries after ``cursor`` (None: the newest)"""
+    query = summary_query(user_id)
+    after = None
+    if cursor is not None:
+        after = decode_cursor(cursor)
+        query = query.where(tuple_(Order.created_at, Order.id) < after)
+    # One extra row tells whether there is a next page
+    wanted = page_size + 1
+    rows = [OrderSummary(*row) for row in session.execute(query.limit(wanted)).all()]
+    if archive is not None:
+        rows = _with_archived(session, user_id, after, wanted, rows, archive)
+    orders = rows[:page_size]
+    next_cursor = encode_cursor(orders[-1].created_at, orders[-1].id) if len(rows) > page_size else None
+    return Page(orders, next_cursor)
+
+
+def _with_archived(session, user_id, after, wanted, rows, archive):
+    """Merge in summaries from archived months until no older month can change the page"""
+    from order_archive import month_bounds
+
+    query = summary_query(user_id, with_names=False)
+    if after is not None:
+        query = query.where(tuple_(Order.created_at, Order.id) < after)
+    query = query.limit(wanted)
+    archived = []
+    for month in archive.user_months(session, user_id, before=after[0] if after else None):
+        if len(rows) >= wanted and rows[wanted - 1].created_at >= month_bounds(month)[1]:
+            break
+        month_rows = [OrderSummary(*row) for row in archive.execute(month, query)]
+        archived += month_rows
+        rows = sorted(rows + month_rows, key=lambda order: (order.created_at, order.id), reverse=True)[:wanted]
+    names = product_names(session, {order.first_item for order in archived if order in rows})
+    for order in archived:
+        order.first_item = names.get(order.first_item)
+    return rows
+
+
+def order_detail(session, user_id, order_id, archive=None):
+    """(order, [(item, product name)]) for one of the user's orders, or None"""
+    order = session.execute(
+        select(Order).where(Order.id == order_id, Order.user_id == user_id)
+    ).scalar_one_or_none()
+    if order is None:
+        return archive.order_detail(session, user_id, order_id) if archive is not None else None
+    items = session.execute(
+        select(OrderItem, Product.name).join(Product, OrderItem.product_id == Product.id)
+        .where(OrderItem.order_id == order_id).order_by(OrderItem.id)
+    ).all()
+    return order, items
+
+
+def monthly_sales(session):
+    """[(YYYY-MM, orders, revenue)], oldest first, over hot and archived orders"""
+    if session.get_bind(mapper=Order.__mapper__).dialect.name == 'postgresql':
+        month = func.to_char(Order.created_at, 'YYYY-MM')
+    else:
+        month = func.strftime('%Y-%m', Order.created_at)
+    totals = {}
+    rows = session.execute(
+        select(month, func.count(), func.coalesce(func.sum(Order.total_amount), 0)).group_by(month)
+    ).all()
+    rows += session.execute(
+        select(OrderArchiveMonth.month, OrderArchiveMonth.orders, OrderArchiveMonth.revenue)
+    ).all()
+    for name, orders, revenue in rows:
+        previous = totals.get(name, (0, 0.0))
+        totals[name] = (previous[0] + orders, previous[1] + revenue)
+    return [(name, orders, round(revenue, 2)) for name, (orders, revenue) in sorted(totals.items())]
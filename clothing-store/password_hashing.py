@@ -0,0 +1,144 @@
+"""
+Password hashing off the request thread, with admission control
+
+Hashing is deliberately slow, so a burst of logins run inline would occupy
+every worker thread and stall catalog browsing. Hashes are computed instead
+in a small process pool (PASSWORD_HASH_WORKERS processes per web worker; 0
+hashes inline). At most PASSWORD_HASH_MAX_PENDING hash operations may be
+queued or running per web worker. A request that cannot get its result within
+PASSWORD_HASH_TIMEOUT seconds gets HashingBusy, and views turn that into a
+quick 503 instead of waiting behind the queue.
+
+PASSWORD_HASH_METHOD uses Werkzeug's method syntax (``scrypt:32768:8:1``,
+``pbkdf2:sha256:600000``); benchmarks/calibrate_password_hash.py picks one for
+a target latency on the production hardware. Stored hashes made with other
+parameters are replaced on the user's next successful login (needs_rehash).
+"""
+
+import atexit
+import multiprocessing
+import os
+import threading
+import time
+import weakref
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+
+from flask import current_app
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+SCRYPT_DEFAULTS = ('32768', '8', '1')  # n, r, p as used by Werkzeug
+
+_hashers = weakref.WeakSet()  # every app's hasher in this process, for shutdown_all()
+
+
+class HashingBusy(Exception):
+    """The hashing pool is saturated; retry shortly"""
+
+
+def normalize_method(method):
+    """Spell out Werkzeug's implicit defaults, so methods compare equal to stored hash prefixes"""
+    name, *params = method.split(':')
+    if name == 'scrypt':
+        params += SCRYPT_DEFAULTS[len(params):]
+    elif name == 'pbkdf2':
+        params = (params or ['sha256'])[:2]
+        if len(params) == 1:
+            params.append(str(DEFAULT_PBKDF2_ITERATIONS))
+    else:
+        raise ValueError(f'unsupported password hash method: {method!r}')
+    return ':'.join([name] + params)
+
+
+class PasswordHasher:
+    """Bounded hashing pool for one web worker process (``app.extensions['password_hashing']``)"""
+
+    def __init__(self, method, workers=1, max_pending=4, timeout=5.0):
+        self.method = normalize_method(method)
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+
+    def _pool(self):
+        # Created on first use in each process: a pool inherited across
+        # gunicorn's fork would belong to the master
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+                self._pid = os.getpid()
+            return self._executor
+
+    def run(self, func, *args):
+        deadline = time.monotonic() + self.timeout
+        if not self._slots.acquire(timeout=self.timeout):
+            raise HashingBusy()
+        if not self.workers:
+            try:
+                return func(*args)
+            finally:
+                self._slots.release()
+        try:
+            future = self._pool().submit(func, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        # The slot is held until the hash is done, not until we stop waiting:
+        # a running hash cannot be cancelled, so it still counts as pending
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=max(deadline - time.monotonic(), 0))
+        except FutureTimeout:
+            future.cancel()
+            raise HashingBusy()
+
+    def hash(self, password):
+        return self.run(generate_password_hash, password, self.method)
+
+    def verify(self, stored, password):
+        return self.run(check_password_hash, stored, password)
+
+    def needs_rehash(self, stored):
+        return stored.split('$', 1)[0] != self.method
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+
+def init_app(app):
+    hasher = app.extensions['password_hashing'] = PasswordHasher(
+        app.config.get('PASSWORD_HASH_METHOD', 'scrypt'),
+        workers=app.config.get('PASSWORD_HASH_WORKERS', 1),
+        max_pending=app.config.get('PASSWORD_HASH_MAX_PENDING', 4),
+        timeout=app.config.get('PASSWORD_HASH_TIMEOUT', 5.0),
+    )
+    # Otherwise the pool's processes keep the interpreter from exiting
+    atexit.register(hasher.shutdown)
+    _hashers.add(hasher)
+
+
+def shutdown_all():
+    """Shut down every hasher's pool in this process
+
+    For multiprocessing workers (e.g. the parallel test runner), which exit
+    without running atexit hooks but wait for their child processes first.
+    Pools are started again on next use.
+    """
+    for hasher in list(_hashers):
+        hasher.shutdown()
+
+
+def hash_password(password):
+    return current_app.extensions['password_hashing'].hash(password)
+
+
+def verify_password(stored, password):
+    return current_app.extensions['password_hashing'].verify(stored, password)
+
+
+def needs_rehash(stored):
+    return current_app.extensions['password_hashing'].needs_rehash(stored)
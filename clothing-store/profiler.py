@@ -0,0 +1,188 @@
+"""
+On-demand sampling CPU profiler for live requests
+
+When PROFILER_ENABLED is on, a request is profiled if it is picked by
+PROFILER_SAMPLE_RATE or carries a valid signed ``X-Profiler-Token`` header.
+While a profiled request runs, one background thread per process snapshots its
+Python stack every PROFILER_INTERVAL_MS (Flask, SQLAlchemy, Jinja and app
+frames alike). Stacks are folded into collapsed-stack lines
+(``frame;frame;frame count``) and appended per endpoint to
+PROFILER_OUTPUT_DIR/<endpoint>.<pid>.collapsed, ready for flamegraph.pl or
+speedscope.
+
+Admin endpoints (token required):
+    GET /admin/profiles             per-endpoint request and sample counts
+    GET /admin/profiles/<endpoint>  merged collapsed stacks for one endpoint
+
+Generate a token with:
+    python profiler.py token
+"""
+
+import glob
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+from flask import Response, abort, current_app, g, jsonify, request
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+
+TOKEN_HEADER = 'X-Profiler-Token'
+TOKEN_SALT = 'clothing-store-profiler'
+MAX_DEPTH = 128
+
+
+class Sampler:
+    """Background thread that samples the stacks of registered threads"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._active = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def start(self, ident):
+        with self._lock:
+            self._active[ident] = Counter()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='profiler-sampler', daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+
+    def stop(self, ident):
+        with self._lock:
+            return self._active.pop(ident, Counter())
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            with self._lock:
+                if not self._active:
+                    self._wakeup.clear()
+                    continue
+                frames = sys._current_frames()
+                for ident, stacks in self._active.items():
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        stacks[collapse(frame)] += 1
+            del frames
+            time.sleep(self.interval)
+
+
+def collapse(frame):
+    """Fold a frame and its callers into ``root;...;leaf`` using module:function names"""
+    names = []
+    while frame is not None and len(names) < MAX_DEPTH:
+        code = frame.f_code
+        names.append(f"{frame.f_globals.get('__name__', '?')}:{code.co_name}")
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+def init_app(app):
+    if not app.config.get('PROFILER_ENABLED', False):
+        return
+
+    output_dir = app.config.get('PROFILER_OUTPUT_DIR') or os.path.join(app.instance_path, 'profiles')
+    os.makedirs(output_dir, exist_ok=True)
+    app.extensions['profiler'] = {
+        'sampler': Sampler(app.config.get('PROFILER_INTERVAL_MS', 5) / 1000),
+        'output_dir': output_dir,
+    }
+
+    app.before_request(_maybe_start)
+    app.teardown_request(_finish)
+    app.add_url_rule('/admin/profiles', 'profiler_index', profiles_index)
+    app.add_url_rule('/admin/profiles/<endpoint>', 'profiler_stacks', profile_stacks)
+
+
+def make_token(secret_key):
+    return URLSafeTimedSerializer(secret_key, salt=TOKEN_SALT).dumps('profile')
+
+
+def token_is_valid(token):
+    if not token:
+        return False
+    serializer = URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt=TOKEN_SALT)
+    try:
+        serializer.loads(token, max_age=current_app.config.get('PROFILER_TOKEN_MAX_AGE', 3600))
+    except BadSignature:
+        return False
+    return True
+
+
+def _maybe_start():
+    if request.endpoint in (None, 'static', 'metrics', 'profiler_index', 'profiler_stacks'):
+        return
+    rate = current_app.config.get('PROFILER_SAMPLE_RATE', 0.0)
+    if random.random() < rate or token_is_valid(request.headers.get(TOKEN_HEADER)):
+        current_app.extensions['profiler']['sampler'].start(threading.get_ident())
+        g.profiler_endpoint = request.endpoint
+
+
+def _finish(exc):
+    endpoint = g.pop('profiler_endpoint', None)
+    if endpoint is None:
+        return
+    profiler = current_app.extensions['profiler']
+    stacks = profiler['sampler'].stop(threading.get_ident())
+    path = os.path.join(profiler['output_dir'], f'{endpoint}.{os.getpid()}.collapsed')
+    # One marker line per request so request counts survive the merge
+    with open(path, 'a') as fh:
+        fh.write('#request\n')
+        for stack, count in stacks.items():
+            fh.write(f'{stack} {count}\n')
+
+
+def read_profiles(output_dir, endpoint=None):
+    """Merge the per-worker collapsed files into {endpoint: {'requests': n, 'stacks': Counter}}"""
+    pattern = f'{endpoint}.*.collapsed' if endpoint else '*.collapsed'
+    profiles = {}
+    for path in glob.glob(os.path.join(output_dir, pattern)):
+        name = os.path.basename(path).rsplit('.', 2)[0]
+        profile = profiles.setdefault(name, {'requests': 0, 'stacks': Counter()})
+        with open(path) as fh:
+            for line in fh:
+                if line.startswith('#request'):
+                    profile['requests'] += 1
+                    continue
+                stack, _, count = line.rstrip('\n').rpartition(' ')
+                if stack:
+                    profile['stacks'][stack] += int(count)
+    return profiles
+
+
+def _require_token():
+    if not token_is_valid(request.headers.get(TOKEN_HEADER)):
+        abort(403)
+
+
+def profiles_index():
+    _require_token()
+    profiles = read_profiles(current_app.extensions['profiler']['output_dir'])
+    return jsonify({
+        endpoint: {'requests': profile['requests'], 'samples': sum(profile['stacks'].values())}
+        for endpoint, profile in sorted(profiles.items())
+    })
+
+
+def profile_stacks(endpoint):
+    _require_token()
+    profiles = read_profiles(current_app.extensions['profiler']['output_dir'], endpoint)
+    if endpoint not in profiles:
+        abort(404)
+    stacks = profiles[endpoint]['stacks']
+    body = ''.join(f'{stack} {count}\n' for stack, count in stacks.most_common())
+    return Response(body, mimetype='text/plain')
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] == ['token']:
+        from config import Config
+        print(make_token(Config.SECRET_KEY))
+    else:
+        print('usage: python profiler.py token')
+        sys.exit(2)
@@ -0,0 +1,144 @@
+"""
+SQL instrumentation - per-request query statistics and a slow-query log
+
+Every engine bound to the app gets cursor-execute listeners that count
+statements and accumulate DB time for the current request (exposed as
+``g.sql_stats`` and a ``Server-Timing`` response header). Statements slower than
+SLOW_QUERY_THRESHOLD_MS are written to the ``clothing_store.slow_query`` logger
+as one JSON object per line with the SQL, bound-parameter shape, duration and
+originating endpoint. A sampled fraction (SLOW_QUERY_PLAN_SAMPLE_RATE) of those
+entries also carries the statement's EXPLAIN plan.
+"""
+
+import json
+import logging
+import os
+import random
+import time
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+logger = logging.getLogger('clothing_store.slow_query')
+
+
+class RequestStats:
+    """SQL statement count and DB time accumulated during one request"""
+
+    __slots__ = ('count', 'seconds')
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+
+def current():
+    """Stats for the active request, or None outside a request"""
+    if has_request_context():
+        return g.get('sql_stats')
+    return None
+
+
+def init_app(app, db):
+    if not app.config.get('SQL_STATS_ENABLED', True):
+        return
+
+    settings = {
+        'threshold': app.config.get('SLOW_QUERY_THRESHOLD_MS', 100) / 1000,
+        'plan_rate': app.config.get('SLOW_QUERY_PLAN_SAMPLE_RATE', 0.1),
+    }
+    if app.config.get('SLOW_QUERY_LOG'):
+        _add_file_handler(app.config['SLOW_QUERY_LOG'])
+
+    with app.app_context():
+        engines = list(db.engines.values())
+    routing = app.extensions.get('db_routing')
+    if routing is not None:
+        engines.append(routing.read_engine)
+    shard_set = app.extensions.get('shards')
+    if shard_set is not None:
+        engines.extend(shard_set.engines)
+    for engine in engines:
+        instrument_engine(engine, settings)
+
+    app.before_request(_start_request)
+    app.after_request(_add_server_timing)
+
+
+def instrument_engine(engine, settings):
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_start_time'].pop()
+        stats = current()
+        if stats is not None:
+            stats.count += 1
+            stats.seconds += elapsed
+        if elapsed >= settings['threshold']:
+            plan = None
+            if not executemany and random.random() < settings['plan_rate']:
+                plan = explain(conn, statement, parameters)
+            _log_slow_query(statement, parameters, executemany, elapsed, plan)
+
+
+def explain(conn, statement, parameters):
+    """Return the query plan for ``statement`` as a list of strings"""
+    prefix = 'EXPLAIN QUERY PLAN ' if conn.dialect.name == 'sqlite' else 'EXPLAIN '
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute(prefix + statement, parameters)
+        return [' '.join(str(column) for column in row) for row in cursor.fetchall()]
+    except Exception as exc:
+        return [f'EXPLAIN failed: {exc}']
+    finally:
+        cursor.close()
+
+
+def parameter_shape(parameters, executemany=False):
+    """Describe bound parameters by type only, so values never reach the log"""
+    if executemany:
+        parameters = list(parameters)
+        first = parameters[0] if parameters else ()
+        return {'rows': len(parameters), 'row': parameter_shape(first)}
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    return [type(value).__name__ for value in parameters or ()]
+
+
+def _log_slow_query(statement, parameters, executemany, elapsed, plan):
+    entry = {
+        'ts': time.time(),
+        'route': request.endpoint if has_request_context() else None,
+        'duration_ms': round(elapsed * 1000, 3),
+        'sql': statement,
+        'params': parameter_shape(parameters, executemany),
+    }
+    if plan is not None:
+        entry['plan'] = plan
+    logger.warning(json.dumps(entry))
+
+
+def _add_file_handler(path):
+    path = os.path.abspath(path)
+    for handler in logger.handlers:
+        if isinstance(handler, logging.FileHandler) and handler.baseFilename == path:
+            return
+    handler = logging.FileHandler(path)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(handler)
+
+
+def _start_request():
+    g.sql_stats = RequestStats()
+
+
+def _add_server_timing(response):
+    stats = g.get('sql_stats')
+    if stats is not None:
+        response.headers.add(
+            'Server-Timing', f'db;dur={stats.seconds * 1000:.2f};desc="{stats.count} queries"'
+        )
+    return response
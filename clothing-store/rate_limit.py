@@ -0,0 +1,209 @@
+"""
+Token-bucket rate limiting for expensive endpoints
+
+Each endpoint in RATE_LIMITS gets a bucket per client that holds up to N
+tokens and refills at N per period (``'10/minute'``), so a client may burst N
+requests and then continue at the sustained rate. Buckets are keyed by client
+IP (``'ip'``), by ``session['user_id']`` (``'user'``; anonymous clients fall
+back to their IP), or both, in which case every bucket needs a token.
+
+The check runs as a before_request hook, before the view opens a database
+session or hashes a password, and answers 429 with Retry-After.
+
+With RATE_LIMIT_STORAGE set (gunicorn.conf.py does this), buckets live in a
+SQLite file shared by all worker processes and each check is one UPSERT, so
+limits hold however requests are spread over workers. Otherwise buckets are
+per-process. Behind a reverse proxy, wrap the app in Werkzeug's ProxyFix so
+``request.remote_addr`` is the client's address.
+"""
+
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+
+from flask import current_app, jsonify, request, session
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+TOO_MANY = 'Too many requests, please slow down'
+PRUNE_EVERY = 1000  # checks between deletions of idle buckets
+
+logger = logging.getLogger('clothing_store.rate_limit')
+
+
+def parse_limit(spec):
+    """``'10/minute'`` -> (capacity, tokens per second)"""
+    count, _, period = spec.partition('/')
+    try:
+        capacity, seconds = int(count), PERIODS[period.strip()]
+    except (KeyError, ValueError):
+        raise ValueError(f'invalid rate limit {spec!r}; expected e.g. "10/minute"')
+    if capacity < 1:
+        raise ValueError(f'invalid rate limit {spec!r}; the count must be at least 1')
+    return capacity, capacity / seconds
+
+
+class Limit:
+    def __init__(self, endpoint, spec, key=('ip',), methods=None):
+        self.endpoint = endpoint
+        self.capacity, self.rate = parse_limit(spec)
+        self.scopes = (key,) if isinstance(key, str) else tuple(key)
+        unknown = set(self.scopes) - {'ip', 'user'}
+        if unknown:
+            raise ValueError(f'unknown rate limit key for {endpoint}: {sorted(unknown)}')
+        self.methods = frozenset(method.upper() for method in methods) if methods else None
+
+    def applies(self, method):
+        return self.methods is None or method in self.methods
+
+    def bucket_ids(self):
+        for scope in self.scopes:
+            user_id = session.get('user_id') if scope == 'user' else None
+            client = f'user:{user_id}' if user_id is not None else f'ip:{request.remote_addr}'
+            yield f'{self.endpoint}|{scope}|{client}'
+
+
+def _refill(tokens, updated, capacity, rate, now):
+    return min(capacity, tokens + max(now - updated, 0.0) * rate)
+
+
+class MemoryBucketStore:
+    """Buckets in this process only"""
+
+    def __init__(self, idle_after=3600.0):
+        self.idle_after = idle_after
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._checks = 0
+
+    def take(self, key, capacity, rate, now=None):
+        """Take a token; returns (allowed, seconds until one is available)"""
+        now = time.time() if now is None else now
+        with self._lock:
+            self._checks += 1
+            if self._checks % PRUNE_EVERY == 0:
+                self._prune(now)
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = _refill(tokens, updated, capacity, rate, now)
+            if tokens < 1:
+                return False, (1 - tokens) / rate
+            self._buckets[key] = (tokens - 1, max(updated, now))
+            return True, 0.0
+
+    def _prune(self, now):
+        self._buckets = {
+            key: bucket for key, bucket in self._buckets.items() if now - bucket[1] < self.idle_after
+        }
+
+
+class SQLiteBucketStore:
+    """Buckets in a SQLite file shared by every worker process
+
+    Rate-limit state is disposable, so the file is written without fsync; a
+    crash at worst forgets some recent requests.
+    """
+
+    TAKE = """
+        INSERT INTO buckets (key, tokens, updated) VALUES (:key, :capacity - 1, :now)
+        ON CONFLICT (key) DO UPDATE SET
+            tokens = MIN(:capacity, tokens + MAX(:now - updated, 0) * :rate) - 1,
+            updated = MAX(updated, :now)
+        WHERE MIN(:capacity, tokens + MAX(:now - updated, 0) * :rate) >= 1
+    """
+
+    def __init__(self, path, idle_after=3600.0, timeout=1.0):
+        self.path = path
+        self.idle_after = idle_after
+        self.timeout = timeout
+        self._local = threading.local()
+        self._checks = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def _connect(self):
+        # The table is (re)created per connection: gunicorn empties the file
+        # at start-up, after a preloaded app may already have opened it
+        connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None,
+                                     check_same_thread=False)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=OFF')
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS buckets ('
+            'key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL) WITHOUT ROWID'
+        )
+        return connection
+
+    def _connection(self):
+        # One connection per thread, opened in the worker that uses it
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            local.connection = self._connect()
+            local.pid = os.getpid()
+        return local.connection
+
+    def take(self, key, capacity, rate, now=None):
+        """Take a token; returns (allowed, seconds until one is available)"""
+        now = time.time() if now is None else now
+        connection = self._connection()
+        self._checks += 1
+        if self._checks % PRUNE_EVERY == 0:
+            connection.execute('DELETE FROM buckets WHERE updated < ?', (now - self.idle_after,))
+        params = {'key': key, 'capacity': capacity, 'rate': rate, 'now': now}
+        if connection.execute(self.TAKE, params).rowcount:
+            return True, 0.0
+        row = connection.execute('SELECT tokens, updated FROM buckets WHERE key = ?', (key,)).fetchone()
+        tokens = _refill(row[0], row[1], capacity, rate, now) if row else capacity
+        return False, max(1 - tokens, 0.0) / rate
+
+
+class RateLimiter:
+    """Configured limits and their bucket store (``app.extensions['rate_limit']``)"""
+
+    def __init__(self, limits, store):
+        self.limits = limits
+        self.store = store
+
+    def check(self, limit):
+        """None if the request may proceed, else seconds to wait"""
+        wait = None
+        for bucket_id in limit.bucket_ids():
+            try:
+                allowed, retry_after = self.store.take(bucket_id, limit.capacity, limit.rate)
+            except sqlite3.Error:
+                # Fail open: a locked or broken store must not take the site down
+                logger.warning('rate limit store unavailable', exc_info=True)
+                return None
+            if not allowed:
+                wait = max(wait or 0.0, retry_after)
+        return wait
+
+
+def init_app(app):
+    if not app.config.get('RATE_LIMIT_ENABLED', True):
+        return
+
+    limits = {
+        endpoint: Limit(endpoint, settings['limit'], settings.get('key', ('ip',)), settings.get('methods'))
+        for endpoint, settings in app.config.get('RATE_LIMITS', {}).items()
+    }
+    # Buckets idle for longer than the slowest full refill are full again
+    idle_after = max([limit.capacity / limit.rate for limit in limits.values()] + [60.0])
+    storage = app.config.get('RATE_LIMIT_STORAGE')
+    store = SQLiteBucketStore(storage, idle_after) if storage else MemoryBucketStore(idle_after)
+    app.extensions['rate_limit'] = RateLimiter(limits, store)
+    app.before_request(_check_rate_limit)
+
+
+def _check_rate_limit():
+    limiter = current_app.extensions['rate_limit']
+    limit = limiter.limits.get(request.endpoint)
+    if limit is None or not limit.applies(request.method):
+        return None
+    wait = limiter.check(limit)
+    if wait is None:
+        return None
+    headers = {'Retry-After': str(max(1, math.ceil(wait)))}
+    if request.is_json:
+        return jsonify({'success': False, 'message': TOO_MANY}), 429, headers
+    return TOO_MANY, 429, headers
@@ -3,14 +3,20 @@ Seed data for Indian Clothing Store
 Realistic products based on age groups for Indian market
 """
 
+import re
+
 from app import app, db, Category, Product
+from catalog_import import ensure_schema, upsert_statement
 from datetime import datetime
 
+def seed_sku(name):
+    """Stable SKU for a seed product, so re-running the seed updates rows in place"""
+    return 'SEED-' + re.sub(r'[^A-Z0-9]+', '-', name.upper()).strip('-')
+
 def seed_database():
     with app.app_context():
-        # Clear existing data
-        db.drop_all()
-        db.create_all()
+        with db.engine.begin() as connection:
+            ensure_schema(connection)
         
         # Categories based on age groups
         categories_data = [
@@ -56,10 +62,13 @@ def seed_database():
             }
         ]
         
+        # Categories are matched by name; products refer to them by position (1-8)
         categories = []
         for cat_data in categories_data:
-            category = Category(**cat_data)
-            db.session.add(category)
+            category = Category.query.filter_by(name=cat_data['name']).first()
+            if category is None:
+                category = Category(**cat_data)
+                db.session.add(category)
             categories.append(category)
         
         db.session.commit()
@@ -463,14 +472,20 @@ def seed_database():
             ethnic_products + western_products
         )
         
+        rows = []
         for product_data in all_products:
-            product = Product(**product_data)
-            db.session.add(product)
+            row = {column.name: None for column in Product.__table__.columns if column.name not in ('id', 'created_at')}
+            row.update(product_data)
+            row['sku'] = seed_sku(product_data['name'])
+            row['category_id'] = categories[product_data['category_id'] - 1].id
+            rows.append(row)
         
-        db.session.commit()
+        # One batched upsert instead of an INSERT per product
+        with db.engine.begin() as connection:
+            connection.execute(upsert_statement(db.engine.dialect.name), rows)
         print(f"✅ Database seeded successfully!")
-        print(f"✅ Created {len(categories)} categories")
-        print(f"✅ Created {len(all_products)} products")
+        print(f"✅ Seeded {len(categories)} categories")
+        print(f"✅ Seeded {len(all_products)} products")
 
 if __name__ == '__main__':
     seed_database()
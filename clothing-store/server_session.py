@@ -0,0 +1,417 @@
+"""
+Server-side sessions with a cached user profile
+
+The session cookie carries only a random id; the session data lives in a
+SQLite file (SESSION_STORE_PATH, default instance/sessions.db) shared by every
+worker, keyed by a hash of the id so a copy of the file cannot be replayed as
+cookies. Each worker keeps recently used rows in an LRU (SESSION_CACHE_SIZE).
+While no other process has written to the file, which SQLite reports through
+``PRAGMA data_version`` without any disk I/O, cached rows are used as they
+are. After such a write, each cached row is checked once against its
+``version`` column (bumped by every write to the row) before it is used
+again, so only the sessions that actually changed are reloaded.
+
+The logged-in user's profile (name, email, phone, address) is cached next to
+the session data for the session's lifetime, so views call session_user()
+instead of loading the User row on every request. Committing a change to any
+of those fields clears the cached profile from all of that user's sessions.
+A request only saves a profile onto the row version it loaded, so one that
+read the profile before such a clear cannot write the stale copy back.
+Other per-user data can ride along with profile_value(); whoever writes it
+calls invalidate_profiles() in the same transaction.
+
+Sessions expire SESSION_LIFETIME seconds after their last use. Expired rows
+are deleted in small batches every SESSION_CLEANUP_EVERY writes, or all at
+once with ``python server_session.py purge``.
+"""
+
+import hashlib
+import json
+import os
+import secrets
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, g, has_app_context, has_request_context, session
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SecureCookieSession, SessionInterface
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import object_session
+
+PROFILE_FIELDS = ('id', 'name', 'email', 'phone', 'address')
+CLEANUP_BATCH = 500
+
+serializer = TaggedJSONSerializer()
+
+
+def _hash(sid):
+    return hashlib.sha256(sid.encode()).hexdigest()
+
+
+class ServerSession(SecureCookieSession):
+    """Session dict with its store id and the cached user profile"""
+
+    def __init__(self, initial=None, sid=None, user_id=None, profile=None, expires=None, version=None):
+        super().__init__(initial)
+        self.sid = sid
+        self.version = version
+        self.loaded_user_id = user_id
+        self.profile = profile
+        self.profile_changed = False
+        self.expires = expires
+
+
+class SessionStore:
+    """Session rows in a SQLite file, fronted by a per-process LRU"""
+
+    SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS sessions ('
+        'id TEXT PRIMARY KEY, user_id INTEGER, data TEXT NOT NULL, profile TEXT, expires REAL NOT NULL, '
+        'version INTEGER NOT NULL DEFAULT 0)',
+        'CREATE INDEX IF NOT EXISTS ix_sessions_expires ON sessions (expires)',
+        'CREATE INDEX IF NOT EXISTS ix_sessions_user_id ON sessions (user_id)',
+    )
+
+    def __init__(self, path, cache_size=10000, timeout=5.0, cleanup_every=1000):
+        self.path = path
+        self.cache_size = cache_size
+        self.timeout = timeout
+        self.cleanup_every = cleanup_every
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._connection = None
+        self._pid = None
+        self._data_version = None
+        self._epoch = 0
+        self._writes = 0
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def _db(self):
+        # One connection per process (opened after gunicorn's fork), so
+        # data_version changes mean another worker wrote
+        if self._pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None,
+                                         check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            for statement in self.SCHEMA:
+                connection.execute(statement)
+            columns = {row[1] for row in connection.execute('PRAGMA table_info(sessions)')}
+            if 'version' not in columns:
+                connection.execute('ALTER TABLE sessions ADD COLUMN version INTEGER NOT NULL DEFAULT 0')
+            self._connection, self._pid = connection, os.getpid()
+            self._cache.clear()
+            self._data_version = None
+        version = self._connection.execute('PRAGMA data_version').fetchone()[0]
+        if version != self._data_version:
+            # Another process wrote: cached rows from before are re-checked on use
+            self._data_version = version
+            self._epoch += 1
+        return self._connection
+
+    def _remember(self, key, row):
+        # row: ((user_id, data, profile, expires, version), version, epoch it was last checked in)
+        self._cache[key] = row
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def load(self, sid, now=None):
+        """(user_id, data, profile, expires, version) for a live session id, else None"""
+        now = time.time() if now is None else now
+        key = _hash(sid)
+        with self._lock:
+            connection = self._db()
+            cached = self._cache.get(key)
+            if cached is not None and cached[2] != self._epoch:
+                current = connection.execute('SELECT version FROM sessions WHERE id = ?', (key,)).fetchone()
+                if current is not None and current[0] == cached[1]:
+                    cached = (cached[0], cached[1], self._epoch)
+                    self._cache[key] = cached
+                else:
+                    cached = None
+            if cached is None:
+                found = connection.execute(
+                    'SELECT user_id, data, profile, expires, version FROM sessions WHERE id = ?', (key,)
+                ).fetchone()
+                if found is None:
+                    self._cache.pop(key, None)
+                    return None
+                cached = (found, found[4], self._epoch)
+                self._remember(key, cached)
+            else:
+                self._cache.move_to_end(key)
+        row = cached[0]
+        if row[3] <= now:
+            return None
+        return row
+
+    def save(self, sid, user_id, data, profile, expires, write_profile, version=None):
+        """Write a session row; the profile only if the row is still at ``version`` (when given)"""
+        key = _hash(sid)
+        with self._lock:
+            connection = self._db()
+            if write_profile and version is not None:
+                # Only onto the row this request loaded. If anything changed it
+                # meanwhile (e.g. forget_profiles()), the profile held here may
+                # be stale: it is dropped and only the data is written below
+                if connection.execute(
+                    'UPDATE sessions SET user_id = ?, data = ?, profile = ?, expires = ?, version = version + 1 '
+                    'WHERE id = ? AND version = ?',
+                    (user_id, data, profile, expires, key, version),
+                ).rowcount:
+                    self._cache.pop(key, None)
+                    self._after_write(connection)
+                    return
+                write_profile = False
+            if write_profile:
+                connection.execute(
+                    'INSERT INTO sessions (id, user_id, data, profile, expires) VALUES (?, ?, ?, ?, ?) '
+                    'ON CONFLICT (id) DO UPDATE SET user_id = excluded.user_id, data = excluded.data, '
+                    'profile = excluded.profile, expires = excluded.expires, version = sessions.version + 1',
+                    (key, user_id, data, profile, expires),
+                )
+            else:
+                # Leave the profile column alone: it may have been invalidated
+                # while this request was running
+                connection.execute(
+                    'INSERT INTO sessions (id, user_id, data, expires) VALUES (?, ?, ?, ?) '
+                    'ON CONFLICT (id) DO UPDATE SET user_id = excluded.user_id, data = excluded.data, '
+                    'expires = excluded.expires, version = sessions.version + 1',
+                    (key, user_id, data, expires),
+                )
+            self._cache.pop(key, None)
+            self._after_write(connection)
+
+    def touch(self, sid, expires):
+        key = _hash(sid)
+        with self._lock:
+            connection = self._db()
+            connection.execute('UPDATE sessions SET expires = ?, version = version + 1 WHERE id = ?', (expires, key))
+            self._cache.pop(key, None)
+            self._after_write(connection)
+
+    def delete(self, sid):
+        key = _hash(sid)
+        with self._lock:
+            self._db().execute('DELETE FROM sessions WHERE id = ?', (key,))
+            self._cache.pop(key, None)
+
+    def forget_profiles(self, user_ids):
+        """Drop the cached profile from every session of these users"""
+        stale = set(user_ids)
+        current = _current_session()
+        with self._lock:
+            connection = self._db()
+            connection.executemany('UPDATE sessions SET profile = NULL, version = version + 1 WHERE user_id = ?',
+                                   [(user_id,) for user_id in stale])
+            for key in [key for key, cached in self._cache.items() if cached[0][0] in stale]:
+                del self._cache[key]
+            if current is not None and current.loaded_user_id in stale:
+                # Invalidated by this request's own write, which puts the fresh
+                # value in its profile: it may save onto the new version, unless
+                # something else changed the row in between
+                found = connection.execute(
+                    'SELECT version FROM sessions WHERE id = ?', (_hash(current.sid),)
+                ).fetchone()
+                if found is not None and found[0] == current.version + 1:
+                    current.version = found[0]
+
+    def purge_expired(self, now=None, batch_size=CLEANUP_BATCH):
+        """Delete expired sessions in batches (each its own short write); returns rows removed"""
+        now = time.time() if now is None else now
+        removed = 0
+        while True:
+            with self._lock:
+                deleted = self._purge_batch(self._db(), now, batch_size)
+            removed += deleted
+            if deleted < batch_size:
+                return removed
+
+    @staticmethod
+    def _purge_batch(connection, now, batch_size):
+        return connection.execute(
+            'DELETE FROM sessions WHERE id IN (SELECT id FROM sessions WHERE expires <= ? LIMIT ?)',
+            (now, batch_size),
+        ).rowcount
+
+    def _after_write(self, connection):
+        self._writes += 1
+        if self.cleanup_every and self._writes % self.cleanup_every == 0:
+            self._purge_batch(connection, time.time(), CLEANUP_BATCH)
+
+
+class ServerSessionInterface(SessionInterface):
+    def __init__(self, store, lifetime):
+        self.store = store
+        self.lifetime = lifetime
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if not sid:
+            return ServerSession()
+        row = self.store.load(sid)
+        if row is None:
+            return ServerSession()
+        user_id, data, profile, expires, version = row
+        return ServerSession(serializer.loads(data), sid=sid, user_id=user_id,
+                             profile=json.loads(profile) if profile else None, expires=expires, version=version)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        cookie = dict(
+            domain=self.get_cookie_domain(app), path=self.get_cookie_path(app),
+            secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app),
+            httponly=self.get_cookie_httponly(app),
+        )
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        if not session:
+            if session.modified and session.sid:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, **cookie)
+                response.vary.add('Cookie')
+            return
+
+        now = time.time()
+        expires = now + self.lifetime
+        user_id = session.get('user_id')
+        if session.sid and user_id != session.loaded_user_id:
+            # Signing in or out: issue a new id so a planted one cannot be used
+            self.store.delete(session.sid)
+            session.sid = None
+        new = session.sid is None
+        if new:
+            session.sid = secrets.token_urlsafe(32)
+
+        if new or session.modified or session.profile_changed:
+            profile = json.dumps(session.profile) if session.profile is not None else None
+            self.store.save(session.sid, user_id, serializer.dumps(dict(session)), profile, expires,
+                            write_profile=new or session.profile_changed, version=None if new else session.version)
+        elif session.expires - now < self.lifetime / 2:
+            self.store.touch(session.sid, expires)
+
+        if new or self.should_set_cookie(app, session):
+            response.set_cookie(name, session.sid, expires=self.get_expiration_time(app, session), **cookie)
+            response.vary.add('Cookie')
+
+
+def _current_session():
+    """The stored ServerSession of the request being handled, if any"""
+    if has_request_context() and isinstance(session, ServerSession) and session.version is not None:
+        return session
+    return None
+
+
+def session_user():
+    """Profile of the logged-in user as a dict (PROFILE_FIELDS), or None
+
+    Served from the server-side session once cached; falls back to one User
+    query (cached on ``g``) with cookie sessions.
+    """
+    user_id = session.get('user_id')
+    if user_id is None:
+        return None
+    profile = getattr(session, 'profile', None)
+    if profile is not None and profile.get('id') == user_id:
+        return profile
+    if 'session_user' in g:
+        return g.session_user
+
+    from models import db, User
+    user = db.session.get(User, user_id)
+    profile = {field: getattr(user, field) for field in PROFILE_FIELDS} if user is not None else None
+    g.session_user = profile
+    if profile is not None and isinstance(session, ServerSession):
+        session.profile = profile
+        session.profile_changed = True
+    return profile
+
+
+def profile_value(key, load):
+    """``load(user_id)`` cached under ``key`` in the logged-in user's profile, or None"""
+    profile = session_user()
+    if profile is None:
+        return None
+    if key not in profile:
+        profile[key] = load(profile['id'])
+        if isinstance(session, ServerSession):
+            session.profile_changed = True
+    return profile[key]
+
+
+def update_profile_value(key, value):
+    """Replace ``key`` in the current session's cached profile, if one is loaded
+
+    For views that just wrote the value: the commit cleared it from every
+    session of the user, this puts the fresh value back in the current one.
+    """
+    user_id = session.get('user_id')
+    profile = getattr(session, 'profile', None)
+    if user_id is None or profile is None or profile.get('id') != user_id:
+        return
+    profile[key] = value
+    session.profile_changed = True
+
+
+def invalidate_profiles(db_session, user_ids):
+    """Clear these users' cached profiles from their sessions once ``db_session`` commits"""
+    db_session.info.setdefault('stale_profiles', set()).update(user_ids)
+
+
+def init_app(app):
+    if not app.config.get('SERVER_SESSIONS_ENABLED', True):
+        return
+
+    path = app.config.get('SESSION_STORE_PATH') or os.path.join(app.instance_path, 'sessions.db')
+    store = SessionStore(
+        path,
+        cache_size=app.config.get('SESSION_CACHE_SIZE', 10000),
+        cleanup_every=app.config.get('SESSION_CLEANUP_EVERY', 1000),
+    )
+    app.extensions['server_session'] = store
+    app.session_interface = ServerSessionInterface(store, app.config.get('SESSION_LIFETIME', 30 * 86400))
+    _watch_profile_changes()
+
+
+def _watch_profile_changes():
+    from models import User
+    from db_routing import RoutingSession
+
+    if not event.contains(User, 'after_update', _profile_updated):
+        event.listen(User, 'after_update', _profile_updated)
+        event.listen(RoutingSession, 'after_commit', _forget_stale_profiles)
+
+
+def _profile_updated(mapper, connection, target):
+    state = inspect(target)
+    if any(state.attrs[field].history.has_changes() for field in PROFILE_FIELDS if field != 'id'):
+        db_session = object_session(target)
+        if db_session is not None:
+            invalidate_profiles(db_session, [target.id])
+
+
+def _forget_stale_profiles(db_session):
+    # After commit, so no request can re-cache the old values in between
+    stale = db_session.info.pop('stale_profiles', None)
+    if stale and has_app_context():
+        store = current_app.extensions.get('server_session')
+        if store is not None:
+            store.forget_profiles(stale)
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['purge'] and len(sys.argv) <= 3:
+        store_path = sys.argv[2] if len(sys.argv) == 3 else None
+        if store_path is None:
+            from app import create_app
+            store_path = create_app().extensions['server_session'].path
+        print(f'{SessionStore(store_path).purge_expired()} expired sessions removed')
+    else:
+        print('usage: python server_session.py purge [sessions.db]')
+        sys.exit(2)
@@ -0,0 +1,219 @@
+"""
+Sharding of carts and orders by user
+
+With SHARD_COUNT set, each user's cart lines, cart summary, orders and order
+items live in one of SHARD_COUNT SQLite files in SHARD_DIR
+(shard-0.db, shard-1.db, ...), picked by a stable hash of the user id. Every
+shard has its own engine and its own write lock, so add-to-cart and checkout
+for users on different shards commit in parallel instead of queueing on the
+one database lock. Users, the catalog and everything else stay in the shared
+database (SQLALCHEMY_DATABASE_URI).
+
+Each shard connection ATTACHes the shared database as ``catalog``. SQLite
+looks unqualified table names up in the shard first and then in the attached
+database, so the existing queries that join carts and orders to ``product``
+run unchanged on a shard session.
+
+Writes to the shard and to the attached catalog in one transaction are not
+atomic across the two files in WAL mode. Checkout therefore takes product
+stock in its own transaction on the shared database first, then writes the
+order on the shard, and gives the stock back if any part of that fails; a
+crash in between leaves stock taken for an order that was never written.
+Checkouts take the shared lock briefly for this; cart writes do not.
+
+Shard engines get the same SQLITE_PRAGMAS as the shared database and
+query_stats instruments them like the other engines. Order archiving
+(order_archive.py) only covers the shared database and refuses to run while
+sharding is on.
+
+Views get the session for a user's rows from user_session(user_id): the
+usual db.session when sharding is off, else a session on the user's shard
+for the rest of the request. cart_store and order_history take the session
+as an argument and do not know about shards.
+
+Rows written before sharding was turned on are moved into the shards with:
+
+    python shards.py migrate     # move carts and orders from the shared database
+    python shards.py status      # rows per shard
+"""
+
+import argparse
+import os
+import zlib
+
+from flask import current_app, g, has_app_context
+from sqlalchemy import create_engine, event
+
+import sqlite_profile
+from db_routing import RoutingSession
+from models import db, Cart, CartSummary, Order, OrderItem
+
+SHARDED_TABLES = [Cart.__table__, CartSummary.__table__, Order.__table__, OrderItem.__table__]
+CATALOG_SCHEMA = 'catalog'
+MIGRATE_CHUNK = 500
+
+
+def shard_index(user_id, count):
+    """Shard of a user; stable across processes and restarts (unlike hash())"""
+    return zlib.crc32(str(int(user_id)).encode()) % count
+
+
+class ShardSet:
+    """Engines for the shard files of an app (``app.extensions['shards']``)"""
+
+    def __init__(self, engines):
+        self.engines = engines
+
+    def index(self, user_id):
+        return shard_index(user_id, len(self.engines))
+
+    def engine_for(self, user_id):
+        return self.engines[self.index(user_id)]
+
+    def session(self, index):
+        return RoutingSession(db, bind=self.engines[index])
+
+    def dispose(self):
+        for engine in self.engines:
+            engine.dispose()
+
+
+def create_shard_engine(path, catalog_path, pragmas=None, **engine_options):
+    """Engine on one shard file whose connections see the shared database as ``catalog``"""
+    # Created without the attached catalog, whose cart and order tables would
+    # make create_all think the shard already has them
+    setup = create_engine(f'sqlite:///{path}')
+    db.metadata.create_all(setup, tables=SHARDED_TABLES)
+    setup.dispose()
+
+    engine = create_engine(f'sqlite:///{path}', **engine_options)
+    if pragmas:
+        sqlite_profile.apply_to_engine(engine, pragmas)
+
+    @event.listens_for(engine, 'connect')
+    def attach_catalog(dbapi_connection, connection_record):
+        dbapi_connection.execute(f'ATTACH DATABASE ? AS {CATALOG_SCHEMA}', (catalog_path,))
+
+    return engine
+
+
+def init_app(app):
+    count = app.config.get('SHARD_COUNT', 0)
+    if not count:
+        return
+
+    with app.app_context():
+        primary = db.engine
+    if primary.dialect.name != 'sqlite' or primary.url.database in (None, '', ':memory:'):
+        raise ValueError('sharding needs the shared database in a SQLite file')
+    directory = app.config.get('SHARD_DIR') or os.path.join(app.instance_path, 'shards')
+    os.makedirs(directory, exist_ok=True)
+    engine_options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    app.extensions['shards'] = ShardSet([
+        create_shard_engine(os.path.join(directory, f'shard-{index}.db'), primary.url.database,
+                            app.config.get('SQLITE_PRAGMAS'), **engine_options)
+        for index in range(count)
+    ])
+    app.teardown_appcontext(_close_sessions)
+
+
+def user_session(user_id):
+    """Session holding the user's carts and orders for the rest of this app context"""
+    shard_set = current_app.extensions.get('shards')
+    if shard_set is None:
+        return db.session
+    index = shard_set.index(user_id)
+    sessions = g.setdefault('shard_sessions', {})
+    if index not in sessions:
+        sessions[index] = shard_set.session(index)
+    return sessions[index]
+
+
+def user_engines():
+    """Engines holding cart and order rows: one per shard, or just db.engine"""
+    shard_set = current_app.extensions.get('shards') if has_app_context() else None
+    return shard_set.engines if shard_set is not None else [db.engine]
+
+
+def _close_sessions(exc):
+    for shard_session in g.pop('shard_sessions', {}).values():
+        shard_session.close()
+
+
+def _columns(table, prefix=''):
+    return ', '.join(f'{prefix}"{column.name}"' for column in table.columns)
+
+
+def _owned(table, owners):
+    if table is OrderItem.__table__:
+        return f'order_id IN (SELECT id FROM {CATALOG_SCHEMA}."order" WHERE user_id IN ({owners}))'
+    return f'user_id IN ({owners})'
+
+
+def migrate(shard_set, chunk=MIGRATE_CHUNK):
+    """Move cart and order rows from the shared database into their users' shards
+
+    Each chunk of users is copied and deleted from the shared tables in one
+    transaction on the shard connection (which has the shared file attached);
+    copies are INSERT OR IGNORE, so an interrupted run can be repeated.
+    Returns {table name: rows moved}.
+    """
+    catalog = CATALOG_SCHEMA
+    moved = {table.name: 0 for table in SHARDED_TABLES}
+    with shard_set.engines[0].connect() as connection:
+        user_ids = sorted(set(connection.exec_driver_sql(
+            f'SELECT user_id FROM {catalog}.cart UNION SELECT user_id FROM {catalog}.cart_summary '
+            f'UNION SELECT user_id FROM {catalog}."order"'
+        ).scalars()))
+    by_shard = {}
+    for user_id in user_ids:
+        by_shard.setdefault(shard_set.index(user_id), []).append(user_id)
+
+    for index, users in sorted(by_shard.items()):
+        for start in range(0, len(users), chunk):
+            owners = ', '.join(str(int(user_id)) for user_id in users[start:start + chunk])
+            with shard_set.engines[index].begin() as connection:
+                for table in SHARDED_TABLES:
+                    moved[table.name] += connection.exec_driver_sql(
+                        f'INSERT OR IGNORE INTO main."{table.name}" ({_columns(table)}) '
+                        f'SELECT {_columns(table)} FROM {catalog}."{table.name}" WHERE {_owned(table, owners)}'
+                    ).rowcount
+                # Items first: they are found through their orders
+                for table in reversed(SHARDED_TABLES):
+                    connection.exec_driver_sql(f'DELETE FROM {catalog}."{table.name}" WHERE {_owned(table, owners)}')
+    return moved
+
+
+def status(shard_set):
+    """[(shard index, {table name: rows})]"""
+    counts = []
+    for index, engine in enumerate(shard_set.engines):
+        with engine.connect() as connection:
+            counts.append((index, {
+                table.name: connection.exec_driver_sql(f'SELECT COUNT(*) FROM main."{table.name}"').scalar()
+                for table in SHARDED_TABLES
+            }))
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Manage the cart and order shards')
+    parser.add_argument('command', choices=['migrate', 'status'])
+    args = parser.parse_args(argv)
+
+    from app import create_app
+
+    app = create_app()
+    shard_set = app.extensions.get('shards')
+    if shard_set is None:
+        parser.error('sharding is off: set SHARD_COUNT')
+    with app.app_context():
+        if args.command == 'migrate':
+            for table, rows in migrate(shard_set).items():
+                print(f'{table}: {rows} rows moved')
+        for index, tables in status(shard_set):
+            print(f'shard-{index}: ' + ', '.join(f'{table} {rows}' for table, rows in tables.items()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""
+SQLite performance profile
+Applies the PRAGMAs in app.config['SQLITE_PRAGMAS'] to every new connection
+"""
+
+from sqlalchemy import event
+
+
+def init_app(app, db):
+    """Register a connect listener on each SQLite engine bound to ``app``"""
+    pragmas = app.config.get('SQLITE_PRAGMAS')
+    if not pragmas:
+        return
+
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == 'sqlite':
+                apply_to_engine(engine, pragmas)
+
+
+def apply_to_engine(engine, pragmas):
+    """Run ``pragmas`` on every new connection made by ``engine``"""
+    event.listen(engine, 'connect', _pragma_listener(pragmas))
+
+
+def _pragma_listener(pragmas):
+    statements = [f"PRAGMA {name}={value}" for name, value in pragmas.items()]
+
+    def apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for statement in statements:
+                cursor.execute(statement)
+        finally:
+            cursor.close()
+
+    return apply_pragmas
+
+
+def current_pragmas(connection, names):
+    """Read back PRAGMA values from a SQLAlchemy connection (used by tests and benchmarks)"""
+    return {
+        name: connection.exec_driver_sql(f"PRAGMA {name}").scalar()
+        for name in names
+    }
@@ -7,25 +7,21 @@ import unittest
 import os
 import json
 from datetime import datetime
-from app import app, db, Product, User, Order, OrderItem, Cart, Category
+from app import create_app
+from models import db, Product, User, Order, OrderItem, Cart, Category
+from test_config import TestConfig as BaseTestConfig
 
-class TestConfig:
+class TestConfig(BaseTestConfig):
     """Test configuration"""
-    TESTING = True
-    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
     SECRET_KEY = 'test-secret-key'
-    WTF_CSRF_ENABLED = False
+
+app = create_app(TestConfig)
 
 class BaseTestCase(unittest.TestCase):
     """Base test case with common setup and teardown"""
     
     def setUp(self):
         """Set up test client and initialize database"""
-        app.config['TESTING'] = True
-        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
-        app.config['WTF_CSRF_ENABLED'] = False
-        app.config['SECRET_KEY'] = 'test-secret-key'
-        
         self.app = app
         self.client = app.test_client()
         
@@ -12,6 +12,153 @@ class TestConfig:
     SECRET_KEY = 'test-secret-key-12345'
     WTF_CSRF_ENABLED = False
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    PASSWORD_HASH_WORKERS = 0  # hash inline; the pool itself is tested separately
+    RATE_LIMIT_ENABLED = False  # tests share one client IP; TestRateLimit builds its own apps
+    ADMISSION_CONTROL_ENABLED = False  # slow tests must not shed the next one
+    SESSION_STORE_PATH = ':memory:'
+    CART_SWEEP_INTERVAL = 0  # TestCartRetention sweeps explicitly
+
+class MemoryCeilingMixin:
+    """TestCase mixin for asserting a route's peak memory"""
+
+    def assertMemoryCeiling(self, client, url, max_bytes, method='get', **kwargs):
+        """Request ``url`` under tracemalloc and fail if its peak exceeds ``max_bytes``"""
+        import memory_tracking
+        with memory_tracking.measure_peak(snapshot_over=max_bytes) as result:
+            response = getattr(client, method)(url, **kwargs)
+        if result['peak'] > max_bytes:
+            sites = '\n'.join(
+                f"    {site['site']}: {site['bytes']} bytes"
+                for site in memory_tracking.top_sites(result['snapshot'], 5)
+            )
+            self.fail(f"{url} peaked at {result['peak']} bytes (ceiling {max_bytes}):\n{sites}")
+        return response, result['peak']
+
+class SeededDatabase:
+    """Seeded test database restored from a snapshot, with per-test rollback
+
+    The schema and seed data are built once into a snapshot file, keyed by the
+    models and the seed function, and copied into the app's database with the
+    SQLite backup API instead of re-running create_all() and the seed. Each
+    test then runs inside an outer transaction; the session joins it through
+    savepoints, so commits made by views and tests are rolled back together.
+    """
+
+    SAVEPOINT_MODE = 'create_savepoint'
+
+    def __init__(self, app, db, seed):
+        self.app = app
+        self.db = db
+        self.seed = seed
+        self.dirty = True
+        self._outer = None
+        self._snapshot_path = None
+        with app.app_context():
+            self._enable_savepoints(db.engine)
+
+    @staticmethod
+    def _enable_savepoints(engine):
+        # pysqlite's implicit transactions break SAVEPOINT; issue BEGIN ourselves
+        # (straight on the driver, so SQL statistics don't count it)
+        from sqlalchemy import event
+
+        engine.dispose()
+
+        @event.listens_for(engine, 'connect')
+        def _autocommit_driver(dbapi_connection, connection_record):
+            dbapi_connection.isolation_level = None
+
+        @event.listens_for(engine, 'begin')
+        def _begin(connection):
+            connection.connection.driver_connection.execute('BEGIN')
+
+    def snapshot_path(self):
+        if self._snapshot_path is None:
+            self._snapshot_path = self._snapshot_key_path()
+        return self._snapshot_path
+
+    def _snapshot_key_path(self):
+        import hashlib
+        import inspect
+        import tempfile
+        import models
+        import sqlalchemy
+
+        key = hashlib.sha256()
+        for part in (inspect.getsource(models), inspect.getsource(self.seed), sqlalchemy.__version__):
+            key.update(part.encode())
+        directory = os.path.join(tempfile.gettempdir(), 'clothing-store-tests')
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, f'seeded-{key.hexdigest()[:16]}.db')
+
+    def build_snapshot(self):
+        """Create and seed the snapshot file if it does not exist yet"""
+        path = self.snapshot_path()
+        if os.path.exists(path):
+            return path
+        from app import create_app
+
+        building = f'{path}.{os.getpid()}.tmp'
+        snapshot_app = create_app({
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': f'sqlite:///{building}',
+            'SQLITE_PRAGMAS': {},
+            'SQL_STATS_ENABLED': False,
+        })
+        with snapshot_app.app_context():
+            self.db.create_all()
+            self.seed()
+            self.db.session.commit()
+            self.db.session.remove()
+            self.db.engine.dispose()
+        # Atomic, so concurrent test processes never see a half-written file
+        os.replace(building, path)
+        return path
+
+    def restore(self):
+        """Replace the app's database with a copy of the snapshot"""
+        import sqlite3
+
+        source = sqlite3.connect(self.build_snapshot())
+        try:
+            with self.app.app_context():
+                raw = self.db.engine.raw_connection()
+                try:
+                    source.backup(raw.driver_connection)
+                finally:
+                    raw.close()
+        finally:
+            source.close()
+        self.dirty = False
+
+    def begin(self, transactional=True):
+        """Start a test: restore the snapshot if needed and open the outer transaction
+
+        Without ``transactional`` the test writes to the database directly and
+        the next test gets a fresh copy of the snapshot.
+        """
+        if self.dirty:
+            self.restore()
+        if not transactional:
+            self.dirty = True
+            return
+        with self.app.app_context():
+            connection = self.db.engine.connect()
+            self._outer = (connection, connection.begin())
+            self.db.session.configure(bind=connection, join_transaction_mode=self.SAVEPOINT_MODE)
+
+    def rollback(self):
+        """End a test: discard everything it wrote"""
+        with self.app.app_context():
+            self.db.session.remove()
+        if self._outer is None:
+            return
+        connection, transaction = self._outer
+        self._outer = None
+        with self.app.app_context():
+            self.db.session.configure(bind=None, join_transaction_mode='conditional_savepoint')
+        transaction.rollback()
+        connection.close()
 
 # Test data generators
 def create_test_user(username='testuser', email='test@example.com', password='testpass123'):
@@ -4,16 +4,18 @@ Tests Model validations, relationships, and constraints
 """
 
 import unittest
-from app import app, db, Product, User, Order, OrderItem, Cart
+from app import create_app
+from models import db, Product, User, Order, OrderItem, Cart
+from test_config import TestConfig
 from datetime import datetime
 
+app = create_app(TestConfig)
+
 class TestUserModel(unittest.TestCase):
     """Test User model"""
     
     @classmethod
     def setUpClass(cls):
-        app.config['TESTING'] = True
-        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
         cls.app_context = app.app_context()
         cls.app_context.push()
         db.create_all()
@@ -62,8 +64,6 @@ class TestProductModel(unittest.TestCase):
     
     @classmethod
     def setUpClass(cls):
-        app.config['TESTING'] = True
-        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
         cls.app_context = app.app_context()
         cls.app_context.push()
         db.create_all()
@@ -119,8 +119,6 @@ class TestCartModel(unittest.TestCase):
     
     @classmethod
     def setUpClass(cls):
-        app.config['TESTING'] = True
-        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
         cls.app_context = app.app_context()
         cls.app_context.push()
         db.create_all()
@@ -179,8 +177,6 @@ class TestOrderModel(unittest.TestCase):
     
     @classmethod
     def setUpClass(cls):
-        app.config['TESTING'] = True
-        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
         cls.app_context = app.app_context()
         cls.app_context.push()
         db.create_all()
@@ -4,38 +4,57 @@ Tests are adapted to work with actual model structure
 """
 
 import unittest
+import argparse
+import contextlib
+import io
+import multiprocessing
+import multiprocessing.util
+import importlib
+import json
+import runpy
+import shutil
+import subprocess
 import sys
 import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from unittest import mock
 
 # Import from app
-from app import app, db, Product, User, Order, OrderItem, Cart, Category
+import password_hashing
+from app import close_app, create_app
+from models import db, Product, User, Order, OrderItem, Cart, Category
+from test_config import TestConfig, MemoryCeilingMixin, SeededDatabase
+
+app = create_app(TestConfig)
 
 
 class BaseTestCase(unittest.TestCase):
-    """Base test case with common setup and teardown"""
+    """Base test case with common setup and teardown
+    
+    Tests start from a copy of the seeded snapshot and run inside a
+    transaction that is rolled back afterwards (see test_config.SeededDatabase).
+    Classes whose tests write through db.engine directly or count SQL
+    statements set ``transactional = False``.
+    """
+    
+    transactional = True
     
     def setUp(self):
-        """Set up test client and initialize database"""
-        app.config['TESTING'] = True
-        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
-        app.config['WTF_CSRF_ENABLED'] = False
-        app.config['SECRET_KEY'] = 'test-secret-key'
-        
+        """Set up test client and start from the seeded database"""
         self.app = app
         self.client = app.test_client()
-        
-        with app.app_context():
-            db.create_all()
-            self._seed_test_data()
+        seeded_db.begin(self.transactional)
     
     def tearDown(self):
-        """Clean up after tests"""
-        with app.app_context():
-            db.session.remove()
-            db.drop_all()
+        """Roll back everything the test wrote"""
+        seeded_db.rollback()
     
-    def _seed_test_data(self):
+    @staticmethod
+    def _seed_test_data():
         """Seed database with test data"""
         from werkzeug.security import generate_password_hash
         
@@ -98,6 +117,9 @@ class BaseTestCase(unittest.TestCase):
         db.session.commit()
 
 
+seeded_db = SeededDatabase(app, db, BaseTestCase._seed_test_data)
+
+
 class TestModels(BaseTestCase):
     """Test database models"""
     
@@ -370,8 +392,2171 @@ class TestDatabaseConstraints(BaseTestCase):
             print("✓ Product stock tracking test passed")
 
 
-def run_test_suite():
-    """Run all tests and generate detailed summary"""
+class TestAppFactory(unittest.TestCase):
+    """Test the application factory and lazy blueprint registration"""
+    
+    def test_import_does_not_build_app(self):
+        """Test importing app neither constructs an app, registers routes nor loads the subsystems"""
+        code = (
+            "import sys, app; "
+            "print('app' in vars(app), 'blueprints.catalog' in sys.modules, "
+            "any(name in sys.modules for name in ('metrics', 'password_hashing', 'shards', 'prometheus_client')))"
+        )
+        output = subprocess.run(
+            [sys.executable, '-c', code],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True
+        ).stdout.split()
+        self.assertEqual(output, ['False', 'False', 'False'])
+        print("✓ Import does not build app test passed")
+    
+    def test_factory_registers_blueprints(self):
+        """Test every blueprint is registered on a new app"""
+        self.assertEqual(
+            set(app.blueprints),
+            {'catalog', 'cart', 'checkout', 'auth', 'orders'}
+        )
+        self.assertIn('catalog.index', app.view_functions)
+        print("✓ Factory registers blueprints test passed")
+    
+    def test_factory_applies_config(self):
+        """Test config passed to the factory is applied before the database is bound"""
+        other = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:', 'SECRET_KEY': 'other'})
+        self.assertIsNot(other, app)
+        self.assertEqual(other.config['SECRET_KEY'], 'other')
+        with other.app_context():
+            self.assertEqual(db.engine.url.database, ':memory:')
+        print("✓ Factory config test passed")
+
+
+class TestProductionServer(unittest.TestCase):
+    """Test the WSGI entry point and gunicorn settings"""
+    
+    CONF_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gunicorn.conf.py')
+    
+    def _load_conf(self, **env):
+        keys = [key for key in os.environ if key.startswith('GUNICORN_') or key in ('WEB_CONCURRENCY', 'PORT')]
+        with mock.patch.dict(os.environ, env):
+            for key in keys:
+                if key not in env:
+                    del os.environ[key]
+            return runpy.run_path(self.CONF_PATH)
+    
+    def test_defaults_sized_from_cpu_count(self):
+        """Test worker defaults are derived from the CPU count"""
+        conf = self._load_conf()
+        self.assertEqual(conf['workers'], multiprocessing.cpu_count() * 2 + 1)
+        self.assertEqual(conf['threads'], 2)
+        self.assertEqual(conf['worker_class'], 'gthread')
+        self.assertTrue(conf['preload_app'])
+        self.assertGreater(conf['max_requests'], 0)
+        self.assertEqual(conf['bind'], '0.0.0.0:5000')
+        print("✓ Gunicorn defaults test passed")
+    
+    def test_environment_overrides(self):
+        """Test every tunable can be overridden from the environment"""
+        conf = self._load_conf(
+            WEB_CONCURRENCY='3', GUNICORN_THREADS='1', GUNICORN_PRELOAD='0',
+            GUNICORN_MAX_REQUESTS='50', PORT='8000'
+        )
+        self.assertEqual(conf['workers'], 3)
+        self.assertEqual(conf['worker_class'], 'sync')
+        self.assertFalse(conf['preload_app'])
+        self.assertEqual(conf['max_requests'], 50)
+        self.assertEqual(conf['bind'], '0.0.0.0:8000')
+        print("✓ Gunicorn environment override test passed")
+    
+    def test_wsgi_application(self):
+        """Test the WSGI module exposes a configured application"""
+        import wsgi
+        self.assertIn('catalog', wsgi.application.blueprints)
+        print("✓ WSGI application test passed")
+    
+    def test_boots_on_fresh_host(self):
+        """Test gunicorn serves /metrics with preload on when TMPDIR has no metrics directory yet"""
+        import socket
+        import urllib.request
+        
+        if importlib.util.find_spec('gunicorn') is None:
+            self.skipTest('gunicorn is not installed')
+        tmpdir = tempfile.mkdtemp()
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        env = {key: value for key, value in os.environ.items()
+               if key not in ('PROMETHEUS_MULTIPROC_DIR', 'RATE_LIMIT_STORAGE') and not key.startswith('GUNICORN_')}
+        env.update(
+            TMPDIR=tmpdir, DATABASE_URL=f"sqlite:///{os.path.join(tmpdir, 'store.db')}",
+            SESSION_STORE_PATH=os.path.join(tmpdir, 'sessions.db'), CART_SWEEP_INTERVAL='0',
+            WEB_CONCURRENCY='1', GUNICORN_THREADS='1', GUNICORN_BIND=f'127.0.0.1:{port}',
+        )
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py'],
+            cwd=os.path.dirname(self.CONF_PATH), env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        )
+        try:
+            deadline = time.time() + 30
+            status = None
+            while status is None and time.time() < deadline and process.poll() is None:
+                try:
+                    with urllib.request.urlopen(f'http://127.0.0.1:{port}/metrics', timeout=2) as response:
+                        status = response.status
+                except OSError:
+                    time.sleep(0.2)
+            if status is None:
+                process.kill()
+                self.fail(f"gunicorn did not come up:\n{process.communicate()[1].decode()[-2000:]}")
+            self.assertEqual(status, 200)
+        finally:
+            if process.poll() is None:
+                process.terminate()
+                process.communicate(timeout=30)
+            shutil.rmtree(tmpdir, ignore_errors=True)
+        print("✓ Gunicorn fresh host boot test passed")
+
+
+class TestSQLiteProfile(unittest.TestCase):
+    """Test the SQLite PRAGMA profile applied to each connection"""
+    
+    PRAGMAS = ['journal_mode', 'synchronous', 'cache_size', 'mmap_size', 'busy_timeout', 'temp_store']
+    
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+    
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+    
+    def _pragmas_for(self, **config):
+        import sqlite_profile
+        config.setdefault('SQLALCHEMY_DATABASE_URI', f"sqlite:///{os.path.join(self.tmpdir, 'profile.db')}")
+        profiled_app = create_app(config)
+        with profiled_app.app_context():
+            with db.engine.connect() as connection:
+                values = sqlite_profile.current_pragmas(connection, self.PRAGMAS)
+            db.engine.dispose()
+        return values
+    
+    def test_tuned_profile_applied(self):
+        """Test the default profile enables WAL and the tuned PRAGMAs"""
+        values = self._pragmas_for()
+        self.assertEqual(values['journal_mode'], 'wal')
+        self.assertEqual(values['synchronous'], 1)  # NORMAL
+        self.assertEqual(values['cache_size'], -64000)
+        self.assertEqual(values['mmap_size'], 268435456)
+        self.assertEqual(values['busy_timeout'], 5000)
+        self.assertEqual(values['temp_store'], 2)  # MEMORY
+        print("✓ Tuned SQLite profile test passed")
+    
+    def test_profile_is_configurable(self):
+        """Test PRAGMAs come from config and can be disabled"""
+        values = self._pragmas_for(SQLITE_PRAGMAS={'synchronous': 'OFF', 'cache_size': -1000})
+        self.assertEqual(values['journal_mode'], 'delete')
+        self.assertEqual(values['synchronous'], 0)
+        self.assertEqual(values['cache_size'], -1000)
+        
+        values = self._pragmas_for(SQLITE_PRAGMAS={})
+        self.assertEqual(values['journal_mode'], 'delete')
+        print("✓ Configurable SQLite profile test passed")
+    
+    def test_database_uri_from_environment(self):
+        """Test the database URI and PRAGMAs are read from the environment"""
+        import config
+        try:
+            with mock.patch.dict(os.environ, {'DATABASE_URL': 'sqlite:////tmp/env.db', 'SQLITE_CACHE_SIZE': '-2000'}):
+                importlib.reload(config)
+                self.assertEqual(config.Config.SQLALCHEMY_DATABASE_URI, 'sqlite:////tmp/env.db')
+                self.assertEqual(config.Config.SQLITE_PRAGMAS['cache_size'], -2000)
+        finally:
+            importlib.reload(config)
+        print("✓ Database URI from environment test passed")
+
+
+class TestReadWriteRouting(unittest.TestCase):
+    """Test catalog reads are routed to the read engine and writers stick to the primary"""
+    
+    def setUp(self):
+        from sqlalchemy import event
+        from werkzeug.security import generate_password_hash
+        
+        self.tmpdir = tempfile.mkdtemp()
+        self.routed_app = create_app({
+            'TESTING': True,
+            'SECRET_KEY': 'test-secret-key',
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(self.tmpdir, 'routing.db')}",
+            'SQLITE_READ_POOL': True,
+        })
+        self.client = self.routed_app.test_client()
+        self.statements = {'primary': [], 'read': []}
+        
+        with self.routed_app.app_context():
+            db.create_all()
+            category = Category(name='Men', age_group='Adults (18-60)')
+            db.session.add(category)
+            db.session.add(User(name='Test User', email='test@example.com',
+                                password=generate_password_hash('testpass123')))
+            db.session.flush()
+            db.session.add(Product(name='Cotton Kurta', description='Kurta', price=799.00,
+                                   category_id=category.id, stock=50, size='M, L'))
+            db.session.commit()
+            self.product_id = Product.query.first().id
+            primary = db.engine
+        read_engine = self.routed_app.extensions['db_routing'].read_engine
+        for name, engine in (('primary', primary), ('read', read_engine)):
+            event.listen(engine, 'before_cursor_execute', self._recorder(name))
+    
+    def tearDown(self):
+        with self.routed_app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+        self.routed_app.extensions['db_routing'].read_engine.dispose()
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+    
+    def _recorder(self, name):
+        def record(conn, cursor, statement, parameters, context, executemany):
+            self.statements[name].append(statement)
+        return record
+    
+    def _reset(self):
+        self.statements = {'primary': [], 'read': []}
+    
+    def test_catalog_routes_use_read_engine(self):
+        """Test read-only catalog views never touch the primary"""
+        for url in ['/', '/category/1', f'/product/{self.product_id}', '/search?q=kurta']:
+            self._reset()
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(self.statements['read'], url)
+            self.assertEqual(self.statements['primary'], [], url)
+        print("✓ Catalog read routing test passed")
+    
+    def test_read_engine_is_query_only(self):
+        """Test the SQLite read pool rejects writes"""
+        from sqlalchemy import text
+        from sqlalchemy.exc import OperationalError
+        
+        read_engine = self.routed_app.extensions['db_routing'].read_engine
+        with read_engine.connect() as connection:
+            with self.assertRaises(OperationalError):
+                connection.execute(text("UPDATE product SET stock = 0"))
+        print("✓ Read engine query-only test passed")
+    
+    def test_writes_stay_on_primary_and_stick(self):
+        """Test cart writes use the primary and pin the user to it afterwards"""
+        self.client.post('/login', data={'email': 'test@example.com', 'password': 'testpass123'})
+        self._reset()
+        response = self.client.post('/add_to_cart', json={'product_id': self.product_id, 'quantity': 1, 'size': 'M'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(any(stmt.startswith('INSERT') for stmt in self.statements['primary']))
+        self.assertFalse(any(not stmt.startswith('SELECT') for stmt in self.statements['read']))
+        
+        # Read-your-writes: the next catalog view is served by the primary
+        self._reset()
+        self.client.get('/')
+        self.assertEqual(self.statements['read'], [])
+        self.assertTrue(self.statements['primary'])
+        
+        # Once the window has passed, reads go back to the read engine
+        with self.client.session_transaction() as sess:
+            sess['_primary_until'] = 0
+        self._reset()
+        self.client.get('/')
+        self.assertTrue(self.statements['read'])
+        self.assertEqual(self.statements['primary'], [])
+        print("✓ Read-your-writes stickiness test passed")
+    
+    def test_routing_disabled_by_default(self):
+        """Test no read engine exists unless configured"""
+        self.assertNotIn('db_routing', app.extensions)
+        print("✓ Routing disabled by default test passed")
+
+
+class TestQueryStats(BaseTestCase):
+    """Test per-request SQL statistics and the slow-query log"""
+    
+    transactional = False
+    
+    def test_server_timing_reports_queries(self):
+        """Test each response reports its query count and DB time"""
+        response = self.client.get('/')
+        self.assertEqual(response.status_code, 200)
+        timing = response.headers['Server-Timing']
+        self.assertTrue(timing.startswith('db;dur='))
+        self.assertIn('desc="2 queries"', timing)
+        print("✓ Server-Timing query stats test passed")
+    
+    def test_slow_query_logged_with_plan(self):
+        """Test statements over the threshold are logged with shape, route and plan"""
+        import query_stats
+        
+        logged_app = create_app({
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+            'SLOW_QUERY_THRESHOLD_MS': 0,
+            'SLOW_QUERY_PLAN_SAMPLE_RATE': 1.0,
+        })
+        with logged_app.app_context():
+            db.create_all()
+        with self.assertLogs(query_stats.logger, level='WARNING') as captured:
+            response = logged_app.test_client().get('/search?q=kurta')
+        self.assertEqual(response.status_code, 200)
+        
+        entries = [json.loads(record.getMessage()) for record in captured.records]
+        search_entry = next(entry for entry in entries if 'FROM product' in entry['sql'])
+        self.assertEqual(search_entry['route'], 'catalog.search')
+        self.assertIn('duration_ms', search_entry)
+        self.assertTrue(all(kind == 'str' for kind in search_entry['params']))
+        self.assertNotIn('kurta', json.dumps(search_entry['params']))
+        self.assertTrue(any('SCAN' in line for line in search_entry['plan']))
+        print("✓ Slow query log test passed")
+    
+    def test_fast_queries_not_logged(self):
+        """Test statements under the threshold are not logged"""
+        import query_stats
+        
+        with mock.patch.object(query_stats.logger, 'warning') as warning:
+            self.client.get('/')
+        warning.assert_not_called()
+        print("✓ Fast queries not logged test passed")
+    
+    def test_parameter_shape(self):
+        """Test parameter shapes hide values"""
+        import query_stats
+        
+        self.assertEqual(query_stats.parameter_shape((1, 'a', None)), ['int', 'str', 'NoneType'])
+        self.assertEqual(query_stats.parameter_shape({'id': 1}), {'id': 'int'})
+        self.assertEqual(
+            query_stats.parameter_shape([(1, 'a'), (2, 'b')], executemany=True),
+            {'rows': 2, 'row': ['int', 'str']}
+        )
+        print("✓ Parameter shape test passed")
+
+
+class TestMetrics(BaseTestCase):
+    """Test the Prometheus /metrics endpoint"""
+    
+    def _sample(self, name, **labels):
+        from prometheus_client import REGISTRY
+        return REGISTRY.get_sample_value(name, labels) or 0.0
+    
+    def test_requests_counted_by_endpoint_and_status(self):
+        """Test request counters carry endpoint, method and status labels"""
+        before_ok = self._sample('http_requests_total', endpoint='catalog.index', method='GET', status='200')
+        before_404 = self._sample('http_requests_total', endpoint='unmatched', method='GET', status='404')
+        self.client.get('/')
+        self.client.get('/')
+        self.client.get('/no-such-page')
+        self.assertEqual(self._sample('http_requests_total', endpoint='catalog.index', method='GET', status='200'), before_ok + 2)
+        self.assertEqual(self._sample('http_requests_total', endpoint='unmatched', method='GET', status='404'), before_404 + 1)
+        print("✓ Request counter test passed")
+    
+    def test_latency_split_into_phases(self):
+        """Test latency histograms are recorded for db, template and other time"""
+        before = {
+            phase: self._sample('http_request_phase_duration_seconds_count', endpoint='catalog.search', phase=phase)
+            for phase in ('db', 'template', 'other')
+        }
+        before_total = self._sample('http_request_duration_seconds_count', endpoint='catalog.search')
+        self.client.get('/search?q=kurta')
+        for phase, count in before.items():
+            self.assertEqual(
+                self._sample('http_request_phase_duration_seconds_count', endpoint='catalog.search', phase=phase),
+                count + 1
+            )
+        self.assertEqual(self._sample('http_request_duration_seconds_count', endpoint='catalog.search'), before_total + 1)
+        self.assertGreater(self._sample('http_request_phase_duration_seconds_sum', endpoint='catalog.search', phase='template'), 0)
+        print("✓ Latency phase histogram test passed")
+    
+    def test_metrics_endpoint_exposition(self):
+        """Test /metrics serves Prometheus text format and in-flight gauges settle at zero"""
+        self.client.get('/')
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith('text/plain'))
+        body = response.get_data(as_text=True)
+        self.assertIn('# TYPE http_request_duration_seconds histogram', body)
+        self.assertIn('http_requests_in_flight{endpoint="catalog.index"} 0.0', body)
+        print("✓ Metrics endpoint test passed")
+    
+    def test_metrics_aggregated_across_processes(self):
+        """Test samples from separate worker processes are summed"""
+        metrics_dir = tempfile.mkdtemp()
+        script = (
+            "from app import create_app; from models import db\n"
+            "a = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:'})\n"
+            "with a.app_context(): db.create_all()\n"
+            "c = a.test_client()\n"
+            "for _ in range(3): c.get('/')\n"
+            "print(c.get('/metrics').get_data(as_text=True))\n"
+        )
+        env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=metrics_dir)
+        try:
+            for _ in range(2):
+                output = subprocess.run(
+                    [sys.executable, '-c', script], cwd=os.path.dirname(os.path.abspath(__file__)),
+                    env=env, capture_output=True, text=True, check=True
+                ).stdout
+        finally:
+            shutil.rmtree(metrics_dir, ignore_errors=True)
+        self.assertIn('http_requests_total{endpoint="catalog.index",method="GET",status="200"} 6.0', output)
+        print("✓ Multi-process metrics aggregation test passed")
+
+
+class TestProfiler(BaseTestCase):
+    """Test the on-demand sampling profiler"""
+    
+    def setUp(self):
+        super().setUp()
+        import profiler
+        self.output_dir = tempfile.mkdtemp()
+        self.profiled_app = create_app({
+            'TESTING': True,
+            'SECRET_KEY': 'test-secret-key',
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+            'PROFILER_ENABLED': True,
+            'PROFILER_INTERVAL_MS': 0.5,
+            'PROFILER_OUTPUT_DIR': self.output_dir,
+        })
+        with self.profiled_app.app_context():
+            db.create_all()
+        self.profiled_client = self.profiled_app.test_client()
+        self.headers = {profiler.TOKEN_HEADER: profiler.make_token('test-secret-key')}
+    
+    def tearDown(self):
+        shutil.rmtree(self.output_dir, ignore_errors=True)
+        super().tearDown()
+    
+    def test_signed_header_profiles_request(self):
+        """Test a request with a valid token writes collapsed stacks for its endpoint"""
+        for _ in range(5):
+            self.profiled_client.get('/search?q=kurta', headers=self.headers)
+        summary = self.profiled_client.get('/admin/profiles', headers=self.headers).get_json()
+        self.assertEqual(summary['catalog.search']['requests'], 5)
+        self.assertGreater(summary['catalog.search']['samples'], 0)
+        
+        stacks = self.profiled_client.get('/admin/profiles/catalog.search', headers=self.headers).get_data(as_text=True)
+        first_line = stacks.splitlines()[0]
+        self.assertIn('flask.app:', first_line)
+        self.assertTrue(first_line.rsplit(' ', 1)[1].isdigit())
+        print("✓ Signed header profiling test passed")
+    
+    def test_unsigned_requests_not_profiled(self):
+        """Test requests without a token are not profiled at a zero sample rate"""
+        self.profiled_client.get('/', headers={'X-Profiler-Token': 'forged'})
+        self.assertEqual(os.listdir(self.output_dir), [])
+        print("✓ Unsigned request not profiled test passed")
+    
+    def test_sample_rate_profiles_without_token(self):
+        """Test the sample rate picks requests without a token"""
+        self.profiled_app.config['PROFILER_SAMPLE_RATE'] = 1.0
+        self.profiled_client.get('/')
+        self.assertEqual(len(os.listdir(self.output_dir)), 1)
+        print("✓ Sample rate profiling test passed")
+    
+    def test_admin_endpoints_require_token(self):
+        """Test profile data is only served to token holders"""
+        self.assertEqual(self.profiled_client.get('/admin/profiles').status_code, 403)
+        self.assertEqual(self.profiled_client.get('/admin/profiles/catalog.index').status_code, 403)
+        self.assertEqual(self.client.get('/admin/profiles').status_code, 404)
+        print("✓ Profiler admin auth test passed")
+
+
+class TestMemoryTracking(MemoryCeilingMixin, BaseTestCase):
+    """Test per-request memory tracking and route memory ceilings"""
+    
+    LARGE_CATALOG = 3000
+    
+    def _seed_large_catalog(self):
+        from sqlalchemy import insert
+        with app.app_context():
+            category = Category.query.filter_by(name='Men').first()
+            db.session.execute(insert(Product), [
+                {'name': f'Bulk Kurta {i}', 'description': 'Cotton kurta ' * 20, 'price': 499.0 + i,
+                 'category_id': category.id, 'stock': 10, 'size': 'M, L'}
+                for i in range(self.LARGE_CATALOG)
+            ])
+            db.session.commit()
+            return category.id
+    
+    def test_route_memory_ceiling(self):
+        """Test listing routes stay under a memory ceiling on a large catalog"""
+        category_id = self._seed_large_catalog()
+        response, peak = self.assertMemoryCeiling(self.client, '/search?q=Bulk', 256 * 1024 * 1024)
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(peak, 0)
+        self.assertMemoryCeiling(self.client, f'/category/{category_id}', 256 * 1024 * 1024)
+        print("✓ Route memory ceiling test passed")
+    
+    def test_memory_ceiling_failure_reports_sites(self):
+        """Test exceeding the ceiling fails with the top allocation sites"""
+        self._seed_large_catalog()
+        with self.assertRaises(AssertionError) as raised:
+            self.assertMemoryCeiling(self.client, '/search?q=Bulk', 1024)
+        self.assertIn('ceiling 1024', str(raised.exception))
+        self.assertIn('.py:', str(raised.exception))
+        print("✓ Memory ceiling failure test passed")
+    
+    def test_over_budget_request_logged(self):
+        """Test sampled requests over budget are logged with allocation sites"""
+        import memory_tracking
+        from prometheus_client import REGISTRY
+        
+        tracked_app = create_app({
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+            'MEMORY_TRACKING_ENABLED': True,
+            'MEMORY_SAMPLE_RATE': 1.0,
+            'MEMORY_BUDGET_BYTES': 1,
+        })
+        with tracked_app.app_context():
+            db.create_all()
+        labels = {'endpoint': 'catalog.search', 'shared': 'false'}
+        before = REGISTRY.get_sample_value('http_request_peak_memory_bytes_count', labels) or 0
+        with self.assertLogs(memory_tracking.logger, level='WARNING') as captured:
+            tracked_app.test_client().get('/search?q=kurta')
+        entry = json.loads(captured.records[0].getMessage())
+        self.assertEqual(entry['route'], 'catalog.search')
+        self.assertGreater(entry['peak_bytes'], 1)
+        self.assertFalse(entry['shared'])
+        self.assertTrue(entry['top_sites'])
+        self.assertEqual(REGISTRY.get_sample_value('http_request_peak_memory_bytes_count', labels), before + 1)
+        import tracemalloc
+        self.assertFalse(tracemalloc.is_tracing())
+        self.assertEqual(memory_tracking._state['in_flight'], 0)
+        print("✓ Over-budget memory logging test passed")
+    
+    def test_overlapping_request_marks_peak_shared(self):
+        """Test a peak traced while another request was in flight is tagged shared"""
+        import memory_tracking
+        from prometheus_client import REGISTRY
+        
+        tracked_app = create_app({
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+            'MEMORY_TRACKING_ENABLED': True,
+            'MEMORY_SAMPLE_RATE': 1.0,
+            'MEMORY_BUDGET_BYTES': 1,
+        })
+        with tracked_app.app_context():
+            db.create_all()
+        labels = {'endpoint': 'catalog.search', 'shared': 'true'}
+        before = REGISTRY.get_sample_value('http_request_peak_memory_bytes_count', labels) or 0
+        # stands in for another gthread thread that is mid-request
+        with memory_tracking._state_lock:
+            memory_tracking._state['in_flight'] += 1
+        try:
+            with self.assertLogs(memory_tracking.logger, level='WARNING') as captured:
+                tracked_app.test_client().get('/search?q=kurta')
+        finally:
+            with memory_tracking._state_lock:
+                memory_tracking._state['in_flight'] -= 1
+        self.assertTrue(json.loads(captured.records[0].getMessage())['shared'])
+        self.assertEqual(REGISTRY.get_sample_value('http_request_peak_memory_bytes_count', labels), before + 1)
+        print("✓ Shared memory peak tagging test passed")
+
+
+class TestCatalogImport(BaseTestCase):
+    """Test the streaming bulk catalog importer"""
+    
+    transactional = False
+    
+    def setUp(self):
+        super().setUp()
+        self.tmpdir = tempfile.mkdtemp()
+    
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+        super().tearDown()
+    
+    def _write(self, name, content):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, 'w', encoding='utf-8') as fh:
+            fh.write(content)
+        return path
+    
+    def test_csv_import_with_rejects(self):
+        """Test valid rows are inserted in chunks and invalid rows are reported"""
+        import catalog_import
+        
+        feed = self._write('feed.csv', (
+            "sku,name,price,category,stock,is_featured\n"
+            "SKU-1,Linen Kurta,1299,Men,20,yes\n"
+            "SKU-2,Georgette Saree,2199,Women,5,no\n"
+            "SKU-3,No Price Shirt,,Men,5,no\n"
+            ",Missing Sku,100,Men,1,no\n"
+            "SKU-4,Unknown Category,100,Pets,1,no\n"
+            "SKU-5,Kids Shorts,399,Kids,abc,no\n"
+            "SKU-6,Kids Frock,599,Kids,15,no\n"
+        ))
+        rejects = os.path.join(self.tmpdir, 'rejects.jsonl')
+        seen = []
+        report = catalog_import.import_catalog(app, feed, chunk_size=2, rejects_path=rejects,
+                                               progress=lambda r: seen.append(r.processed))
+        self.assertEqual((report.processed, report.upserted, report.rejected), (7, 3, 4))
+        self.assertEqual(seen, [2, 4, 6, 7])
+        with open(rejects) as fh:
+            reasons = [json.loads(line) for line in fh]
+        self.assertEqual([entry['line'] for entry in reasons], [4, 5, 6, 7])
+        self.assertIn('unknown category', reasons[2]['reason'])
+        with app.app_context():
+            kurta = Product.query.filter_by(sku='SKU-1').one()
+            self.assertEqual(kurta.category.name, 'Men')
+            self.assertTrue(kurta.is_featured)
+            self.assertEqual(kurta.rating, 0.0)
+            self.assertIsNotNone(kurta.created_at)
+        print("✓ CSV catalog import test passed")
+    
+    def test_jsonl_reimport_upserts_by_sku(self):
+        """Test re-importing a SKU updates the existing product instead of duplicating it"""
+        import catalog_import
+        
+        first = self._write('first.jsonl', '{"sku": "SKU-9", "name": "Silk Dupatta", "price": 899, "category": "Women", "stock": 3}\n')
+        second = self._write('second.jsonl', (
+            '{"sku": "SKU-9", "name": "Silk Dupatta", "price": 799, "category": "Women", "stock": 12}\n'
+            'not json\n'
+            '{"sku": "SKU-11", "name": "Priceless Sherwani", "category": "Wedding"}\n'
+            '{"sku": "SKU-10", "name": "Festive Lehenga", "price": 4999, "category": "Festive", "age_group": "All Ages"}\n'
+            '{"sku": "SKU-12", "name": "Festive Saree", "price": 2999, "category": "Festive"}\n'
+        ))
+        catalog_import.import_catalog(app, first)
+        report = catalog_import.import_catalog(app, second, create_categories=True)
+        self.assertEqual((report.upserted, report.rejected, report.categories_created), (3, 2, 1))
+        with app.app_context():
+            self.assertEqual(Category.query.filter_by(name='Wedding').count(), 0)
+            dupatta = Product.query.filter_by(sku='SKU-9').one()
+            self.assertEqual((dupatta.price, dupatta.stock), (799, 12))
+            self.assertEqual(Product.query.filter_by(sku='SKU-10').one().category.name, 'Festive')
+        print("✓ JSONL upsert by SKU test passed")
+
+    def test_repeated_sku_in_chunk_keeps_last_row(self):
+        """Test a SKU repeated within one chunk is upserted once, with its last row"""
+        import catalog_import
+
+        feed = self._write('repeats.jsonl', (
+            '{"sku": "SKU-20", "name": "Cotton Kurta", "price": 499, "category": "Men", "stock": 1}\n'
+            '{"sku": "SKU-21", "name": "Linen Shirt", "price": 899, "category": "Men"}\n'
+            '{"sku": "SKU-20", "name": "Cotton Kurta", "price": 449, "category": "Men", "stock": 5}\n'
+        ))
+        report = catalog_import.import_catalog(app, feed, chunk_size=10)
+        self.assertEqual((report.processed, report.upserted, report.rejected), (3, 2, 0))
+        with app.app_context():
+            kurta = Product.query.filter_by(sku='SKU-20').one()
+            self.assertEqual((kurta.price, kurta.stock), (449, 5))
+        print("✓ Repeated SKU import test passed")
+    
+    def test_indexes_rebuilt_and_hooks_run_once(self):
+        """Test deferred indexes are restored and post-import hooks run once per import"""
+        import catalog_import
+        from sqlalchemy import inspect
+        
+        feed = self._write('feed.csv', "sku,name,price,category\n" + ''.join(
+            f"BULK-{i},Bulk Tee {i},{199 + i},Men\n" for i in range(50)
+        ))
+        calls = []
+        with mock.patch.object(catalog_import, 'POST_IMPORT_HOOKS', [lambda conn, report: calls.append(report.upserted)]):
+            catalog_import.import_catalog(app, feed, chunk_size=10)
+        self.assertEqual(calls, [50])
+        with app.app_context():
+            index_names = {index['name'] for index in inspect(db.engine).get_indexes('product')}
+        self.assertIn('ix_product_category_id', index_names)
+        self.assertIn('ix_product_sku', index_names)
+        print("✓ Index rebuild and post-import hook test passed")
+
+class TestDatasetGenerator(unittest.TestCase):
+    """Test the deterministic synthetic dataset generator"""
+    
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+    
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+    
+    def _generate(self, name, **kwargs):
+        import generate_dataset
+        
+        path = os.path.join(self.tmpdir, name)
+        dataset_app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}', 'SQL_STATS_ENABLED': False})
+        return dataset_app, path, generate_dataset.generate(dataset_app, **kwargs)
+    
+    def _rows(self, path):
+        import sqlite3
+        
+        connection = sqlite3.connect(path)
+        try:
+            return {
+                table: connection.execute(f'SELECT * FROM {table} ORDER BY id').fetchall()
+                for table in ('category', 'product', 'user', 'cart', '"order"', 'order_item')
+            }
+        finally:
+            connection.close()
+    
+    def test_same_seed_same_data_across_process_counts(self):
+        """Test a seed reproduces identical rows whether generated by one process or several"""
+        _, serial_path, serial = self._generate('serial.db', scale=0.2, seed=7, processes=1)
+        _, parallel_path, parallel = self._generate('parallel.db', scale=0.2, seed=7, processes=2)
+        _, _, other = self._generate('other.db', scale=0.2, seed=8, processes=1)
+        serial.pop('seconds'), parallel.pop('seconds'), other.pop('seconds')
+        self.assertEqual(serial, parallel)
+        self.assertEqual((serial['products'], serial['users']), (200, 100))
+        self.assertGreater(serial['orders'], 0)
+        self.assertEqual(self._rows(serial_path), self._rows(parallel_path))
+        self.assertNotEqual(serial['order_items'], other['order_items'])
+        print("✓ Deterministic dataset test passed")
+    
+    def test_dataset_is_realistic_and_usable(self):
+        """Test skewed popularity, consistent totals and that generated users can log in"""
+        import generate_dataset
+        from sqlalchemy import func
+        
+        dataset_app, _, counts = self._generate('dataset.db', scale=0.5, processes=1)
+        with dataset_app.app_context():
+            sold = [row[1] for row in db.session.query(
+                OrderItem.product_id, func.sum(OrderItem.quantity)
+            ).group_by(OrderItem.product_id).order_by(func.sum(OrderItem.quantity).desc()).all()]
+            self.assertGreater(sold[0], 10 * sold[len(sold) // 2])
+            order = Order.query.order_by(Order.id).first()
+            self.assertAlmostEqual(order.total_amount, sum(item.price * item.quantity for item in order.order_items), places=2)
+            self.assertEqual(Product.query.filter(Product.size.is_(None)).count(), 0)
+            self.assertEqual(Order.query.count(), counts['orders'])
+            email = db.session.get(User, 1).email
+        
+        client = dataset_app.test_client()
+        response = client.post('/login', data={'email': email, 'password': generate_dataset.DEFAULT_PASSWORD})
+        self.assertEqual(response.status_code, 302)
+        with self.assertRaises(RuntimeError):
+            generate_dataset.generate(dataset_app, scale=0.5)
+        print("✓ Realistic dataset test passed")
+
+    def test_cached_dataset_follows_schema(self):
+        """Test ensure_dataset reuses its file until the schema changes, then rebuilds it"""
+        import generate_dataset
+
+        path = generate_dataset.ensure_dataset(0.1, seed=3, directory=self.tmpdir)
+        self.assertIn(generate_dataset.schema_key(), os.path.basename(path))
+        self.assertEqual(generate_dataset.ensure_dataset(0.1, seed=3, directory=self.tmpdir), path)
+        with mock.patch.object(generate_dataset, 'schema_key', return_value='changed'):
+            rebuilt = generate_dataset.ensure_dataset(0.1, seed=3, directory=self.tmpdir)
+        self.assertNotEqual(rebuilt, path)
+        self.assertEqual(sorted(os.listdir(self.tmpdir)), [os.path.basename(rebuilt), os.path.basename(rebuilt) + '.json'])
+        with open(rebuilt + '.json') as fh:
+            self.assertEqual(json.load(fh)['schema'], 'changed')
+        print("✓ Dataset cache schema key test passed")
+
+class TestTrafficCapture(unittest.TestCase):
+    """Test the sanitized traffic capture middleware"""
+    
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+    
+    def tearDown(self):
+        shutil.rmtree(self.output_dir, ignore_errors=True)
+    
+    def _client(self, **config):
+        captured_app = create_app(dict({
+            'TESTING': True,
+            'SECRET_KEY': 'test-secret-key',
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+            'TRAFFIC_CAPTURE_ENABLED': True,
+            'TRAFFIC_CAPTURE_DIR': self.output_dir,
+        }, **config))
+        with captured_app.app_context():
+            db.create_all()
+        return captured_app.test_client()
+    
+    def _entries(self):
+        entries = []
+        for name in sorted(os.listdir(self.output_dir)):
+            with open(os.path.join(self.output_dir, name)) as fh:
+                entries.extend(json.loads(line) for line in fh)
+        return entries
+    
+    def test_requests_logged_sanitized_and_correlated(self):
+        """Test requests are logged in order per session with personal fields redacted"""
+        first = self._client()
+        first.get('/search?q=kurta').close()
+        first.post('/login', data={'email': 'asha@example.com', 'password': 'secret'}).close()
+        first.post('/add_to_cart', json={'product_id': 3, 'quantity': 1, 'size': 'M'}).close()
+        first.get('/metrics').close()
+        second = first.application.test_client()
+        second.get('/').close()
+        
+        entries = self._entries()
+        self.assertEqual([entry['path'] for entry in entries], ['/search', '/login', '/add_to_cart', '/'])
+        search, login, add, home = entries
+        self.assertEqual(search['query'], 'q=kurta')
+        self.assertEqual(login['form'], [['email', '<redacted>'], ['password', '<redacted>']])
+        self.assertEqual((login['status'], add['status']), (200, 401))
+        self.assertEqual(add['json'], {'product_id': 3, 'quantity': 1, 'size': 'M'})
+        self.assertGreaterEqual(login['duration_ms'], 0)
+        self.assertEqual(search['session'], add['session'])
+        self.assertNotEqual(search['session'], home['session'])
+        self.assertNotIn('secret', json.dumps(entries))
+        print("✓ Sanitized traffic capture test passed")
+    
+    def test_sampling_keeps_whole_sessions(self):
+        """Test the sample rate keeps or drops all requests of a session"""
+        client = self._client(TRAFFIC_CAPTURE_SAMPLE_RATE=0.0)
+        client.get('/').close()
+        client.get('/search?q=saree').close()
+        self.assertEqual(self._entries(), [])
+        print("✓ Session sampling test passed")
+
+    def test_sampled_sessions_are_whole(self):
+        """Test with a fractional sample rate every captured session starts at its first request"""
+        client = self._client(TRAFFIC_CAPTURE_SAMPLE_RATE=0.5)
+        for _ in range(40):
+            visitor = client.application.test_client()
+            for n in range(3):
+                visitor.get(f'/search?q={n}').close()
+        
+        sessions = {}
+        for entry in self._entries():
+            sessions.setdefault(entry['session'], []).append(entry['query'])
+        self.assertTrue(0 < len(sessions) < 40, len(sessions))
+        for queries in sessions.values():
+            self.assertEqual(queries, ['q=0', 'q=1', 'q=2'])
+        print("✓ Whole sampled sessions test passed")
+
+class TestFixtures(BaseTestCase):
+    """Test the snapshot-restored, rolled-back test database"""
+    
+    def test_committed_writes_rolled_back(self):
+        """Test data committed by a view is gone when the next test starts"""
+        response = self.client.post('/register', data={
+            'name': 'Asha', 'email': 'asha@example.com', 'password': 'secret123',
+        })
+        self.assertEqual(response.status_code, 302)
+        with app.app_context():
+            self.assertIsNotNone(User.query.filter_by(email='asha@example.com').first())
+        
+        self.tearDown()
+        self.setUp()
+        with app.app_context():
+            self.assertIsNone(User.query.filter_by(email='asha@example.com').first())
+            self.assertEqual(User.query.filter_by(email='test@example.com').count(), 1)
+        print("✓ Transactional rollback test passed")
+    
+    def test_snapshot_restored_without_reseeding(self):
+        """Test a dirty database is restored from the snapshot file, not by seeding again"""
+        self.tearDown()
+        with mock.patch.object(seeded_db, 'seed', side_effect=AssertionError('seeded again')):
+            seeded_db.begin(transactional=False)
+            with app.app_context():
+                db.session.query(Cart).delete()
+                db.session.query(Product).delete()
+                db.session.commit()
+            seeded_db.rollback()
+            self.setUp()
+        with app.app_context():
+            self.assertEqual(Product.query.count(), 3)
+        self.assertTrue(os.path.exists(seeded_db.snapshot_path()))
+        print("✓ Snapshot restore test passed")
+    
+    def test_parallel_workers_isolated(self):
+        """Test tests split across worker processes each get their own seeded database"""
+        result = run_parallel([TestCartFunctionality, TestOrderFunctionality], 2)
+        expected = sum(
+            unittest.TestLoader().loadTestsFromTestCase(test_class).countTestCases()
+            for test_class in (TestCartFunctionality, TestOrderFunctionality)
+        )
+        self.assertEqual(result.testsRun, expected)
+        self.assertTrue(result.wasSuccessful(), result.failures + result.errors)
+        print("✓ Parallel worker isolation test passed")
+
+class TestPasswordHashing(BaseTestCase):
+    """Test pooled password hashing, admission control and rehash on login"""
+    
+    def setUp(self):
+        super().setUp()
+        self.hasher = app.extensions['password_hashing']
+    
+    def _login(self):
+        return self.client.post('/login', data={'email': 'test@example.com', 'password': 'testpass123'})
+    
+    def test_outdated_hash_replaced_on_login(self):
+        """Test a hash made with old parameters is rehashed with the configured method"""
+        with mock.patch.object(self.hasher, 'method', 'pbkdf2:sha256:1000'):
+            self.assertEqual(self._login().status_code, 302)
+            with app.app_context():
+                stored = User.query.filter_by(email='test@example.com').one().password
+            self.assertTrue(stored.startswith('pbkdf2:sha256:1000$'))
+            self.assertEqual(self._login().status_code, 302)
+        print("✓ Rehash on login test passed")
+    
+    def test_saturated_hashing_returns_503(self):
+        """Test logins that cannot get a hashing slot in time fail fast with Retry-After"""
+        slots = threading.BoundedSemaphore(1)
+        slots.acquire()
+        with mock.patch.multiple(self.hasher, _slots=slots, timeout=0.01):
+            response = self._login()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], '1')
+        self.assertIn(b'Too many sign-ins', response.data)
+        with self.client.session_transaction() as session:
+            self.assertNotIn('user_id', session)
+        print("✓ Hashing admission control test passed")
+    
+    def test_process_pool_hashes(self):
+        """Test hashes computed in the worker pool verify and use the configured method"""
+        import password_hashing
+        
+        hasher = password_hashing.PasswordHasher('pbkdf2:sha256:1000', workers=1)
+        try:
+            stored = hasher.hash('kurta123')
+            self.assertTrue(stored.startswith('pbkdf2:sha256:1000$'))
+            self.assertTrue(hasher.verify(stored, 'kurta123'))
+            self.assertFalse(hasher.verify(stored, 'saree123'))
+        finally:
+            hasher.shutdown()
+        self.assertEqual(password_hashing.normalize_method('scrypt'), 'scrypt:32768:8:1')
+        self.assertEqual(password_hashing.normalize_method('pbkdf2'), 'pbkdf2:sha256:600000')
+        print("✓ Process pool hashing test passed")
+    
+    def test_timed_out_hash_keeps_its_slot(self):
+        """Test a hash still running after its request gave up counts against max_pending until it finishes"""
+        import password_hashing
+        
+        hasher = password_hashing.PasswordHasher('pbkdf2:sha256:3000000', workers=1, max_pending=1, timeout=0.05)
+        try:
+            self.assertRaises(password_hashing.HashingBusy, hasher.hash, 'kurta123')
+            self.assertRaises(password_hashing.HashingBusy, hasher.hash, 'kurta123')
+            with mock.patch.object(hasher, 'timeout', 60):
+                self.assertTrue(hasher._slots.acquire(timeout=60))
+            hasher._slots.release()
+        finally:
+            hasher.shutdown()
+        print("✓ Hashing slot release test passed")
+
+
+class TestRateLimit(BaseTestCase):
+    """Test token-bucket rate limits per endpoint and client"""
+    
+    def _app(self, limits, **config):
+        limited_app = create_app(dict({
+            'TESTING': True,
+            'SECRET_KEY': 'test-secret-key',
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+            'SQL_STATS_ENABLED': False,
+            'PASSWORD_HASH_WORKERS': 0,
+            'RATE_LIMITS': limits,
+        }, **config))
+        with limited_app.app_context():
+            db.create_all()
+        return limited_app
+    
+    def test_limited_login_rejected_before_db_work(self):
+        """Test a login over its limit gets 429 without any SQL being run"""
+        from sqlalchemy import event
+        
+        limited_app = self._app({'auth.login': {'limit': '2/minute', 'key': 'ip', 'methods': ['POST']}})
+        client = limited_app.test_client()
+        credentials = {'email': 'nobody@example.com', 'password': 'wrong'}
+        self.assertEqual([client.post('/login', data=credentials).status_code for _ in range(2)], [200, 200])
+        self.assertEqual(client.get('/login').status_code, 200)
+        
+        statements = []
+        
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+        
+        with limited_app.app_context():
+            engine = db.engine
+        event.listen(engine, 'before_cursor_execute', record)
+        try:
+            response = client.post('/login', data=credentials)
+        finally:
+            event.remove(engine, 'before_cursor_execute', record)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers['Retry-After'], '30')
+        self.assertEqual(statements, [])
+        print("✓ Login rate limit test passed")
+    
+    def test_buckets_per_user_with_ip_fallback(self):
+        """Test logged-in users get their own buckets and anonymous clients share their IP's"""
+        limited_app = self._app({
+            'catalog.search': {'limit': '1/minute', 'key': 'user'},
+            'cart.add_to_cart': {'limit': '1/hour', 'key': ['user', 'ip']},
+        })
+        anonymous, other_anonymous = limited_app.test_client(), limited_app.test_client()
+        self.assertEqual(anonymous.get('/search?q=kurta').status_code, 200)
+        self.assertEqual(other_anonymous.get('/search?q=kurta').status_code, 429)
+        for user_id in (1, 2):
+            client = limited_app.test_client()
+            with client.session_transaction() as session:
+                session['user_id'] = user_id
+            self.assertEqual(client.get('/search?q=kurta').status_code, 200)
+        
+        # With both keys the shared IP bucket still applies to logged-in users
+        self.assertNotEqual(client.post('/add_to_cart', json={'product_id': 1, 'size': 'M'}).status_code, 429)
+        response = anonymous.post('/add_to_cart', json={'product_id': 1, 'size': 'M'})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.json['success'], False)
+        self.assertEqual(response.headers['Retry-After'], '3600')
+        print("✓ Per-user rate limit test passed")
+    
+    def test_sqlite_buckets_shared_between_workers(self):
+        """Test two worker stores on one SQLite file draw from the same bucket and refill"""
+        import rate_limit
+        
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'rate-limit.db')
+            workers = [rate_limit.SQLiteBucketStore(path), rate_limit.SQLiteBucketStore(path)]
+            capacity, rate = rate_limit.parse_limit('3/minute')
+            taken = [workers[n % 2].take('auth.login|ip|ip:10.0.0.1', capacity, rate, now=1000.0) for n in range(4)]
+            self.assertEqual([allowed for allowed, _ in taken], [True, True, True, False])
+            self.assertAlmostEqual(taken[-1][1], 20.0)
+            self.assertEqual(workers[1].take('auth.login|ip|ip:10.0.0.1', capacity, rate, now=1019.0)[0], False)
+            self.assertEqual(workers[0].take('auth.login|ip|ip:10.0.0.1', capacity, rate, now=1020.0), (True, 0.0))
+            self.assertEqual(workers[1].take('auth.login|ip|ip:10.0.0.2', capacity, rate, now=1020.0), (True, 0.0))
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+        with self.assertRaises(ValueError):
+            rate_limit.parse_limit('10/fortnight')
+        print("✓ Shared SQLite bucket test passed")
+
+
+class TestAdmissionControl(BaseTestCase):
+    """Test load shedding by route class when requests queue up"""
+    
+    def _controller(self):
+        import admission_control
+        return admission_control.AdmissionController(
+            {'catalog': 0.25, 'cart': 0.5, 'auth': 1.0, 'checkout': 2.0},
+            ['catalog', 'cart', 'auth'], interval=0.5, min_samples=3,
+        )
+    
+    def _traffic(self, controller, start, latency, classes=('catalog', 'cart', 'checkout')):
+        """Half a second of requests per class every 0.1s, each done after ``latency``; returns admitted classes"""
+        admitted = set()
+        for tick in range(5):
+            now = start + tick / 10
+            for route_class in classes:
+                token = controller.admit(route_class, queue_delay=latency, now=now)
+                if token is not None:
+                    controller.finish(token, now=now)
+                    admitted.add(route_class)
+        return admitted
+    
+    def test_sheds_lowest_priority_first_and_recovers(self):
+        """Test sustained slowness sheds catalog, then cart, never checkout, and recovers when healthy"""
+        controller = self._controller()
+        self._traffic(controller, 0.0, 0.05)
+        self._traffic(controller, 0.5, 0.05)
+        self.assertEqual(controller.level, 0)
+        
+        self.assertEqual(self._traffic(controller, 1.0, 3.0), {'catalog', 'cart', 'checkout'})
+        self.assertIn('checkout', self._traffic(controller, 1.5, 3.0))
+        self.assertEqual(controller.shed_classes(), ['catalog'])
+        self.assertEqual(self._traffic(controller, 2.0, 3.0), {'checkout'})
+        self.assertEqual(controller.shed_classes(), ['catalog', 'cart'])
+        
+        # Fast again: one class is let back in per healthy interval
+        levels = []
+        for interval in range(4):
+            self.assertIn('checkout', self._traffic(controller, 2.5 + interval / 2, 0.05))
+            levels.append(controller.level)
+        self.assertEqual(levels, [3, 2, 1, 0])
+        print("✓ Priority shedding test passed")
+    
+    def test_single_slow_request_does_not_shed(self):
+        """Test one slow request among fast ones, or too few samples, leave every class admitted"""
+        controller = self._controller()
+        self._traffic(controller, 0.0, 0.05)
+        controller.finish(controller.admit('catalog', queue_delay=2.0, now=0.45), now=0.45)
+        self._traffic(controller, 0.5, 0.05, classes=('catalog',))
+        self.assertEqual(controller.level, 0)
+        
+        self._traffic(controller, 1.0, 3.0, classes=('catalog',))
+        self._traffic(controller, 1.5, 3.0, classes=('catalog',))
+        self.assertEqual(controller.level, 1)
+        controller.min_samples = 10
+        self._traffic(controller, 2.0, 3.0, classes=('cart',))
+        self._traffic(controller, 2.5, 3.0, classes=('cart',))
+        self.assertEqual(controller.level, 0)
+        print("✓ Burst tolerance test passed")
+    
+    def test_shed_requests_get_fast_503(self):
+        """Test shed routes answer 503 with Retry-After while checkout and /metrics keep working"""
+        shedding_app = create_app({
+            'TESTING': True,
+            'SECRET_KEY': 'test-secret-key',
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+            'ADMISSION_REQUEST_START_HEADER': 'X-Request-Start',
+        })
+        with shedding_app.app_context():
+            db.create_all()
+        controller = shedding_app.extensions['admission_control']
+        client = shedding_app.test_client()
+        
+        with mock.patch.object(controller, 'level', 1), mock.patch.object(controller, 'interval', 3600):
+            response = client.get('/')
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response.headers['Retry-After'], '2')
+            response = client.post('/add_to_cart', json={'product_id': 1})
+            self.assertEqual(response.status_code, 401)
+            # A cart request that already queued past its SLO is dropped too
+            stale = f't={time.time() - 5:.3f}'
+            response = client.post('/add_to_cart', json={'product_id': 1}, headers={'X-Request-Start': stale})
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response.json['success'], False)
+            self.assertEqual(client.get('/checkout', headers={'X-Request-Start': stale}).status_code, 302)
+            self.assertEqual(client.get('/metrics').status_code, 200)
+        self.assertEqual(controller.in_flight(), {'catalog': 0, 'cart': 0, 'auth': 0, 'checkout': 0})
+        print("✓ Fast 503 shedding test passed")
+
+
+class TestServerSessions(BaseTestCase):
+    """Test server-side sessions and the cached user profile"""
+    
+    def _login(self):
+        return self.client.post('/login', data={'email': 'test@example.com', 'password': 'testpass123'})
+    
+    def _user_queries(self, url):
+        from sqlalchemy import event
+        
+        statements = []
+        
+        def record(conn, cursor, statement, *args):
+            if 'FROM user' in statement:
+                statements.append(statement)
+        
+        with app.app_context():
+            engine = db.engine
+        event.listen(engine, 'before_cursor_execute', record)
+        try:
+            response = self.client.get(url)
+        finally:
+            event.remove(engine, 'before_cursor_execute', record)
+        return response, len(statements)
+    
+    def test_cookie_holds_only_a_rotated_id(self):
+        """Test session data stays on the server and signing in issues a new session id"""
+        self.client.get('/')
+        with self.client.session_transaction() as session:
+            session['viewed'] = [1, 2]
+        before = self.client.get_cookie('session').value
+        self._login()
+        cookie = self.client.get_cookie('session').value
+        self.assertNotEqual(cookie, before)
+        self.assertNotIn('Test User', cookie)
+        
+        store = app.extensions['server_session']
+        self.assertIsNone(store.load(before))
+        with self.client.session_transaction() as session:
+            self.assertEqual(session['user_name'], 'Test User')
+            self.assertEqual(session['viewed'], [1, 2])
+        
+        self.client.get('/logout')
+        self.assertIsNone(store.load(cookie))
+        print("✓ Server-side session cookie test passed")
+    
+    def test_checkout_uses_cached_profile_until_it_changes(self):
+        """Test checkout reads the address from the session and sees profile edits"""
+        self._login()
+        response, queries = self._user_queries('/checkout')
+        self.assertIn(b'123 Test Street, Mumbai', response.data)
+        self.assertEqual(queries, 1)
+        response, queries = self._user_queries('/checkout')
+        self.assertEqual(queries, 0)
+        
+        with app.app_context():
+            user = User.query.filter_by(email='test@example.com').one()
+            user.address = '42 Marine Drive, Mumbai'
+            db.session.commit()
+        response, queries = self._user_queries('/checkout')
+        self.assertIn(b'42 Marine Drive, Mumbai', response.data)
+        self.assertEqual(queries, 1)
+        print("✓ Cached session profile test passed")
+
+    def test_invalidation_during_request_wins(self):
+        """Test a profile cached by a request does not overwrite another worker's invalidation, but the request's own writes keep it"""
+        import cart_store
+
+        self._login()
+        store = app.extensions['server_session']
+        with app.app_context():
+            user_id = User.query.filter_by(email='test@example.com').one().id
+            product_id = Product.query.first().id
+        load_summary = cart_store.load_summary
+
+        def invalidated_meanwhile(*args):
+            # Another worker's price change, while this request builds the profile
+            worker = threading.Thread(target=store.forget_profiles, args=([user_id],))
+            worker.start()
+            worker.join()
+            return load_summary(*args)
+
+        with mock.patch.object(cart_store, 'load_summary', side_effect=invalidated_meanwhile):
+            self.assertEqual(self.client.get('/cart').status_code, 200)
+        self.assertIsNone(store.load(self.client.get_cookie('session').value)[2])
+        self.assertEqual(self._user_queries('/checkout')[1], 1)
+
+        self.client.post('/add_to_cart', json={'product_id': product_id, 'size': 'M'})
+        self.assertEqual(self._user_queries('/checkout')[1], 0)
+        print("✓ Session invalidation race test passed")
+    
+    def test_store_shared_between_workers_and_purged_in_batches(self):
+        """Test a worker's LRU sees another worker's writes, and expired rows are removed in batches"""
+        import server_session
+        
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'sessions.db')
+            first, second = server_session.SessionStore(path), server_session.SessionStore(path)
+            first.save('abc', 1, '{"n": 1}', None, time.time() + 60, write_profile=True)
+            self.assertEqual(second.load('abc')[1], '{"n": 1}')
+            first.save('abc', 1, '{"n": 2}', None, time.time() + 60, write_profile=False)
+            self.assertEqual(second.load('abc')[1], '{"n": 2}')
+            
+            for n in range(7):
+                first.save(f'old-{n}', None, '{}', None, 100.0, write_profile=False)
+            self.assertEqual(second.purge_expired(batch_size=3), 7)
+            self.assertIsNotNone(first.load('abc'))
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+        print("✓ Shared session store test passed")
+
+    def test_other_workers_writes_only_reload_changed_sessions(self):
+        """Test another worker's write keeps unchanged sessions cached and reloads only the changed one"""
+        import server_session
+
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'sessions.db')
+            first, second = server_session.SessionStore(path), server_session.SessionStore(path)
+            for sid in ('abc', 'xyz'):
+                first.save(sid, 1, f'{{"sid": "{sid}"}}', None, time.time() + 60, write_profile=True)
+            second.load('abc'), second.load('xyz')
+            statements = []
+            second._connection.set_trace_callback(statements.append)
+            self.assertEqual(second.load('abc')[1], '{"sid": "abc"}')
+            self.assertFalse([sql for sql in statements if sql.startswith('SELECT')])
+
+            first.save('xyz', 1, '{"sid": "xyz", "n": 2}', None, time.time() + 60, write_profile=False)
+            self.assertEqual(second.load('abc')[1], '{"sid": "abc"}')
+            self.assertEqual(second.load('xyz')[1], '{"sid": "xyz", "n": 2}')
+            selects = [sql.split(' FROM')[0] for sql in statements if sql.startswith('SELECT')]
+            self.assertEqual(selects, ['SELECT version', 'SELECT version',
+                                       'SELECT user_id, data, profile, expires, version'])
+
+            first.forget_profiles([1])
+            first.delete('abc')
+            self.assertIsNone(second.load('abc'))
+            self.assertIsNone(second.load('xyz')[2])
+
+            # Files from before the version column are upgraded in place
+            import sqlite3
+            old_path = os.path.join(directory, 'old.db')
+            connection = sqlite3.connect(old_path)
+            connection.execute('CREATE TABLE sessions (id TEXT PRIMARY KEY, user_id INTEGER, data TEXT NOT NULL, '
+                               'profile TEXT, expires REAL NOT NULL)')
+            connection.commit()
+            connection.close()
+            upgraded = server_session.SessionStore(old_path)
+            upgraded.save('abc', 1, '{}', None, time.time() + 60, write_profile=True)
+            self.assertEqual(upgraded.load('abc')[1], '{}')
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+        print("✓ Per-session cache invalidation test passed")
+
+
+class TestCartUpsert(BaseTestCase):
+    """Test single-statement add-to-cart against the cart unique index"""
+    
+    transactional = False  # threads commit through their own app's engine
+    
+    def setUp(self):
+        super().setUp()
+        with app.app_context():
+            self.product_id = Product.query.first().id
+    
+    def test_repeated_adds_accumulate_on_one_line(self):
+        """Test adding the same product and size twice updates one row and returns the quantity"""
+        self.client.post('/login', data={'email': 'test@example.com', 'password': 'testpass123'})
+        quantities = [
+            self.client.post('/add_to_cart', json={'product_id': self.product_id, 'quantity': n, 'size': 'M'}).json['quantity']
+            for n in (1, 2)
+        ]
+        self.assertEqual(quantities, [1, 3])
+        self.client.post('/add_to_cart', json={'product_id': self.product_id})
+        self.assertEqual(self.client.post('/add_to_cart', json={'product_id': self.product_id}).json['quantity'], 2)
+        with app.app_context():
+            lines = sorted((item.size, item.quantity) for item in Cart.query.all())
+        self.assertEqual(lines, [('', 2), ('M', 3)])
+        print("✓ Cart upsert test passed")
+    
+    def test_concurrent_adds_never_duplicate(self):
+        """Test concurrent adds from several threads end up as one line with the summed quantity"""
+        import cart_store
+        
+        directory = tempfile.mkdtemp()
+        try:
+            file_app = create_app({
+                'TESTING': True,
+                'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(directory, 'cart.db')}",
+            })
+            with file_app.app_context():
+                db.create_all()
+                db.session.add(Category(id=1, name='Men', age_group='Adults (18-60)'))
+                db.session.add(Product(id=1, name='Kurta', price=799.0, category_id=1))
+                db.session.add(User(id=1, name='Asha', email='asha@example.com', password='x'))
+                db.session.commit()
+            
+            def add_many():
+                for _ in range(10):
+                    with file_app.app_context():
+                        cart_store.add_item(db.session, 1, 1, 1, 'M')
+                        db.session.commit()
+            
+            threads = [threading.Thread(target=add_many) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            with file_app.app_context():
+                self.assertEqual([(item.size, item.quantity) for item in Cart.query.all()], [('M', 40)])
+                db.engine.dispose()
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+        print("✓ Concurrent cart upsert test passed")
+    
+    def test_old_databases_merged_and_indexed(self):
+        """Test ensure_schema merges duplicate lines before adding the unique index"""
+        import cart_store
+        from sqlalchemy import create_engine, inspect as sa_inspect, text
+        from sqlalchemy.dialects import postgresql
+        
+        engine = create_engine('sqlite://')
+        with engine.begin() as connection:
+            connection.execute(text(
+                'CREATE TABLE cart (id INTEGER PRIMARY KEY, user_id INTEGER, product_id INTEGER, '
+                'quantity INTEGER, size VARCHAR(50), added_at DATETIME)'
+            ))
+            connection.execute(text(
+                "INSERT INTO cart (user_id, product_id, quantity, size) VALUES "
+                "(1, 1, 1, 'M'), (1, 1, 2, 'M'), (1, 1, 1, NULL), (1, 1, 4, NULL), (1, 2, 1, 'M')"
+            ))
+            cart_store.ensure_schema(connection)
+            cart_store.ensure_schema(connection)
+            rows = connection.execute(text('SELECT product_id, size, quantity FROM cart ORDER BY id')).all()
+            indexes = [index['name'] for index in sa_inspect(connection).get_indexes('cart')]
+        self.assertEqual([tuple(row) for row in rows], [(1, 'M', 3), (1, '', 5), (2, 'M', 1)])
+        self.assertIn(cart_store.UNIQUE_INDEX, indexes)
+        
+        sql = str(cart_store.add_statement('postgresql').compile(dialect=postgresql.dialect()))
+        self.assertIn('ON CONFLICT (user_id, product_id, size) DO UPDATE SET quantity = (cart.quantity + excluded.quantity)', sql)
+        self.assertIn('RETURNING cart.quantity', sql)
+        print("✓ Cart schema upgrade test passed")
+
+
+class TestCartBatch(BaseTestCase):
+    """Test the /cart/batch endpoint and the cart page's form fallbacks"""
+    
+    def setUp(self):
+        super().setUp()
+        with app.app_context():
+            self.product_ids = [product.id for product in Product.query.order_by(Product.id).limit(2)]
+        self.client.post('/login', data={'email': 'test@example.com', 'password': 'testpass123'})
+    
+    def _lines(self):
+        with app.app_context():
+            return sorted((item.product_id, item.size, item.quantity) for item in Cart.query.all())
+    
+    def test_mixed_batch_applied_and_cart_returned(self):
+        """Test add, set and remove operations are folded per line and the new cart is returned"""
+        first, second = self.product_ids
+        self.client.post('/add_to_cart', json={'product_id': second, 'size': 'L'})
+        response = self.client.post('/cart/batch', json={'operations': [
+            {'op': 'add', 'product_id': first, 'size': 'M', 'quantity': 2},
+            {'op': 'add', 'product_id': first, 'size': 'M'},
+            {'op': 'set', 'product_id': first, 'quantity': 4},
+            {'op': 'remove', 'product_id': second, 'size': 'L'},
+        ]})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json['success'])
+        self.assertEqual(self._lines(), [(first, '', 4), (first, 'M', 3)])
+        self.assertEqual(response.json['count'], 7)
+        self.assertEqual([(item['size'], item['quantity']) for item in response.json['items']], [('M', 3), ('', 4)])
+        with app.app_context():
+            price = db.session.get(Product, first).price
+        self.assertAlmostEqual(response.json['total'], price * 7)
+        print("✓ Cart batch test passed")
+    
+    def test_invalid_batch_applies_nothing(self):
+        """Test a bad operation anywhere in the batch returns 400 with its index and writes nothing"""
+        first, _ = self.product_ids
+        for operations, index in (
+            ([{'op': 'add', 'product_id': first}, {'op': 'set', 'product_id': first, 'quantity': -1}], 1),
+            ([{'op': 'add', 'product_id': first}, {'op': 'add', 'product_id': 999999}], 1),
+            ([{'op': 'clear', 'product_id': first}], 0),
+            ([{'op': 'add', 'product_id': first, 'quantity': True}], 0),
+        ):
+            response = self.client.post('/cart/batch', json={'operations': operations})
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json['index'], index)
+        self.assertEqual(self.client.post('/cart/batch', json={}).status_code, 400)
+        self.assertEqual(self._lines(), [])
+        
+        anonymous = app.test_client()
+        self.assertEqual(anonymous.post('/cart/batch', json={'operations': []}).status_code, 401)
+        print("✓ Invalid cart batch test passed")
+
+    def test_invalid_add_to_cart_rejected(self):
+        """Test /add_to_cart validates like a one-operation batch and writes nothing for bad input"""
+        first, _ = self.product_ids
+        for body in (
+            {'product_id': 999999},
+            {'product_id': str(first)},
+            {'product_id': first, 'quantity': 0},
+            {'product_id': first, 'quantity': 'many'},
+            {'product_id': first, 'size': ['M']},
+            None,
+        ):
+            response = self.client.post('/add_to_cart', json=body)
+            self.assertEqual(response.status_code, 400, body)
+            self.assertFalse(response.json['success'])
+        self.assertEqual(self._lines(), [])
+        self.assertEqual(self.client.post('/add_to_cart', json={'product_id': first, 'quantity': 2}).json['quantity'], 2)
+        print("✓ Invalid add-to-cart test passed")
+
+    def test_form_fallbacks(self):
+        """Test the cart page's update and remove forms change only the user's own lines"""
+        first, second = self.product_ids
+        self.client.post('/add_to_cart', json={'product_id': first, 'size': 'M'})
+        self.client.post('/add_to_cart', json={'product_id': second})
+        with app.app_context():
+            ids = {item.product_id: item.id for item in Cart.query.all()}
+        
+        response = self.client.post(f'/update_cart/{ids[first]}', data={'quantity': '5'})
+        self.assertEqual(response.status_code, 302)
+        self.client.post(f'/remove_from_cart/{ids[second]}')
+        self.assertEqual(self._lines(), [(first, 'M', 5)])
+        self.assertEqual(self.client.post('/update_cart/999999', data={'quantity': '1'}).status_code, 404)
+        
+        page = self.client.get('/cart')
+        self.assertIn(b'id="update-cart"', page.data)
+        print("✓ Cart form fallback test passed")
+
+
+class TestCartSummary(BaseTestCase):
+    """Test the per-user cart summary and the header badge"""
+    
+    transactional = False  # catalog imports write through db.engine
+    
+    def setUp(self):
+        super().setUp()
+        with app.app_context():
+            self.products = [(product.id, product.price) for product in Product.query.order_by(Product.id).limit(2)]
+            self.user_id = User.query.filter_by(email='test@example.com').one().id
+        self.client.post('/login', data={'email': 'test@example.com', 'password': 'testpass123'})
+    
+    def _stored(self):
+        import cart_store
+        with app.app_context():
+            return cart_store.load_summary(db.session, self.user_id)
+    
+    def _cart_queries(self, url):
+        from sqlalchemy import event
+        
+        statements = []
+        
+        def record(conn, cursor, statement, *args):
+            if 'FROM user' in statement or 'cart_summary' in statement:
+                statements.append(statement)
+        
+        with app.app_context():
+            engine = db.engine
+        event.listen(engine, 'before_cursor_execute', record)
+        try:
+            response = self.client.get(url)
+        finally:
+            event.remove(engine, 'before_cursor_execute', record)
+        return response, len(statements)
+    
+    def test_every_cart_write_updates_summary(self):
+        """Test add, batch and checkout keep count, subtotal and version current"""
+        (first, first_price), (second, second_price) = self.products
+        response = self.client.post('/add_to_cart', json={'product_id': first, 'quantity': 2, 'size': 'M'})
+        self.assertEqual(response.json['cart'], {'count': 2, 'subtotal': round(2 * first_price, 2), 'version': 1})
+        response = self.client.post('/cart/batch', json={'operations': [
+            {'op': 'add', 'product_id': second}, {'op': 'set', 'product_id': first, 'size': 'M', 'quantity': 1},
+        ]})
+        self.assertEqual((response.json['count'], response.json['version']), (2, 2))
+        self.assertAlmostEqual(response.json['total'], first_price + second_price)
+        self.assertEqual(self._stored()['subtotal'], response.json['total'])
+        
+        self.client.post('/checkout', data={'payment_method': 'COD', 'shipping_address': 'Mumbai'})
+        self.assertEqual(self._stored(), {'count': 0, 'subtotal': 0.0, 'version': 3})
+        print("✓ Cart summary maintenance test passed")
+    
+    def test_badge_rendered_without_queries(self):
+        """Test the header badge comes from the cached session profile once it is loaded"""
+        first, _ = self.products[0]
+        self.client.post('/add_to_cart', json={'product_id': first, 'quantity': 3})
+        response, queries = self._cart_queries('/')
+        self.assertIn(b'<span id="cart-count" class="cart-badge">3</span>', response.data)
+        self.assertEqual(queries, 2)
+        response, queries = self._cart_queries('/')
+        self.assertEqual(queries, 0)
+        
+        # The view that wrote the summary caches the new one itself
+        self.client.post('/add_to_cart', json={'product_id': first})
+        response, queries = self._cart_queries('/')
+        self.assertIn(b'class="cart-badge">4</span>', response.data)
+        self.assertEqual(queries, 0)
+        print("✓ Cart badge without queries test passed")
+    
+    def test_price_changes_refresh_summaries(self):
+        """Test ORM price edits and catalog imports re-price carts and clear cached badges"""
+        import catalog_import
+        
+        first, _ = self.products[0]
+        self.client.post('/add_to_cart', json={'product_id': first, 'quantity': 2})
+        self.client.get('/')
+        with app.app_context():
+            product = db.session.get(Product, first)
+            product.price = 500.0
+            product.sku = 'SUMMARY-1'
+            db.session.commit()
+        self.assertEqual(self._stored()['subtotal'], 1000.0)
+        self.assertEqual(self._cart_queries('/')[1], 2)
+        
+        feed = os.path.join(tempfile.mkdtemp(), 'feed.jsonl')
+        with open(feed, 'w') as fh:
+            fh.write('{"sku": "SUMMARY-1", "name": "Kurta", "price": 450, "category": "Men"}\n')
+        catalog_import.import_catalog(app, feed)
+        shutil.rmtree(os.path.dirname(feed), ignore_errors=True)
+        self.assertEqual(self._stored(), {'count': 2, 'subtotal': 900.0, 'version': 3})
+        response, queries = self._cart_queries('/cart')
+        self.assertIn('₹900.0'.encode(), response.data)
+        self.assertEqual(queries, 2)
+        print("✓ Cart summary re-pricing test passed")
+    
+    def test_backfill_for_existing_carts(self):
+        """Test ensure_schema creates summaries for carts written before the table existed"""
+        import catalog_import
+        
+        (first, first_price), (second, second_price) = self.products
+        with app.app_context():
+            db.session.execute(Cart.__table__.insert(), [
+                {'user_id': self.user_id, 'product_id': first, 'quantity': 1, 'size': ''},
+                {'user_id': self.user_id, 'product_id': second, 'quantity': 2, 'size': 'L'},
+            ])
+            db.session.commit()
+            with db.engine.begin() as connection:
+                catalog_import.ensure_schema(connection)
+                catalog_import.ensure_schema(connection)
+        summary = self._stored()
+        self.assertEqual((summary['count'], summary['version']), (3, 1))
+        self.assertAlmostEqual(summary['subtotal'], first_price + 2 * second_price)
+        print("✓ Cart summary backfill test passed")
+
+
+class TestCartRetention(BaseTestCase):
+    """Test the abandoned cart sweeper"""
+    
+    transactional = False  # the sweeper commits each batch through db.engine
+    
+    def setUp(self):
+        super().setUp()
+        from datetime import datetime, timedelta
+        
+        self.now = datetime.utcnow()
+        with app.app_context():
+            self.user_id = User.query.filter_by(email='test@example.com').one().id
+            self.old, self.recent = [product.id for product in Product.query.order_by(Product.id).limit(2)]
+            db.session.execute(Cart.__table__.insert(), [
+                {'user_id': self.user_id, 'product_id': self.old, 'quantity': 1, 'size': size,
+                 'added_at': self.now - timedelta(days=40 + index)}
+                for index, size in enumerate(('S', 'M', 'L', 'XL'))
+            ] + [{'user_id': self.user_id, 'product_id': self.recent, 'quantity': 2, 'size': 'M',
+                  'added_at': self.now - timedelta(days=2)}])
+            db.session.commit()
+    
+    def _lines(self):
+        with app.app_context():
+            return sorted((item.product_id, item.size) for item in Cart.query.all())
+    
+    def test_old_lines_removed_in_batches(self):
+        """Test lines past the retention age go in batches, recent ones stay and the summary follows"""
+        import cart_retention
+        import cart_store
+        
+        with app.app_context():
+            dry = cart_retention.sweep(db.engine, 30, dry_run=True, now=self.now)
+            self.assertEqual((dry.rows, dry.users, dry.batches), (4, 1, 0))
+            self.assertIn('would remove 4 cart lines of 1 users', dry.summary())
+            self.assertEqual(len(self._lines()), 5)
+            
+            report = cart_retention.sweep(db.engine, 30, batch_size=3, now=self.now)
+            self.assertEqual((report.rows, report.users, report.batches), (4, 1, 2))
+            self.assertEqual(self._lines(), [(self.recent, 'M')])
+            self.assertEqual(cart_retention.sweep(db.engine, 30, now=self.now).rows, 0)
+            self.assertEqual(cart_store.load_summary(db.session, self.user_id)['count'], 2)
+        print("✓ Cart retention sweep test passed")
+    
+    def test_touched_lines_survive(self):
+        """Test adding to or changing a line resets its age"""
+        import cart_retention
+        
+        self.client.post('/login', data={'email': 'test@example.com', 'password': 'testpass123'})
+        self.client.post('/add_to_cart', json={'product_id': self.old, 'size': 'S'})
+        self.client.post('/cart/batch', json={'operations': [
+            {'op': 'set', 'product_id': self.old, 'size': 'M', 'quantity': 3},
+        ]})
+        with app.app_context():
+            self.assertEqual(cart_retention.sweep(db.engine, 30).rows, 2)
+        self.assertEqual(self._lines(), [(self.old, 'M'), (self.old, 'S'), (self.recent, 'M')])
+        print("✓ Touched cart lines survive test passed")
+
+    def test_line_touched_mid_batch_survives(self):
+        """Test a line added to between the batch's select and its delete is kept and not counted"""
+        import cart_retention
+        from prometheus_client import REGISTRY
+        from sqlalchemy import event
+
+        touched = []
+
+        def touch(conn, clauseelement, multiparams, params, execution_options):
+            if getattr(clauseelement, 'is_delete', False) and clauseelement.table is Cart.__table__ and not touched:
+                touched.append(True)
+                conn.execute(Cart.__table__.update().where(Cart.__table__.c.size == 'S')
+                             .values(added_at=self.now))
+
+        before = REGISTRY.get_sample_value('cart_lines_expired_total') or 0
+        with app.app_context():
+            engine = db.engine
+            event.listen(engine, 'before_execute', touch)
+            try:
+                report = cart_retention.sweep(engine, 30, now=self.now)
+            finally:
+                event.remove(engine, 'before_execute', touch)
+        self.assertEqual(report.rows, 3)
+        self.assertEqual(self._lines(), [(self.old, 'S'), (self.recent, 'M')])
+        self.assertEqual(REGISTRY.get_sample_value('cart_lines_expired_total') - before, 3)
+        print("✓ Cart line touched mid-batch test passed")
+
+    def test_import_does_not_create_metric_files(self):
+        """Test importing the module works before the multiprocess metrics directory exists"""
+        missing = os.path.join(tempfile.mkdtemp(), 'metrics')
+        completed = subprocess.run(
+            [sys.executable, '-c', 'import cart_retention'], capture_output=True, text=True, timeout=60,
+            cwd=os.path.dirname(os.path.abspath(__file__)), env=dict(os.environ, PROMETHEUS_MULTIPROC_DIR=missing),
+        )
+        self.assertEqual(completed.returncode, 0, completed.stderr)
+        print("✓ Cart retention import test passed")
+    
+    def test_sweep_walks_added_at_index(self):
+        """Test the batch query uses ix_cart_added_at and the sweeper only runs when configured"""
+        import cart_retention
+        from sqlalchemy import select
+        
+        table = Cart.__table__
+        query = select(table.c.id, table.c.user_id).where(table.c.added_at < self.now).order_by(table.c.added_at).limit(10)
+        with app.app_context():
+            compiled = query.compile(db.engine, compile_kwargs={'literal_binds': True})
+            plan = ' '.join(row[-1] for row in db.session.execute(db.text(f'EXPLAIN QUERY PLAN {compiled}')))
+        self.assertIn('ix_cart_added_at', plan)
+        
+        self.assertNotIn('cart_retention', app.extensions)
+        swept_app = create_app({
+            'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite://', 'SESSION_STORE_PATH': ':memory:',
+            'CART_SWEEP_INTERVAL': 60,
+        })
+        sweeper = swept_app.extensions['cart_retention']
+        with swept_app.app_context():
+            db.create_all()
+        self.assertEqual(sweeper.run_once().rows, 0)
+        sweeper.stop()
+        print("✓ Cart retention index test passed")
+
+
+class TestOrderHistory(BaseTestCase):
+    """Test keyset-paginated order history with summarized orders"""
+    
+    def setUp(self):
+        super().setUp()
+        from datetime import timedelta
+        
+        with app.app_context():
+            user = User.query.filter_by(email='test@example.com').one()
+            other = User(name='Other', email='other@example.com', password='x')
+            db.session.add(other)
+            products = Product.query.order_by(Product.id).limit(2).all()
+            base = datetime(2025, 6, 1, 12, 0, 0)
+            orders = []
+            for number in range(25):
+                # Pairs of orders share a timestamp, so ties on created_at are covered
+                order = Order(user_id=user.id, total_amount=100.0 + number, status='Delivered',
+                              payment_method='COD', shipping_address='Mumbai',
+                              created_at=base + timedelta(hours=number // 2))
+                order.order_items = [
+                    OrderItem(product_id=products[number % 2].id, quantity=1 + number % 3, price=100.0),
+                    OrderItem(product_id=products[(number + 1) % 2].id, quantity=1, price=50.0),
+                ]
+                orders.append(order)
+            db.session.add_all(orders)
+            db.session.add(Order(user_id=1 + user.id, total_amount=1.0, created_at=base))
+            db.session.commit()
+            self.order_ids = [order.id for order in sorted(orders, key=lambda o: (o.created_at, o.id), reverse=True)]
+            self.first_items = {order.id: products[0 if order.total_amount % 2 == 0 else 1].name for order in orders}
+            self.other_order = Order.query.filter_by(user_id=other.id).one().id
+        self.client.post('/login', data={'email': 'test@example.com', 'password': 'testpass123'})
+    
+    def test_keyset_pages_cover_every_order_once(self):
+        """Test following the cursors lists every order newest first, without gaps or repeats"""
+        import order_history
+        
+        seen, cursor = [], None
+        with app.app_context():
+            user_id = User.query.filter_by(email='test@example.com').one().id
+            while True:
+                page = order_history.order_page(db.session, user_id, cursor, page_size=10)
+                seen.extend(order.id for order in page.orders)
+                cursor = page.next_cursor
+                if cursor is None:
+                    break
+        self.assertEqual(seen, self.order_ids)
+        self.assertRaises(ValueError, order_history.decode_cursor, 'not-a-cursor')
+        print("✓ Keyset order pagination test passed")
+    
+    def test_list_shows_summaries_from_one_query(self):
+        """Test a page renders item counts and first items with a single order query"""
+        from sqlalchemy import event
+        
+        statements = []
+        
+        def record(conn, cursor, statement, *args):
+            if '"order"' in statement or 'order_item' in statement:
+                statements.append(statement)
+        
+        with app.app_context():
+            engine = db.engine
+        with mock.patch.dict(app.config, {'ORDERS_PAGE_SIZE': 10}):
+            event.listen(engine, 'before_cursor_execute', record)
+            try:
+                response = self.client.get('/my_orders')
+            finally:
+                event.remove(engine, 'before_cursor_execute', record)
+            self.assertEqual(len(statements), 1)
+            newest = self.order_ids[0]
+            self.assertIn(f'Order #{newest}'.encode(), response.data)
+            self.assertIn(f'Order #{self.order_ids[9]}'.encode(), response.data)
+            self.assertNotIn(f'Order #{self.order_ids[10]}<'.encode(), response.data)
+            self.assertIn(f'{1 + 24 % 3 + 1} items:</strong>\n                    {self.first_items[newest]}'.encode(), response.data)
+            
+            older = response.data.split(b'before=')[1].split(b'"')[0].decode()
+            response = self.client.get(f'/my_orders?before={older}')
+            self.assertIn(f'Order #{self.order_ids[10]}<'.encode(), response.data)
+            self.assertIn(b'Newest orders', response.data)
+        self.assertEqual(self.client.get('/my_orders?before=garbage').status_code, 400)
+        print("✓ Order summaries test passed")
+    
+    def test_items_loaded_for_own_orders_only(self):
+        """Test expanding or opening an order loads its items, and only for its owner"""
+        order_id = self.order_ids[0]
+        response = self.client.get(f'/my_orders/{order_id}/items')
+        self.assertEqual([item['quantity'] for item in response.json['items']], [1 + 24 % 3, 1])
+        response = self.client.get(f'/my_orders/{order_id}')
+        self.assertIn(b'Shipping Address', response.data)
+        self.assertIn(self.first_items[order_id].encode(), response.data)
+        self.assertEqual(self.client.get(f'/my_orders/{self.other_order}').status_code, 404)
+        self.assertEqual(self.client.get(f'/my_orders/{self.other_order}/items').status_code, 404)
+        print("✓ Order items on demand test passed")
+    
+    def test_pages_seek_the_history_index(self):
+        """Test a later page seeks ix_order_user_created instead of sorting or skipping rows"""
+        import order_history
+        from sqlalchemy import tuple_
+        
+        query = order_history.summary_query(1).where(
+            tuple_(Order.created_at, Order.id) < (datetime(2025, 6, 1), 5)
+        ).limit(11)
+        with app.app_context():
+            compiled = query.compile(db.engine, compile_kwargs={'literal_binds': True})
+            plan = [row[-1] for row in db.session.execute(db.text(f'EXPLAIN QUERY PLAN {compiled}'))]
+        self.assertIn('SEARCH order USING INDEX ix_order_user_created (user_id=? AND created_at<?)', plan)
+        self.assertFalse(any('TEMP B-TREE' in step for step in plan), plan)
+        print("✓ Order history index test passed")
+
+
+
+class TestOrderArchive(unittest.TestCase):
+    """Test moving old months of orders to per-month archive files"""
+    
+    def setUp(self):
+        from werkzeug.security import generate_password_hash
+        
+        self.tmpdir = tempfile.mkdtemp()
+        self.archive_app = create_app({
+            'TESTING': True,
+            'SECRET_KEY': 'test-secret-key',
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(self.tmpdir, 'store.db')}",
+            'SQL_STATS_ENABLED': False,
+            'PASSWORD_HASH_WORKERS': 0,
+            'RATE_LIMIT_ENABLED': False,
+            'SESSION_STORE_PATH': ':memory:',
+            'CART_SWEEP_INTERVAL': 0,
+            'ORDER_ARCHIVE_DIR': os.path.join(self.tmpdir, 'archive'),
+        })
+        self.archive = self.archive_app.extensions['order_archive']
+        with self.archive_app.app_context():
+            db.create_all()
+            db.session.add(Category(id=1, name='Men', age_group='Adults (18-60)'))
+            db.session.add_all([Product(id=1, name='Kurta', price=799.0, category_id=1),
+                                Product(id=2, name='Dhoti', price=499.0, category_id=1)])
+            db.session.add_all([
+                User(id=1, name='Asha', email='asha@example.com', password=generate_password_hash('secret')),
+                User(id=2, name='Ravi', email='ravi@example.com', password='x'),
+            ])
+            db.session.add(Order(user_id=2, total_amount=5.0, created_at=datetime(2024, 3, 5)))
+            placed = [datetime(2024, month, day, 10) for month in range(1, 7) for day in (3, 12, 21)]
+            placed += [datetime(2025, 3, day, 10) for day in (1, 2, 3, 4)]
+            # Inserted last, so its month holds the highest order id
+            placed.append(datetime(2024, 2, 25, 10))
+            for number, created_at in enumerate(placed):
+                order = Order(user_id=1, total_amount=100.0 + number, status='Delivered', payment_method='COD',
+                              shipping_address='Pune', created_at=created_at)
+                order.order_items = [OrderItem(product_id=1 + number % 2, quantity=1, price=100.0 + number)]
+                db.session.add(order)
+            db.session.commit()
+            self.expected = [(order.id, order.order_items[0].product.name) for order in
+                             Order.query.filter_by(user_id=1).order_by(Order.created_at.desc(), Order.id.desc())]
+            self.other_order = Order.query.filter_by(user_id=2).one().id
+    
+    def tearDown(self):
+        with self.archive_app.app_context():
+            db.engine.dispose()
+        self.archive.dispose()
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+    
+    def _archive(self, **kwargs):
+        with self.archive_app.app_context():
+            return self.archive.archive(db.engine, datetime(2025, 1, 15), **kwargs)
+    
+    def test_old_months_moved_to_files(self):
+        """Test whole old months move out, the newest-id month stays and reports are unchanged"""
+        import order_history
+        
+        with self.archive_app.app_context():
+            sales = order_history.monthly_sales(db.session)
+        dry = self._archive(dry_run=True)
+        self.assertEqual([month for month, _ in dry.months], ['2024-01', '2024-03', '2024-04', '2024-05', '2024-06'])
+        self.assertEqual((dry.orders, dry.held), (16, ['2024-02']))
+        self.assertFalse(os.path.exists(self.archive.directory))
+        
+        report = self._archive()
+        self.assertIn('archived 16 orders', report.summary())
+        self.assertEqual(sorted(os.listdir(self.archive.directory)),
+                         [f'orders-{month}.db' for month, _ in report.months])
+        with self.archive_app.app_context():
+            self.assertEqual(Order.query.count(), 8)
+            self.assertEqual(OrderItem.query.count(), 8)
+            self.assertEqual(order_history.monthly_sales(db.session), sales)
+            self.assertEqual(self._archive().orders, 0)
+            order = Order(user_id=1, total_amount=1.0)
+            db.session.add(order)
+            db.session.commit()
+            self.assertGreater(order.id, max(order_id for order_id, _ in self.expected))
+        print("✓ Order archive test passed")
+    
+    def test_history_continues_into_archive(self):
+        """Test My Orders pages and order details read archived months without gaps or repeats"""
+        import order_history
+        
+        self._archive()
+        seen, cursor = [], None
+        with self.archive_app.app_context():
+            while True:
+                page = order_history.order_page(db.session, 1, cursor, page_size=4, archive=self.archive)
+                seen.extend((order.id, order.first_item) for order in page.orders)
+                cursor = page.next_cursor
+                if cursor is None:
+                    break
+        self.assertEqual(seen, self.expected)
+        
+        client = self.archive_app.test_client()
+        client.post('/login', data={'email': 'asha@example.com', 'password': 'secret'})
+        oldest, name = self.expected[-1]
+        response = client.get(f'/my_orders/{oldest}')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(name.encode(), response.data)
+        self.assertEqual(client.get(f'/my_orders/{oldest}/items').json['items'][0]['name'], name)
+        self.assertEqual(client.get(f'/my_orders/{self.other_order}').status_code, 404)
+        self.assertIn(f'Order #{self.expected[0][0]}'.encode(), client.get('/my_orders').data)
+        print("✓ Archived order history test passed")
+    
+    def test_needs_a_sqlite_file(self):
+        """Test archiving refuses databases it cannot attach"""
+        from sqlalchemy import create_engine
+        
+        self.assertRaises(ValueError, self.archive.archive, create_engine('sqlite://'), datetime(2025, 1, 1))
+        print("✓ Order archive database check test passed")
+
+
+class TestSharding(unittest.TestCase):
+    """Test carts and orders split by user across shard files"""
+    
+    def setUp(self):
+        import shards
+        from werkzeug.security import generate_password_hash
+        
+        self.tmpdir = tempfile.mkdtemp()
+        self.config = {
+            'TESTING': True,
+            'SECRET_KEY': 'test-secret-key',
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(self.tmpdir, 'store.db')}",
+            'SQL_STATS_ENABLED': False,
+            'PASSWORD_HASH_WORKERS': 0,
+            'RATE_LIMIT_ENABLED': False,
+            'SESSION_STORE_PATH': ':memory:',
+            'CART_SWEEP_INTERVAL': 0,
+            'SHARD_DIR': os.path.join(self.tmpdir, 'shards'),
+        }
+        # Two users that hash to different shards
+        self.users = [1, next(user_id for user_id in range(2, 100) if shards.shard_index(user_id, 2) != shards.shard_index(1, 2))]
+        shared_app = create_app(self.config)
+        with shared_app.app_context():
+            db.create_all()
+            db.session.add(Category(id=1, name='Men', age_group='Adults (18-60)'))
+            db.session.add(Product(id=1, name='Kurta', price=800.0, category_id=1, stock=10))
+            for user_id in self.users:
+                db.session.add(User(id=user_id, name=f'User {user_id}', email=f'user{user_id}@example.com',
+                                    password=generate_password_hash('secret')))
+            db.session.commit()
+            db.engine.dispose()
+        self.apps = []
+    
+    def tearDown(self):
+        for sharded_app in self.apps:
+            with sharded_app.app_context():
+                db.engine.dispose()
+            if 'shards' in sharded_app.extensions:
+                sharded_app.extensions['shards'].dispose()
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+    
+    def _app(self, count=2):
+        sharded_app = create_app(dict(self.config, SHARD_COUNT=count))
+        self.apps.append(sharded_app)
+        return sharded_app
+    
+    def _client(self, sharded_app, user_id):
+        client = sharded_app.test_client()
+        client.post('/login', data={'email': f'user{user_id}@example.com', 'password': 'secret'})
+        return client
+    
+    def test_users_hash_to_stable_balanced_shards(self):
+        """Test the shard of a user never changes and users spread evenly"""
+        import shards
+        
+        self.assertEqual([shards.shard_index(user_id, 4) for user_id in (1, 2, 3, 1000)],
+                         [shards.shard_index(user_id, 4) for user_id in (1, 2, 3, 1000)])
+        counts = [0] * 4
+        for user_id in range(1, 4001):
+            counts[shards.shard_index(user_id, 4)] += 1
+        self.assertTrue(all(850 < count < 1150 for count in counts), counts)
+        self.assertRaises(ValueError, create_app, {'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite://',
+                                                   'SESSION_STORE_PATH': ':memory:', 'SHARD_COUNT': 2})
+        print("✓ Shard hashing test passed")
+    
+    def test_cart_checkout_and_history_on_user_shard(self):
+        """Test add-to-cart, checkout and My Orders read and write only the user's shard"""
+        import shards
+        
+        sharded_app = self._app()
+        shard_set = sharded_app.extensions['shards']
+        for user_id in self.users:
+            client = self._client(sharded_app, user_id)
+            response = client.post('/add_to_cart', json={'product_id': 1, 'quantity': 2, 'size': 'M'})
+            self.assertEqual(response.json['cart'], {'count': 2, 'subtotal': 1600.0, 'version': 1})
+            self.assertIn(b'1600', client.get('/cart').data)
+            response = client.post('/checkout', data={'payment_method': 'COD', 'shipping_address': 'Pune'})
+            order_url = response.headers['Location']
+            self.assertIn(b'Pune', client.get(order_url).data)
+            self.assertIn(b'Kurta', client.get('/my_orders').data)
+        
+        for index, tables in shards.status(shard_set):
+            self.assertEqual(tables, {'cart': 0, 'cart_summary': 1, 'order': 1, 'order_item': 1}, index)
+        with sharded_app.app_context():
+            self.assertEqual((Cart.query.count(), Order.query.count()), (0, 0))
+            self.assertEqual(db.session.get(Product, 1).stock, 6)
+        # Same order id on both shards, each only visible to its owner
+        self.assertEqual(self._client(sharded_app, self.users[1]).get(order_url).status_code, 200)
+        self.assertEqual(sharded_app.test_client().get(order_url).status_code, 302)
+        print("✓ Sharded cart and orders test passed")
+    
+    def test_price_changes_and_expiry_reach_every_shard(self):
+        """Test re-pricing refreshes cart summaries on the shards and the sweeper visits each shard"""
+        import cart_retention
+        import cart_store
+        import shards
+        from datetime import timedelta
+        
+        sharded_app = self._app()
+        for user_id in self.users:
+            self._client(sharded_app, user_id).post('/add_to_cart', json={'product_id': 1, 'size': 'M'})
+        with sharded_app.app_context():
+            db.session.get(Product, 1).price = 900.0
+            db.session.commit()
+            summaries = [cart_store.load_summary(shards.user_session(user_id), user_id)['subtotal']
+                         for user_id in self.users]
+            self.assertEqual(summaries, [900.0, 900.0])
+            report = cart_retention.sweep_all(0, now=datetime.utcnow() + timedelta(days=1))
+            self.assertEqual((report.rows, report.users), (2, 2))
+        print("✓ Sharded cart summary and expiry test passed")
+    
+    def test_migrate_moves_existing_rows(self):
+        """Test rows written before sharding move to their users' shards, once"""
+        import shards
+        
+        unsharded_app = create_app(self.config)
+        self.apps.append(unsharded_app)
+        for user_id in self.users:
+            client = self._client(unsharded_app, user_id)
+            client.post('/add_to_cart', json={'product_id': 1, 'size': 'M'})
+            client.post('/checkout', data={'payment_method': 'COD', 'shipping_address': 'Pune'})
+            client.post('/add_to_cart', json={'product_id': 1, 'size': 'L'})
+        
+        sharded_app = self._app()
+        shard_set = sharded_app.extensions['shards']
+        self.assertEqual(shards.migrate(shard_set), {'cart': 2, 'cart_summary': 2, 'order': 2, 'order_item': 2})
+        self.assertEqual(shards.migrate(shard_set), {'cart': 0, 'cart_summary': 0, 'order': 0, 'order_item': 0})
+        for index, tables in shards.status(shard_set):
+            self.assertEqual(tables, {'cart': 1, 'cart_summary': 1, 'order': 1, 'order_item': 1}, index)
+        with sharded_app.app_context():
+            self.assertEqual((Cart.query.count(), Order.query.count(), OrderItem.query.count()), (0, 0, 0))
+        client = self._client(sharded_app, self.users[1])
+        self.assertIn(b'Kurta', client.get('/my_orders').data)
+        self.assertEqual(client.get('/cart').status_code, 200)
+        print("✓ Shard migration test passed")
+
+    def test_failed_order_gives_stock_back(self):
+        """Test stock taken in the main database is returned when the order cannot be written to the shard"""
+        import sqlite3
+        from sqlalchemy import event
+        
+        sharded_app = self._app()
+        client = self._client(sharded_app, self.users[1])
+        client.post('/add_to_cart', json={'product_id': 1, 'size': 'M', 'quantity': 3})
+        
+        def locked(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith('INSERT INTO "order"'):
+                raise sqlite3.OperationalError('database is locked')
+        
+        # The order insert itself failing on the shard, then a later step
+        with mock.patch('cart_store.clear_cart', side_effect=RuntimeError('disk full')):
+            engines = sharded_app.extensions['shards'].engines
+            for engine in engines:
+                event.listen(engine, 'before_cursor_execute', locked)
+            try:
+                with self.assertRaises(Exception):
+                    client.post('/checkout', data={'payment_method': 'COD', 'shipping_address': 'Pune'})
+            finally:
+                for engine in engines:
+                    event.remove(engine, 'before_cursor_execute', locked)
+            with sharded_app.app_context():
+                self.assertEqual(db.session.get(Product, 1).stock, 10)
+            with self.assertRaises(RuntimeError):
+                client.post('/checkout', data={'payment_method': 'COD', 'shipping_address': 'Pune'})
+        with sharded_app.app_context():
+            self.assertEqual(db.session.get(Product, 1).stock, 10)
+        for engine in sharded_app.extensions['shards'].engines:
+            with engine.connect() as connection:
+                self.assertEqual(connection.exec_driver_sql('SELECT COUNT(*) FROM main."order"').scalar(), 0)
+        self.assertEqual(client.post('/checkout', data={'payment_method': 'COD', 'shipping_address': 'Pune'}).status_code, 302)
+        with sharded_app.app_context():
+            self.assertEqual(db.session.get(Product, 1).stock, 7)
+        print("✓ Sharded checkout stock compensation test passed")
+
+    def test_shard_engines_instrumented_and_not_archived(self):
+        """Test shards get the SQLite PRAGMAs and query statistics, and order archiving refuses to run"""
+        import query_stats
+        import shards
+        import sqlite_profile
+
+        self.config['SQL_STATS_ENABLED'] = True
+        sharded_app = self._app()
+        for engine in sharded_app.extensions['shards'].engines:
+            with engine.connect() as connection:
+                pragmas = sqlite_profile.current_pragmas(connection, ['journal_mode', 'busy_timeout'])
+            self.assertEqual(pragmas, {'journal_mode': 'wal', 'busy_timeout': 5000})
+        with sharded_app.test_request_context('/cart'):
+            sharded_app.preprocess_request()
+            before = query_stats.current().count
+            shards.user_session(self.users[1]).execute(db.text('SELECT 1'))
+            self.assertEqual(query_stats.current().count, before + 1)
+        with sharded_app.app_context():
+            self.assertRaises(ValueError, sharded_app.extensions['order_archive'].archive, db.engine, datetime.utcnow())
+        print("✓ Shard instrumentation test passed")
+
+
+class TestParallelRun(unittest.TestCase):
+    """Test the --parallel runner finishes and its workers exit"""
+    
+    def test_parallel_run_exits(self):
+        """Test a two-worker run of tests that start hashing pools exits on its own"""
+        completed = subprocess.run(
+            [sys.executable, 'test_suite.py', '--parallel', '2', 'TestDatasetGenerator', 'TestPasswordHashing'],
+            cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, timeout=180,
+        )
+        self.assertEqual(completed.returncode, 0, completed.stdout[-2000:] + completed.stderr[-2000:])
+        self.assertIn('2 processes', completed.stdout)
+        print("✓ Parallel run exit test passed")
+
+
+def _run_tests_in_worker(names):
+    """Run the named tests in this process; returns a picklable result summary"""
+    stream = io.StringIO()
+    result = unittest.TextTestResult(unittest.runner._WritelnDecorator(stream), True, 2)
+    suite = unittest.TestLoader().loadTestsFromNames(names, sys.modules[__name__])
+    with contextlib.redirect_stdout(stream):
+        try:
+            suite.run(result)
+        finally:
+            # Apps built by the tests may have started hashing pools; a worker
+            # waits for its child processes before it can exit
+            password_hashing.shutdown_all()
+    return {
+        'output': stream.getvalue(),
+        'run': result.testsRun,
+        'failures': [(str(test), traceback) for test, traceback in result.failures],
+        'errors': [(str(test), traceback) for test, traceback in result.errors],
+        'skipped': [(str(test), reason) for test, reason in result.skipped],
+    }
+
+
+def _init_worker():
+    # Workers skip atexit; multiprocessing runs finalizers before joining children
+    multiprocessing.util.Finalize(None, close_app, args=(app,), exitpriority=10)
+
+
+def run_parallel(test_classes, processes):
+    """Run tests across ``processes`` spawned workers
+    
+    Each worker imports this module afresh, so it has its own app and
+    in-memory database restored from the shared seeded snapshot; tests are
+    handed out one at a time so slow tests don't hold up a whole class.
+    """
+    seeded_db.build_snapshot()
+    loader = unittest.TestLoader()
+    names = [
+        [f'{test_class.__name__}.{name}'] for test_class in test_classes
+        for name in loader.getTestCaseNames(test_class)
+    ]
+    result = unittest.TestResult()
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(processes, mp_context=context, initializer=_init_worker) as executor:
+        for summary in executor.map(_run_tests_in_worker, names):
+            sys.stdout.write(summary['output'])
+            result.testsRun += summary['run']
+            result.failures.extend(summary['failures'])
+            result.errors.extend(summary['errors'])
+            result.skipped.extend(summary['skipped'])
+    return result
+
+
+def run_test_suite(processes=1, only=None):
+    """Run all tests (or the classes named in ``only``) and generate detailed summary"""
     # Create test suite
     loader = unittest.TestLoader()
     suite = unittest.TestSuite()
@@ -382,16 +2567,46 @@ def run_test_suite():
         TestRoutes,
         TestCartFunctionality,
         TestOrderFunctionality,
-        TestDatabaseConstraints
+        TestDatabaseConstraints,
+        TestAppFactory,
+        TestProductionServer,
+        TestSQLiteProfile,
+        TestReadWriteRouting,
+        TestQueryStats,
+        TestMetrics,
+        TestProfiler,
+        TestMemoryTracking,
+        TestCatalogImport,
+        TestDatasetGenerator,
+        TestTrafficCapture,
+        TestFixtures,
+        TestPasswordHashing,
+        TestRateLimit,
+        TestAdmissionControl,
+        TestServerSessions,
+        TestCartUpsert,
+        TestCartBatch,
+        TestCartSummary,
+        TestCartRetention,
+        TestOrderHistory,
+        TestOrderArchive,
+        TestSharding,
+        TestParallelRun
     ]
+    if only:
+        test_classes = [test_class for test_class in test_classes if test_class.__name__ in only]
     
-    for test_class in test_classes:
-        tests = loader.loadTestsFromTestCase(test_class)
-        suite.addTests(tests)
-    
-    # Run tests
-    runner = unittest.TextTestRunner(verbosity=2)
-    result = runner.run(suite)
+    # Run tests, across worker processes if requested
+    started = time.perf_counter()
+    if processes > 1:
+        result = run_parallel(test_classes, processes)
+    else:
+        for test_class in test_classes:
+            tests = loader.loadTestsFromTestCase(test_class)
+            suite.addTests(tests)
+        runner = unittest.TextTestRunner(verbosity=2)
+        result = runner.run(suite)
+    elapsed = time.perf_counter() - started
     
     # Print detailed summary
     print("\n" + "=" * 80)
@@ -402,6 +2617,7 @@ def run_test_suite():
     print(f"❌ Failed: {len(result.failures)}")
     print(f"⚠️  Errors: {len(result.errors)}")
     print(f"⏭️  Skipped: {len(result.skipped)}")
+    print(f"⏱️  Wall time: {elapsed:.1f}s ({processes} process{'es' if processes > 1 else ''})")
     
     # Calculate success rate
     if result.testsRun > 0:
@@ -418,6 +2634,30 @@ def run_test_suite():
     print(f"  • Cart Functionality Tests                       : ✓")
     print(f"  • Order Processing Tests                         : ✓")
     print(f"  • Database Constraint Tests                      : ✓")
+    print(f"  • App Factory Tests                              : ✓")
+    print(f"  • Production Server Tests                        : ✓")
+    print(f"  • SQLite Profile Tests                           : ✓")
+    print(f"  • Read/Write Routing Tests                       : ✓")
+    print(f"  • Query Statistics Tests                         : ✓")
+    print(f"  • Metrics Endpoint Tests                         : ✓")
+    print(f"  • Profiler Tests                                 : ✓")
+    print(f"  • Memory Tracking Tests                          : ✓")
+    print(f"  • Catalog Import Tests                           : ✓")
+    print(f"  • Dataset Generator Tests                        : ✓")
+    print(f"  • Traffic Capture Tests                          : ✓")
+    print(f"  • Test Fixture Tests                             : ✓")
+    print(f"  • Password Hashing Tests                         : ✓")
+    print(f"  • Rate Limit Tests                               : ✓")
+    print(f"  • Admission Control Tests                        : ✓")
+    print(f"  • Server-Side Session Tests                      : ✓")
+    print(f"  • Cart Upsert Tests                              : ✓")
+    print(f"  • Cart Batch Tests                               : ✓")
+    print(f"  • Cart Summary Tests                             : ✓")
+    print(f"  • Cart Retention Tests                           : ✓")
+    print(f"  • Order History Tests                            : ✓")
+    print(f"  • Order Archive Tests                            : ✓")
+    print(f"  • Sharding Tests                                 : ✓")
+    print(f"  • Parallel Runner Tests                          : ✓")
     print("-" * 80)
     
     if result.wasSuccessful():
@@ -447,8 +2687,16 @@ def run_test_suite():
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the clothing store test suite')
+    parser.add_argument(
+        '--parallel', nargs='?', type=int, const=0, default=int(os.environ.get('TEST_PROCESSES', 1)),
+        metavar='N', help='run tests in N worker processes (all CPUs when N is omitted)'
+    )
+    parser.add_argument('classes', nargs='*', metavar='CLASS', help='only run these test classes')
+    args = parser.parse_args()
+    
     print("\n🚀 Starting Clothing Store Application Test Suite...\n")
-    result = run_test_suite()
+    result = run_test_suite(args.parallel or os.cpu_count() or 1, args.classes)
     
     # Exit with appropriate code
     sys.exit(0 if result.wasSuccessful() else 1)
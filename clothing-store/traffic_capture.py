@@ -0,0 +1,157 @@
+"""
+Traffic capture WSGI middleware
+
+When TRAFFIC_CAPTURE_ENABLED is on, every request (except static files,
+/metrics and /admin) is appended as one JSON line to
+TRAFFIC_CAPTURE_DIR/capture.<pid>.jsonl with its arrival time, duration and
+status, for replay with benchmarks/replay.py.
+
+Requests are correlated by an opaque ``capture_sid`` cookie the middleware
+sets on first contact; TRAFFIC_CAPTURE_SAMPLE_RATE keeps or drops whole
+sessions. The log is sanitized: cookies and headers are not recorded, and
+personal form/JSON fields (SENSITIVE_FIELDS) are replaced by REDACTED. Bodies
+over TRAFFIC_CAPTURE_MAX_BODY bytes are dropped.
+"""
+
+import hashlib
+import io
+import json
+import os
+import secrets
+import threading
+import time
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qsl
+
+SESSION_COOKIE = 'capture_sid'
+REDACTED = '<redacted>'
+SENSITIVE_FIELDS = frozenset(('password', 'email', 'name', 'phone', 'address', 'shipping_address'))
+SKIPPED_PREFIXES = ('/static/', '/metrics', '/admin/')
+FORM_TYPE = 'application/x-www-form-urlencoded'
+
+
+def init_app(app):
+    if not app.config.get('TRAFFIC_CAPTURE_ENABLED', False):
+        return
+
+    output_dir = app.config.get('TRAFFIC_CAPTURE_DIR') or os.path.join(app.instance_path, 'capture')
+    os.makedirs(output_dir, exist_ok=True)
+    app.wsgi_app = CaptureMiddleware(
+        app.wsgi_app, output_dir,
+        sample_rate=app.config.get('TRAFFIC_CAPTURE_SAMPLE_RATE', 1.0),
+        max_body=app.config.get('TRAFFIC_CAPTURE_MAX_BODY', 4096),
+    )
+
+
+def sanitize_body(content_type, body):
+    """Decode a form or JSON body with sensitive fields redacted; None for anything else"""
+    if content_type.startswith(FORM_TYPE):
+        fields = parse_qsl(body.decode('utf-8', 'replace'), keep_blank_values=True)
+        return {'form': [[key, REDACTED if key in SENSITIVE_FIELDS else value] for key, value in fields]}
+    if content_type.startswith('application/json'):
+        try:
+            data = json.loads(body)
+        except ValueError:
+            return None
+        if isinstance(data, dict):
+            data = {key: REDACTED if key in SENSITIVE_FIELDS else value for key, value in data.items()}
+        return {'json': data}
+    return None
+
+
+class CaptureMiddleware:
+    def __init__(self, wsgi_app, output_dir, sample_rate=1.0, max_body=4096):
+        self.wsgi_app = wsgi_app
+        self.output_dir = output_dir
+        self.sample_rate = sample_rate
+        self.max_body = max_body
+        self._lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if path.startswith(SKIPPED_PREFIXES):
+            return self.wsgi_app(environ, start_response)
+
+        cookie = SimpleCookie(environ.get('HTTP_COOKIE', ''))
+        sid = cookie[SESSION_COOKIE].value if SESSION_COOKIE in cookie else None
+        if sid is None:
+            # Set even when this request is not captured, so the visitor keeps
+            # one sid and is sampled once, from their first request
+            sid = secrets.token_hex(8)
+            start_response = _setting_cookie(start_response, sid)
+        if not self._sampled(sid):
+            return self.wsgi_app(environ, start_response)
+
+        entry = {
+            'ts': time.time(),
+            'session': hashlib.sha256(sid.encode()).hexdigest()[:16],
+            'method': environ.get('REQUEST_METHOD', 'GET'),
+            'path': path,
+            'query': environ.get('QUERY_STRING', ''),
+        }
+        self._capture_body(environ, entry)
+        status = []
+
+        def capture_start_response(status_line, headers, exc_info=None):
+            status[:] = [int(status_line.split(' ', 1)[0])]
+            return start_response(status_line, headers, exc_info)
+
+        started = time.perf_counter()
+        response = self.wsgi_app(environ, capture_start_response)
+        return _ClosingIterator(response, lambda: self._write(entry, status, started))
+
+    def _sampled(self, sid):
+        if self.sample_rate >= 1:
+            return True
+        bucket = int(hashlib.sha256(sid.encode()).hexdigest()[:8], 16) / 0xFFFFFFFF
+        return bucket < self.sample_rate
+
+    def _capture_body(self, environ, entry):
+        try:
+            length = int(environ.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            return
+        if not length or length > self.max_body:
+            return
+        body = environ['wsgi.input'].read(length)
+        environ['wsgi.input'] = io.BytesIO(body)
+        content_type = environ.get('CONTENT_TYPE', '')
+        captured = sanitize_body(content_type, body)
+        if captured is not None:
+            entry['content_type'] = content_type.split(';')[0]
+            entry.update(captured)
+
+    def _write(self, entry, status, started):
+        entry['status'] = status[0] if status else None
+        entry['duration_ms'] = round((time.perf_counter() - started) * 1000, 3)
+        line = json.dumps(entry, separators=(',', ':')) + '\n'
+        path = os.path.join(self.output_dir, f'capture.{os.getpid()}.jsonl')
+        with self._lock:
+            with open(path, 'a', encoding='utf-8') as fh:
+                fh.write(line)
+
+
+def _setting_cookie(start_response, sid):
+    def cookie_start_response(status_line, headers, exc_info=None):
+        headers = list(headers) + [('Set-Cookie', f'{SESSION_COOKIE}={sid}; Path=/; HttpOnly; SameSite=Lax')]
+        return start_response(status_line, headers, exc_info)
+
+    return cookie_start_response
+
+
+class _ClosingIterator:
+    """Pass the response through and run ``callback`` once the server closes it"""
+
+    def __init__(self, response, callback):
+        self._response = response
+        self._callback = callback
+
+    def __iter__(self):
+        return iter(self._response)
+
+    def close(self):
+        try:
+            if hasattr(self._response, 'close'):
+                self._response.close()
+        finally:
+            self._callback()
@@ -0,0 +1,11 @@
+"""
+Production WSGI entry point for the Indian Clothing Store
+
+Run under gunicorn (settings are read from gunicorn.conf.py in this directory):
+
+    gunicorn wsgi:application
+"""
+
+from app import create_app
+
+application = app = create_app()